@@ -1,8 +1,11 @@
 import asyncio
+from bot_webhook import run_webhook
+from config import settings
 from create_bot import bot, dp
 from database.database_module import setup_db
 # from database.middleware import DBSessionMiddleware
 from db_handler.db_funk import get_all_users
+from database.engines import engines, init_pool, pool_stats
 from handlers.admin_panel import admin_router
 from handlers.create_user_router import create_user_router
 from handlers.user_router import user_router
@@ -21,6 +24,7 @@ async def set_commands():
 
 # Функция, которая выполнится когда бот запустится
 async def start_bot():
+    await init_pool()
     await set_commands()
     logger.success(f"Бот запущен")
     # count_users = await get_all_users(count=True)
@@ -33,6 +37,8 @@ async def start_bot():
 
 # Функция, которая выполнится когда бот завершит свою работу
 async def stop_bot():
+    logger.info(f"📊 Пул соединений при остановке: {pool_stats()}")
+    await engines.dispose()
     logger.success(f"Бот остановлен")
     # try:
     #     for admin_id in admins:
@@ -54,10 +60,14 @@ async def main():
     dp.shutdown.register(stop_bot)
 
 
-    # запуск бота в режиме long polling при запуске бот очищает все обновления, которые были за его моменты бездействия
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.bot_webhook.enabled:
+            # webhook: несколько реплик за балансировщиком ([bot_webhook] в config.ini)
+            await run_webhook(dp, bot)
+        else:
+            # запуск бота в режиме long polling при запуске бот очищает все обновления, которые были за его моменты бездействия
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         await bot.session.close()
 #тест
@@ -0,0 +1,75 @@
+"""Индексы и уникальные ограничения для горячих таблиц
+
+Revision ID: 0001_hot_table_indexes
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+visit, student_schedule, students_parents, medcertificat_received, payment и
+lesson_write_offs не имели вторичных индексов, хотя все частые запросы
+фильтруют именно по этим колонкам.
+
+Связующие таблицы сначала чистятся от дублей (то, что раньше делал
+kill_dublicates.py), затем на них вешаются уникальные ограничения. Обычные
+индексы создаются через CREATE INDEX CONCURRENTLY, чтобы не блокировать
+запись в рабочее время.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_hot_table_indexes"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "public"
+
+# (имя, таблица, колонки, условие частичного индекса)
+INDEXES = [
+    ("ix_visit_student_data", "visit", "student, data", None),
+    ("ix_visit_shedule_data", "visit", "shedule, data", None),
+    ("ix_student_schedule_schedule", "student_schedule", "schedule", None),
+    ("ix_students_parents_parents", "students_parents", "parents", None),
+    ("ix_medcertificat_received_student_date_end", "medcertificat_received", "student_id, date_end", None),
+    ("ix_medcertificat_received_active", "medcertificat_received", "student_id, cert_id, date_end", "active"),
+    ("ix_payment_student_date", "payment", "student_id, payment_date", None),
+    ("ix_lesson_write_offs_student_data", "lesson_write_offs", "student_id, data", None),
+]
+
+# (имя, таблица, колонки) - дубли удаляются перед созданием ограничения
+UNIQUE_CONSTRAINTS = [
+    ("uq_student_schedule_student_schedule", "student_schedule", ("student", "schedule")),
+    ("uq_students_parents_student_parents", "students_parents", ("student", "parents")),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in UNIQUE_CONSTRAINTS:
+        # Оставляем только первую запись для каждой пары
+        same_pair = " AND ".join(f"t.{c} = d.{c}" for c in columns)
+        op.execute(f"""
+            DELETE FROM {SCHEMA}.{table} t
+            USING {SCHEMA}.{table} d
+            WHERE t.id > d.id AND {same_pair}
+        """)
+        op.execute(f"ALTER TABLE {SCHEMA}.{table} ADD CONSTRAINT {name} UNIQUE ({', '.join(columns)})")
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {SCHEMA}.{table} ({columns})"
+                + (f" WHERE {where}" if where else "")
+            )
+        for _, table, _, _ in INDEXES:
+            op.execute(f"ANALYZE {SCHEMA}.{table}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _, _ in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{name}")
+
+    for name, table, _ in UNIQUE_CONSTRAINTS:
+        op.execute(f"ALTER TABLE {SCHEMA}.{table} DROP CONSTRAINT IF EXISTS {name}")
@@ -0,0 +1,36 @@
+"""Календарь праздников и закрытых дней
+
+Revision ID: 0002_closure_day
+Revises: 0001_hot_table_indexes
+Create Date: 2026-10-17 18:00:00
+
+В дни из closure_day тренировок нет: они не считаются пропущенными по справке
+и сдвигают расчетную дату оплаты.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_closure_day"
+down_revision: Union[str, Sequence[str], None] = "0001_hot_table_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "public"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "closure_day",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("description", sa.String()),
+        sa.UniqueConstraint("day", name="uq_closure_day_day"),
+        schema=SCHEMA,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("closure_day", schema=SCHEMA)
@@ -0,0 +1,41 @@
+"""Причина списания и защита от повторного списания
+
+Revision ID: 0003_write_off_reason
+Revises: 0002_closure_day
+Create Date: 2026-10-17 20:00:00
+
+lesson_write_offs получает колонку reason. Новые списания пишутся с датой
+на 00:00 и причиной, а уникальный индекс (student_id, data, reason) не дает
+повторному запуску cron за тот же день списать занятия второй раз.
+Старые записи остаются с reason = NULL и в индекс не попадают.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_write_off_reason"
+down_revision: Union[str, Sequence[str], None] = "0002_closure_day"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "public"
+
+
+def upgrade() -> None:
+    op.add_column("lesson_write_offs", sa.Column("reason", sa.String()), schema=SCHEMA)
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_lesson_write_offs_student_data_reason "
+            f"ON {SCHEMA}.lesson_write_offs (student_id, data, reason) WHERE reason IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.uq_lesson_write_offs_student_data_reason")
+
+    op.drop_column("lesson_write_offs", "reason", schema=SCHEMA)
@@ -0,0 +1,46 @@
+"""Одна отметка ученика на тренировке за день
+
+Revision ID: 0004_visit_unique_day
+Revises: 0003_write_off_reason
+Create Date: 2026-10-18 10:00:00
+
+Отметки посещений (бот, страницы /visits и /visits-today) пишутся одним
+INSERT ... ON CONFLICT DO NOTHING (db_handler/attendance_service.py) вместо
+проверки на дубль перед каждой вставкой. Для этого нужен уникальный индекс
+(student, shedule, data::date). Сначала удаляются уже накопившиеся дубли:
+остается самая ранняя отметка ученика на тренировке за день.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_visit_unique_day"
+down_revision: Union[str, Sequence[str], None] = "0003_write_off_reason"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "public"
+
+
+def upgrade() -> None:
+    op.execute(f"""
+        DELETE FROM {SCHEMA}.visit t
+        USING {SCHEMA}.visit d
+        WHERE t.id > d.id
+        AND t.student = d.student
+        AND t.shedule = d.shedule
+        AND t.data::date = d.data::date
+    """)
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_visit_student_shedule_day "
+            f"ON {SCHEMA}.visit (student, shedule, (data::date))"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.uq_visit_student_shedule_day")
@@ -0,0 +1,60 @@
+"""Очередь рассылок в Telegram и статус доставки по получателям
+
+Revision ID: 0005_broadcast
+Revises: 0004_visit_unique_day
+Create Date: 2026-10-17 23:00:00
+
+broadcast - одна рассылка (приглашение на соревнование, новости, оплата),
+broadcast_delivery - по строке на получателя со статусом, числом попыток и
+временем следующей попытки. Отправляет db_handler/broadcast_worker.py.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_broadcast"
+down_revision: Union[str, Sequence[str], None] = "0004_visit_unique_day"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "public"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "broadcast",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("ref_id", sa.Integer()),
+        sa.Column("text", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("now()")),
+        schema=SCHEMA,
+    )
+    op.create_table(
+        "broadcast_delivery",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("broadcast_id", sa.Integer(), nullable=False),
+        sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("student_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("status", sa.String(), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False, server_default=sa.text("now()")),
+        sa.Column("sent_at", sa.DateTime()),
+        sa.Column("last_error", sa.String()),
+        sa.ForeignKeyConstraint(["broadcast_id"], [f"{SCHEMA}.broadcast.id"], ondelete="CASCADE"),
+        sa.UniqueConstraint("broadcast_id", "telegram_id", "student_id", name="uq_broadcast_delivery_recipient"),
+        schema=SCHEMA,
+    )
+    # Очередь воркера: только ожидающие отправки
+    op.create_index(
+        "ix_broadcast_delivery_pending", "broadcast_delivery", ["next_attempt_at"],
+        schema=SCHEMA, postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_broadcast_delivery_pending", table_name="broadcast_delivery", schema=SCHEMA)
+    op.drop_table("broadcast_delivery", schema=SCHEMA)
+    op.drop_table("broadcast", schema=SCHEMA)
@@ -8,9 +8,16 @@ import bcrypt
 from database.auth import (
     authenticate_user,
     create_access_token,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    create_refresh_token,
+    decode_token,
+    refresh_access_token,
+    user_claims,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS
 )
 from database.models import get_db_async, Telegram_user
+from database.token_revocation import token_revocation
+from db_handler.principal_cache import principal_cache
 from config import templates
 import jwt
 from config import settings
@@ -19,6 +26,39 @@ router = APIRouter( tags=["auth"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
+def set_refresh_cookie(response, request: Request, refresh_token: str):
+    """Refresh-токен живет в httponly cookie, middleware обновляет по нему access-токен"""
+    response.set_cookie(
+        key="refresh_token",
+        value=refresh_token,
+        httponly=True,
+        secure=request.url.scheme == "https",
+        max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+        samesite="strict",
+        path="/"
+    )
+
+
+def set_access_cookie(response, request: Request, access_token: str):
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        secure=request.url.scheme == "https",
+        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        samesite="strict",
+        path="/"
+    )
+
+
+async def revoke_refresh_cookie(request: Request):
+    """Отозвать refresh-токен из cookie при выходе"""
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+        payload = decode_token(refresh_token, token_type="refresh")
+        if payload:
+            await token_revocation.deny(payload)
+
+
 @router.get("/login-page")
 async def login_page(request: Request):
     """Страница входа"""
@@ -45,26 +85,83 @@ async def login_for_access_token(
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        # Создаем токен
+        # Создаем токены: в access-токене все, что нужно middleware без БД
+        claims = await user_claims(user)
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
-            data={"sub": user.phone},
+            data=claims,
             expires_delta=access_token_expires
         )
+        refresh_token = create_refresh_token(claims)
 
         # Обновляем время последнего входа
         user.last_login = datetime.utcnow()
         await db.commit()
 
-        return {
+        response = JSONResponse(content={
             "access_token": access_token,
+            "refresh_token": refresh_token,
             "token_type": "bearer",
+            "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
             "user": {
                 "phone": user.phone,
                 "full_name": user.full_name,
                 "email": user.email
             }
-        }
+        })
+        set_refresh_cookie(response, request, refresh_token)
+        return response
+
+
+@router.post("/refresh")
+async def refresh_token(request: Request):
+    """Новый access-токен по refresh-токену (из cookie или тела запроса)"""
+    token = request.cookies.get("refresh_token")
+    if not token:
+        try:
+            body = await request.json()
+            token = body.get("refresh_token")
+        except Exception:
+            token = None
+
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh-токен не передан"
+        )
+
+    async with get_db_async() as db:
+        refreshed = await refresh_access_token(db, token)
+
+    if not refreshed:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный refresh-токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    access_token, _ = refreshed
+    response = JSONResponse(content={
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    })
+    set_access_cookie(response, request, access_token)
+    return response
+
+
+@router.post("/revoke/{telegram_id}")
+async def revoke_user_tokens(telegram_id: int, request: Request):
+    """Отозвать все access-токены пользователя (например, после смены прав)"""
+    user_info = getattr(request.state, 'user', None) or {}
+    if not user_info.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Требуются права администратора"
+        )
+
+    await token_revocation.revoke_user(telegram_id)
+    return {"success": True, "telegram_id": telegram_id}
 
 
 @router.post("/register")
@@ -108,6 +205,7 @@ async def register_user(
         db.add(new_user)
         await db.commit()
         await db.refresh(new_user)
+        await principal_cache.invalidate(new_user.telegram_id)
 
         return {
             "message": "Пользователь успешно зарегистрирован",
@@ -116,10 +214,13 @@ async def register_user(
 
 
 @router.get("/logout")
-async def logout_jwt():
+async def logout_jwt(request: Request):
     """Выход из системы для JWT авторизации"""
+    await revoke_refresh_cookie(request)
     response = JSONResponse(content={"message": "Вы успешно вышли из системы"})
-    # Для JWT достаточно удалить токен на клиенте
+    # Access-токен короткий и удаляется на клиенте, refresh-токен отозван
+    response.delete_cookie("access_token", path="/")
+    response.delete_cookie("refresh_token", path="/")
     return response
 
 
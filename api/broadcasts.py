@@ -0,0 +1,44 @@
+# api/broadcasts.py
+from fastapi import APIRouter, Form, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+
+from db_handler.broadcast_service import AUDIENCES, broadcast_status, enqueue_to_audience
+from logger_config import logger
+
+router = APIRouter()
+
+
+def _require_admin(request: Request):
+    user_info = getattr(request.state, 'user', None) or {}
+    if not user_info.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Требуются права администратора"
+        )
+
+
+@router.post("/broadcasts/send")
+async def send_broadcast(request: Request, audience: str = Form(...), text: str = Form(...)):
+    """Рассылка подписчикам бота уведомлений: audience - news или pays"""
+    _require_admin(request)
+    if audience not in AUDIENCES:
+        raise HTTPException(status_code=400, detail=f"Аудитория должна быть одной из: {', '.join(AUDIENCES)}")
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Пустой текст рассылки")
+
+    try:
+        result = await enqueue_to_audience(audience, text.strip())
+        return JSONResponse({"status": "success", **result})
+    except Exception as e:
+        logger.error(f"❌ Ошибка постановки рассылки: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка постановки рассылки: {str(e)}")
+
+
+@router.get("/broadcasts/{broadcast_id}")
+async def get_broadcast_status(broadcast_id: int, request: Request):
+    """Сколько получателей ждут отправки, получили, отказались (blocked) или с ошибкой"""
+    _require_admin(request)
+    result = await broadcast_status(broadcast_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Рассылка не найдена")
+    return JSONResponse({**result, "created_at": result["created_at"].isoformat()})
@@ -1,29 +1,31 @@
 # api/competitions.py
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime, timedelta
 from config import templates, settings
 
 
-from database.models import Сompetition, MedCertificat_type, Students, Trainers, \
-    Competition_student, Сompetition_trainer, Сompetition_MedCertificat, get_db, MedCertificat_received
+from database.models import Сompetition, Students, \
+    Competition_student, Сompetition_trainer, Сompetition_MedCertificat, get_async_db, MedCertificat_received
+from database.reference_cache import reference_cache
+from db_handler.broadcast_service import competition_invitation_text, enqueue_to_parents
 from config import templates
 from logger_config import logger
 
 router = APIRouter()
 
 @router.get("/competitions/", response_class=HTMLResponse)
-async def competitions_page(request: Request, db: Session = Depends(get_db)):
+async def competitions_page(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Главная страница календаря мероприятий"""
     return templates.TemplateResponse("competitions.html", {
         "request": request
     })
 
 @router.get("/competitions/get-events")
-async def get_events(year: int, month: int, db: Session = Depends(get_db)):
+async def get_events(year: int, month: int, db: AsyncSession = Depends(get_async_db)):
     """Получение мероприятий для конкретного месяца"""
     try:
         logger.debug(f"🔹 Получение мероприятий за {year}-{month}")
@@ -38,12 +40,14 @@ async def get_events(year: int, month: int, db: Session = Depends(get_db)):
         logger.debug(f"🔹 Поиск мероприятий с {start_date} по {end_date}")
 
         # Используем правильное название класса - Сompetition (с русской С)
-        competitions = db.query(Сompetition).filter(
-            and_(
-                Сompetition.date >= start_date,
-                Сompetition.date < end_date
+        competitions = (await db.execute(
+            select(Сompetition).where(
+                and_(
+                    Сompetition.date >= start_date,
+                    Сompetition.date < end_date
+                )
             )
-        ).all()
+        )).scalars().all()
 
         logger.debug(f"🔹 Найдено {len(competitions)} мероприятий")
 
@@ -65,22 +69,25 @@ async def get_events(year: int, month: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка получения мероприятий: {str(e)}")
 
 @router.get("/competitions/get-day-events")
-async def get_day_events(date: str, db: Session = Depends(get_db)):
+async def get_day_events(date: str, db: AsyncSession = Depends(get_async_db)):
     """Получение мероприятий на конкретную дату"""
     try:
         logger.debug(f"🔹 Получение мероприятий на дату: {date}")
 
-        selected_date = datetime.fromisoformat(date).date()
+        # Границы суток как datetime: asyncpg не приводит date к timestamp
+        selected_date = datetime.fromisoformat(date).replace(hour=0, minute=0, second=0, microsecond=0)
         next_day = selected_date + timedelta(days=1)
 
         logger.debug(f"🔹 Поиск мероприятий с {selected_date} по {next_day}")
 
-        competitions = db.query(Сompetition).filter(
-            and_(
-                Сompetition.date >= selected_date,
-                Сompetition.date < next_day
+        competitions = (await db.execute(
+            select(Сompetition).where(
+                and_(
+                    Сompetition.date >= selected_date,
+                    Сompetition.date < next_day
+                )
             )
-        ).all()
+        )).scalars().all()
 
         logger.debug(f"🔹 Найдено {len(competitions)} мероприятий на эту дату")
 
@@ -107,20 +114,20 @@ async def get_day_events(date: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка получения мероприятий: {str(e)}")
 
 @router.get("/competitions/get-all-data")
-async def get_all_competition_data(db: Session = Depends(get_db)):
+async def get_all_competition_data(db: AsyncSession = Depends(get_async_db)):
     """Получение всех данных для формы мероприятия"""
     try:
         # Получаем типы медицинских справок
-        med_cert_types = db.query(MedCertificat_type).all()
+        med_cert_types = await reference_cache.all("medcertificat_type")
         # Получаем всех активных учеников
-        students = db.query(Students).filter(Students.active == True).all()
+        students = (await db.execute(select(Students).where(Students.active == True))).scalars().all()
         # Получаем всех активных тренеров
-        trainers = db.query(Trainers).filter(Trainers.active == True).all()
+        trainers = await reference_cache.active("trainer")
 
         result = {
-            "med_cert_types": [{"id": cert.id, "name": cert.name_cert} for cert in med_cert_types],
+            "med_cert_types": [{"id": cert["id"], "name": cert["name_cert"]} for cert in med_cert_types],
             "students": [{"id": student.id, "name": student.name} for student in students],
-            "trainers": [{"id": trainer.id, "name": trainer.name} for trainer in trainers]
+            "trainers": [{"id": trainer["id"], "name": trainer["name"]} for trainer in trainers]
         }
 
         return JSONResponse(result)
@@ -135,7 +142,7 @@ async def check_student_certificates(
         student_id: int,
         competition_id: int = None,
         date: str = None,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Проверка наличия актуальных справок у студента - УПРОЩЕННАЯ ВЕРСИЯ"""
     try:
@@ -152,7 +159,7 @@ async def check_student_certificates(
         # Определяем дату мероприятия
         competition_date = None
         if competition_id:
-            competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+            competition = await db.get(Сompetition, competition_id)
             if competition and competition.date:
                 competition_date = competition.date.date()
         elif date:
@@ -165,41 +172,42 @@ async def check_student_certificates(
         required_certificates = []
         if competition_id:
             # Для конкретного мероприятия
-            certs = db.query(Сompetition_MedCertificat).filter(
-                Сompetition_MedCertificat.competition_id == competition_id
-            ).all()
-            required_certificates = [c.med_certificat_id for c in certs]
+            required_certificates = list((await db.execute(
+                select(Сompetition_MedCertificat.med_certificat_id).where(
+                    Сompetition_MedCertificat.competition_id == competition_id
+                )
+            )).scalars().all())
         else:
             # Без конкретного мероприятия - все типы справок
-            required_certificates = [c.id for c in db.query(MedCertificat_type).all()]
+            required_certificates = [cert["id"] for cert in await reference_cache.all("medcertificat_type")]
 
         if not required_certificates:
             return JSONResponse(result)
 
         # Получаем актуальные справки студента за один запрос
-        active_certificates = db.query(MedCertificat_received).filter(
-            and_(
-                MedCertificat_received.student_id == student_id,
-                MedCertificat_received.active == True,
-                MedCertificat_received.date_start <= competition_date,
-                MedCertificat_received.date_end >= competition_date
+        active_cert_ids = set((await db.execute(
+            select(MedCertificat_received.cert_id).where(
+                and_(
+                    MedCertificat_received.student_id == student_id,
+                    MedCertificat_received.active == True,
+                    MedCertificat_received.date_start <= competition_date,
+                    MedCertificat_received.date_end >= competition_date
+                )
             )
-        ).all()
-
-        active_cert_ids = [cert.cert_id for cert in active_certificates]
+        )).scalars().all())
 
         # Проверяем, каких справок не хватает
+        missing_ids = [cert_id for cert_id in required_certificates if cert_id not in active_cert_ids]
         missing_certs = []
-        for cert_id in required_certificates:
-            if cert_id not in active_cert_ids:
-                # Получаем название справки
-                cert_type = db.query(MedCertificat_type).filter(
-                    MedCertificat_type.id == cert_id
-                ).first()
+        if missing_ids:
+            # Названия недостающих справок берем из кэша справочников
+            cert_types = await reference_cache.by_id("medcertificat_type")
 
+            for cert_id in missing_ids:
+                cert_type = cert_types.get(cert_id)
                 missing_certs.append({
                     "id": cert_id,
-                    "name": cert_type.name_cert if cert_type else f"Справка {cert_id}"
+                    "name": (cert_type and cert_type["name_cert"]) or f"Справка {cert_id}"
                 })
 
         if missing_certs:
@@ -219,27 +227,27 @@ async def check_student_certificates(
 
 
 @router.get("/competitions/get-competition-data/{competition_id}")
-async def get_competition_data(competition_id: int, db: Session = Depends(get_db)):
+async def get_competition_data(competition_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение данных конкретного мероприятия"""
     try:
-        competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+        competition = await db.get(Сompetition, competition_id)
         if not competition:
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
         # Получаем приглашенных студентов
-        competition_students = db.query(Competition_student).filter(
-            Competition_student.competition_id == competition_id
-        ).all()
+        competition_students = (await db.execute(
+            select(Competition_student).where(Competition_student.competition_id == competition_id)
+        )).scalars().all()
 
         # Получаем ответственных тренеров
-        competition_trainers = db.query(Сompetition_trainer).filter(
-            Сompetition_trainer.competition_id == competition_id
-        ).all()
+        competition_trainers = (await db.execute(
+            select(Сompetition_trainer).where(Сompetition_trainer.competition_id == competition_id)
+        )).scalars().all()
 
         # Получаем требуемые справки
-        competition_certificates = db.query(Сompetition_MedCertificat).filter(
-            Сompetition_MedCertificat.competition_id == competition_id
-        ).all()
+        competition_certificates = (await db.execute(
+            select(Сompetition_MedCertificat).where(Сompetition_MedCertificat.competition_id == competition_id)
+        )).scalars().all()
 
         result = {
             "competition": {
@@ -267,7 +275,7 @@ async def create_competition(
         student_ids: List[int] = Form([]),
         trainer_ids: List[int] = Form([]),
         certificate_ids: List[int] = Form([]),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Создание нового мероприятия"""
     try:
@@ -278,7 +286,7 @@ async def create_competition(
             date=datetime.fromisoformat(date)
         )
         db.add(new_competition)
-        db.flush()  # Получаем ID созданного мероприятия
+        await db.flush()  # Получаем ID созданного мероприятия
 
         # Добавляем студентов
         for student_id in student_ids:
@@ -304,7 +312,7 @@ async def create_competition(
             )
             db.add(competition_cert)
 
-        db.commit()
+        await db.commit()
 
         return JSONResponse({
             "status": "success",
@@ -313,7 +321,7 @@ async def create_competition(
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error in create_competition: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка создания мероприятия: {str(e)}")
 
@@ -327,14 +335,14 @@ async def update_competition(
         student_ids: List[int] = Form([]),
         trainer_ids: List[int] = Form([]),
         certificate_ids: List[int] = Form([]),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление мероприятия - ВНИМАНИЕ: может сбрасывать статусы!"""
     try:
         logger.info(f"🔄 ОБНОВЛЕНИЕ мероприятия ID: {competition_id}")
         logger.info(f"   Новые студенты: {student_ids}")
 
-        competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+        competition = await db.get(Сompetition, competition_id)
         if not competition:
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
@@ -344,9 +352,9 @@ async def update_competition(
         competition.date = datetime.fromisoformat(date)
 
         # ПРОВЕРЯЕМ ТЕКУЩИЕ СТАТУСЫ ПЕРЕД УДАЛЕНИЕМ
-        current_students = db.query(Competition_student).filter(
-            Competition_student.competition_id == competition_id
-        ).all()
+        current_students = (await db.execute(
+            select(Competition_student).where(Competition_student.competition_id == competition_id)
+        )).scalars().all()
 
         logger.info("📋 ТЕКУЩИЕ СТАТУСЫ СТУДЕНТОВ ПЕРЕД ОБНОВЛЕНИЕМ:")
         for cs in current_students:
@@ -355,9 +363,9 @@ async def update_competition(
             logger.info(f"   Студент {cs.student_id}: статус {status_text}")
 
         # Удаляем старых студентов и добавляем новых
-        db.query(Competition_student).filter(
-            Competition_student.competition_id == competition_id
-        ).delete()
+        await db.execute(
+            delete(Competition_student).where(Competition_student.competition_id == competition_id)
+        )
 
         # ВОССТАНАВЛИВАЕМ СТАТУСЫ при добавлении
         for student_id in student_ids:
@@ -378,9 +386,9 @@ async def update_competition(
 
         # Остальное без изменений...
         # Удаляем старых тренеров и добавляем новых
-        db.query(Сompetition_trainer).filter(
-            Сompetition_trainer.competition_id == competition_id
-        ).delete()
+        await db.execute(
+            delete(Сompetition_trainer).where(Сompetition_trainer.competition_id == competition_id)
+        )
 
         for trainer_id in trainer_ids:
             competition_trainer = Сompetition_trainer(
@@ -390,9 +398,9 @@ async def update_competition(
             db.add(competition_trainer)
 
         # Удаляем старые справки и добавляем новые
-        db.query(Сompetition_MedCertificat).filter(
-            Сompetition_MedCertificat.competition_id == competition_id
-        ).delete()
+        await db.execute(
+            delete(Сompetition_MedCertificat).where(Сompetition_MedCertificat.competition_id == competition_id)
+        )
 
         for cert_id in certificate_ids:
             competition_cert = Сompetition_MedCertificat(
@@ -401,7 +409,7 @@ async def update_competition(
             )
             db.add(competition_cert)
 
-        db.commit()
+        await db.commit()
 
         logger.info(f"✅ Мероприятие {competition_id} обновлено")
 
@@ -411,7 +419,7 @@ async def update_competition(
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка в update_competition: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка обновления мероприятия: {str(e)}")
 
@@ -420,30 +428,30 @@ async def update_competition(
 @router.delete("/competitions/delete-competition/{competition_id}")
 async def delete_competition(
         competition_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Удаление мероприятия"""
     try:
-        competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+        competition = await db.get(Сompetition, competition_id)
         if not competition:
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
         # Удаляем связанные записи
-        db.query(Competition_student).filter(
-            Competition_student.competition_id == competition_id
-        ).delete()
+        await db.execute(
+            delete(Competition_student).where(Competition_student.competition_id == competition_id)
+        )
 
-        db.query(Сompetition_trainer).filter(
-            Сompetition_trainer.competition_id == competition_id
-        ).delete()
+        await db.execute(
+            delete(Сompetition_trainer).where(Сompetition_trainer.competition_id == competition_id)
+        )
 
-        db.query(Сompetition_MedCertificat).filter(
-            Сompetition_MedCertificat.competition_id == competition_id
-        ).delete()
+        await db.execute(
+            delete(Сompetition_MedCertificat).where(Сompetition_MedCertificat.competition_id == competition_id)
+        )
 
         # Удаляем само мероприятие
-        db.delete(competition)
-        db.commit()
+        await db.delete(competition)
+        await db.commit()
 
         return JSONResponse({
             "status": "success",
@@ -451,7 +459,7 @@ async def delete_competition(
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error in delete_competition: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка удаления мероприятия: {str(e)}")
 
@@ -459,14 +467,14 @@ async def delete_competition(
 @router.post("/competitions/send-invitations/{competition_id}")
 async def send_invitations(
         competition_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Отправка приглашений на мероприятие - ТОЛЬКО 0 → 1"""
     try:
         logger.info(f"🚀 НАЧАЛО отправки приглашений для мероприятия ID: {competition_id}")
 
         # Получаем мероприятие
-        competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+        competition = await db.get(Сompetition, competition_id)
         if not competition:
             logger.error(f"❌ Мероприятие {competition_id} не найдено")
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
@@ -474,9 +482,9 @@ async def send_invitations(
         logger.info(f"📋 Мероприятие: {competition.name} (ID: {competition.id})")
 
         # Получаем ВСЕХ приглашенных студентов С ПРОСМОТРОМ ТЕКУЩИХ СТАТУСОВ
-        competition_students = db.query(Competition_student).filter(
-            Competition_student.competition_id == competition_id
-        ).all()
+        competition_students = (await db.execute(
+            select(Competition_student).where(Competition_student.competition_id == competition_id)
+        )).scalars().all()
 
         logger.info(f"👥 Найдено студентов: {len(competition_students)}")
 
@@ -495,6 +503,7 @@ async def send_invitations(
             })
 
         # Счетчики
+        invited_ids = []
         updated_0_to_1 = 0
         already_1 = 0
         already_2 = 0
@@ -510,6 +519,7 @@ async def send_invitations(
                 # МЕНЯЕМ ТОЛЬКО 0 на 1
                 old_status = comp_student.participation
                 comp_student.participation = 1
+                invited_ids.append(student_id)
                 updated_0_to_1 += 1
                 logger.info(f"   ✅ Студент {student_id}: {old_status} → {comp_student.participation} (ОТПРАВЛЕНО)")
 
@@ -533,15 +543,29 @@ async def send_invitations(
                 other_status += 1
                 logger.warning(f"   ❓ Студент {student_id}: неизвестный статус {current}")
 
+        # Сообщения родителям уходят в фоне через очередь рассылок. Рассылка ставится
+        # до сохранения статусов: если она не встала в очередь, статусы откатываются
+        # (остаются 0), и повторная отправка снова захватит этих учеников
+        broadcast = None
+        if invited_ids:
+            broadcast = await enqueue_to_parents(
+                "competition",
+                competition_invitation_text(competition.name, competition.date, competition.address),
+                invited_ids,
+                ref_id=competition_id
+            )
+
         # Сохраняем изменения
-        db.commit()
+        await db.commit()
 
         # ПРОВЕРЯЕМ СТАТУСЫ ПОСЛЕ ИЗМЕНЕНИЙ
         logger.info("📊 СТАТУСЫ СТУДЕНТОВ ПОСЛЕ ОБРАБОТКИ:")
-        db.refresh(competition)  # Обновляем объект
-        check_students = db.query(Competition_student).filter(
-            Competition_student.competition_id == competition_id
-        ).all()
+        await db.refresh(competition)  # Обновляем объект
+        check_students = (await db.execute(
+            select(Competition_student)
+            .where(Competition_student.competition_id == competition_id)
+            .execution_options(populate_existing=True)
+        )).scalars().all()
 
         for cs in check_students:
             status_map = {0: "0-не отправлено", 1: "1-отправлено", 2: "2-принято", 3: "3-отклонено"}
@@ -584,12 +608,13 @@ async def send_invitations(
                 "already_2": already_2,
                 "already_3": already_3,
                 "other_status": other_status,
+                "broadcast": broadcast,
                 "logic": "ИЗМЕНЕНЫ ТОЛЬКО СТАТУСЫ 0 → 1. Статусы 1, 2, 3 НЕ ИЗМЕНЯЮТСЯ."
             }
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА в send_invitations: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
@@ -599,23 +624,25 @@ async def send_invitations(
 @router.get("/competitions/get-invitations-status/{competition_id}")
 async def get_invitations_status(
         competition_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Получение статуса приглашений на мероприятие"""
     try:
-        competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+        competition = await db.get(Сompetition, competition_id)
         if not competition:
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
         # Получаем статусы приглашений с именами студентов
-        competition_students = db.query(
-            Competition_student,
-            Students.name
-        ).join(
-            Students, Competition_student.student_id == Students.id
-        ).filter(
-            Competition_student.competition_id == competition_id
-        ).all()
+        competition_students = (await db.execute(
+            select(
+                Competition_student,
+                Students.name
+            ).join(
+                Students, Competition_student.student_id == Students.id
+            ).where(
+                Competition_student.competition_id == competition_id
+            )
+        )).all()
 
         status_counts = {
             "not_processed": 0,  # 0 - необработанно
@@ -1,20 +1,22 @@
 # api/schedule.py
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from config import templates  # ← ТОЛЬКО ОДИН ИМПОРТ
-from database.models import get_db, Students, Sport, Schedule, Students_schedule
+from database.models import get_async_db, Students, Schedule, Students_schedule
+from database.reference_cache import reference_cache
+from db_handler.roster_cache import roster_cache
 
 router = APIRouter()
 
 # УБРАТЬ /schedule/ из всех путей, так как роутер сам добавит префикс
 @router.get("/", response_class=HTMLResponse)  # ← Без /schedule/
-async def main_page(request: Request, db: Session = Depends(get_db)):
+async def main_page(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Главная страница с формой выбора ученика и расписания"""
-    students = db.query(Students).filter(Students.active == True).all()
-    sports = db.query(Sport).all()
+    students = (await db.execute(select(Students).where(Students.active == True))).scalars().all()
+    sports = await reference_cache.all("sport")
 
     return templates.TemplateResponse("index.html", {
         "request": request,
@@ -23,25 +25,29 @@ async def main_page(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/search-students")  # ← Без /schedule/
-async def search_students(query: str, db: Session = Depends(get_db)):
+async def search_students(query: str, db: AsyncSession = Depends(get_async_db)):
     """Поиск учеников по имени для автозаполнения"""
     if not query or len(query) < 2:
         return JSONResponse([])
 
-    students = db.query(Students).filter(
-        and_(
-            Students.active == True,
-            Students.name.ilike(f"%{query}%")
-        )
-    ).limit(10).all()
+    students = (await db.execute(
+        select(Students).where(
+            and_(
+                Students.active == True,
+                Students.name.ilike(f"%{query}%")
+            )
+        ).limit(10)
+    )).scalars().all()
 
     result = [{"id": student.id, "name": student.name} for student in students]
     return JSONResponse(result)
 
 @router.get("/get-schedules")  # ← Без /schedule/
-async def get_schedules(sport_id: int, db: Session = Depends(get_db)):
+async def get_schedules(sport_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение расписания по выбранной дисциплине с сортировкой только по описанию"""
-    schedules = db.query(Schedule).filter(Schedule.sport_discipline == sport_id).all()
+    schedules = (await db.execute(
+        select(Schedule).where(Schedule.sport_discipline == sport_id)
+    )).scalars().all()
 
     # Сортируем расписание только по описанию
     sorted_schedules = sorted(schedules, key=lambda x: x.description or "")
@@ -59,13 +65,12 @@ async def get_schedules(sport_id: int, db: Session = Depends(get_db)):
     return JSONResponse(result)
 
 @router.get("/get-student-schedules")  # ← Без /schedule/
-async def get_student_schedules(student_id: int, db: Session = Depends(get_db)):
+async def get_student_schedules(student_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение текущего расписания ученика"""
-    student_schedules = db.query(Students_schedule).filter(
-        Students_schedule.student == student_id
-    ).all()
+    result = (await db.execute(
+        select(Students_schedule.schedule).where(Students_schedule.student == student_id)
+    )).scalars().all()
 
-    result = [ss.schedule for ss in student_schedules]
     return JSONResponse(result)
 
 @router.post("/save-schedule")  # ← Без /schedule/
@@ -73,14 +78,19 @@ async def save_schedule(
         student_id: int = Form(...),
         sport_id: int = Form(...),
         schedule_ids: List[int] = Form(...),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Сохранение расписания ученика"""
     try:
+        # Прежние тренировки ученика - их списки тоже меняются
+        old_schedule_ids = (await db.execute(
+            select(Students_schedule.schedule).where(Students_schedule.student == student_id)
+        )).scalars().all()
+
         # Удаляем существующее расписание для этого ученика
-        db.query(Students_schedule).filter(
-            Students_schedule.student == student_id
-        ).delete()
+        await db.execute(
+            delete(Students_schedule).where(Students_schedule.student == student_id)
+        )
 
         # Добавляем новое расписание
         for schedule_id in schedule_ids:
@@ -90,22 +100,23 @@ async def save_schedule(
             )
             db.add(student_schedule)
 
-        db.commit()
+        await db.commit()
+        await roster_cache.invalidate([*old_schedule_ids, *schedule_ids])
 
         return JSONResponse({"status": "success", "message": "Расписание успешно сохранено"})
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка сохранения: {str(e)}")
 
 @router.get("/student-schedule/{student_id}", response_class=HTMLResponse)  # ← Без /schedule/
-async def student_schedule_page(request: Request, student_id: int, db: Session = Depends(get_db)):
+async def student_schedule_page(request: Request, student_id: int, db: AsyncSession = Depends(get_async_db)):
     """Страница управления расписанием конкретного ученика"""
-    student = db.query(Students).filter(Students.id == student_id).first()
+    student = await db.get(Students, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Ученик не найден")
 
-    sports = db.query(Sport).all()
+    sports = await reference_cache.all("sport")
 
     return templates.TemplateResponse("student_schedule.html", {
         "request": request,
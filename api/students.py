@@ -1,20 +1,18 @@
-from app_notif import models
 from config import templates, settings
 # api/students.py
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
-from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from datetime import datetime
-from database.models import get_db, Students, Sport, Trainers, Prices, Sports_rank, Belt_сolor, MedCertificat_received, \
-    MedCertificat_type, Competition_student, Сompetition, Students_parents, Tg_notif_user, get_db_async
+from database.models import get_async_db, Students, MedCertificat_received, Competition_student, Сompetition, Students_parents, Tg_notif_user
 from config import templates
+from database.reference_cache import reference_cache
 from db_handler.db_funk import get_user_permissions, process_payment_via_web
+from db_handler.principal_cache import principal_cache
+from db_handler.roster_cache import roster_cache
 from logger_config import logger
-from fastapi import APIRouter, Request, HTTPException, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 from typing import List, Dict, Any
 
 
@@ -22,14 +20,14 @@ router = APIRouter()
 
 
 @router.get("/edit-students", response_class=HTMLResponse)
-async def edit_students_page(request: Request, db: Session = Depends(get_db)):
+async def edit_students_page(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Главная страница редактирования учеников"""
-    students = db.query(Students).filter(Students.active == True).all()
-    sports = db.query(Sport).all()
-    trainers = db.query(Trainers).all()
-    prices = db.query(Prices).all()
-    sports_ranks = db.query(Sports_rank).all()
-    belt_colors = db.query(Belt_сolor).all()
+    students = (await db.execute(select(Students).where(Students.active == True))).scalars().all()
+    sports = await reference_cache.all("sport")
+    trainers = await reference_cache.all("trainer")
+    prices = await reference_cache.all("price")
+    sports_ranks = await reference_cache.all("sport_rank")
+    belt_colors = await reference_cache.all("belt_color")
 
     return templates.TemplateResponse("edit_students.html", {
         "request": request,
@@ -43,29 +41,31 @@ async def edit_students_page(request: Request, db: Session = Depends(get_db)):
 
 
 @router.get("/edit-students/search-students")
-async def search_students_edit(query: str, db: Session = Depends(get_db)):
+async def search_students_edit(query: str, db: AsyncSession = Depends(get_async_db)):
     """Поиск учеников по имени для автозаполнения на странице редактирования"""
     if not query or len(query) < 2:
         return JSONResponse([])
 
-    students = db.query(Students).filter(
-        and_(
-            Students.active == True,
-            Students.name.ilike(f"%{query}%")
-        )
-    ).limit(10).all()
+    students = (await db.execute(
+        select(Students).where(
+            and_(
+                Students.active == True,
+                Students.name.ilike(f"%{query}%")
+            )
+        ).limit(10)
+    )).scalars().all()
 
     result = [{"id": student.id, "name": student.name} for student in students]
     return JSONResponse(result)
 
 
 @router.get("/edit-students/get-student-data/{student_id}")
-async def get_student_data(student_id: int, db: Session = Depends(get_db)):
+async def get_student_data(student_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение данных ученика"""
     try:
         print(f"🔹 Запрос данных ученика ID: {student_id}")
 
-        student = db.query(Students).filter(Students.id == student_id).first()
+        student = await db.get(Students, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Ученик не найден")
 
@@ -130,13 +130,13 @@ async def update_student(
         date_start: Optional[str] = Form(None),
         telegram_id: Optional[str] = Form(None),
         active: Optional[str] = Form(None),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление данных ученика"""
     try:
         print(f"Получены данные для student_id: {student_id}")
 
-        student = db.query(Students).filter(Students.id == student_id).first()
+        student = await db.get(Students, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Ученик не найден")
 
@@ -161,7 +161,7 @@ async def update_student(
         student.name = name
         student.birthday = datetime.fromisoformat(birthday) if birthday else None
         student.sport_discipline = parse_int(sport_discipline)
-        student.rang = parse_value(rang)
+        student.rang = parse_int(rang)
         student.sports_rank = parse_int(sports_rank)
         student.sex = parse_value(sex)
         student.weight = parse_int(weight)
@@ -179,13 +179,15 @@ async def update_student(
         student.telegram_id = parse_int(telegram_id)
         student.active = parse_bool(active)
 
-        db.commit()
+        await db.commit()
+        # Имя, пояс и активность видны в списках тренировок ученика
+        await roster_cache.invalidate_student(student_id)
 
         return JSONResponse({"status": "success", "message": "Данные ученика успешно обновлены"})
 
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Ошибка при сохранении: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка обновления: {str(e)}")
 
@@ -211,7 +213,7 @@ async def create_student(
         date_start: Optional[str] = Form(None),
         telegram_id: Optional[str] = Form(None),
         active: Optional[str] = Form(None),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Создание нового ученика"""
     try:
@@ -241,7 +243,7 @@ async def create_student(
             name=name,
             birthday=datetime.fromisoformat(birthday) if birthday else None,
             sport_discipline=parse_int(sport_discipline),
-            rang=parse_value(rang),
+            rang=parse_int(rang),
             sports_rank=parse_int(sports_rank),
             sex=parse_value(sex),
             weight=parse_int(weight),
@@ -261,8 +263,8 @@ async def create_student(
         )
 
         db.add(new_student)
-        db.commit()
-        db.refresh(new_student)
+        await db.commit()
+        await db.refresh(new_student)
 
         logger.info(f"✅ Создан новый ученик с ID: {new_student.id}, имя: {new_student.name}")
 
@@ -273,7 +275,7 @@ async def create_student(
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при создании ученика: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -281,47 +283,47 @@ async def create_student(
 
 
 @router.get("/edit-students/get-prices")
-async def get_prices(db: Session = Depends(get_db)):
+async def get_prices():
     """Получение списка всех цен"""
-    prices = db.query(Prices).all()
+    prices = await reference_cache.all("price")
 
     result = []
     for price in prices:
         result.append({
-            "id": price.id,
-            "price": price.price,
-            "description": price.description or "",
-            "classes_in_price": price.classes_in_price or 0
+            "id": price["id"],
+            "price": price["price"],
+            "description": price["description"] or "",
+            "classes_in_price": price["classes_in_price"] or 0
         })
 
     return JSONResponse(result)
 
 
 @router.get("/edit-students/get-medical-certificates/{student_id}")
-async def get_medical_certificates(student_id: int, db: Session = Depends(get_db)):
+async def get_medical_certificates(student_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение медицинских справок ученика"""
     try:
         print(f"🔹 Запрос медицинских справок ученика ID: {student_id}")
 
         # Получаем активные справки ученика
-        certificates = db.query(MedCertificat_received).filter(
-            and_(
-                MedCertificat_received.student_id == student_id,
-                MedCertificat_received.active == True
+        certificates = (await db.execute(
+            select(MedCertificat_received)
+            .where(
+                and_(
+                    MedCertificat_received.student_id == student_id,
+                    MedCertificat_received.active == True
+                )
             )
-        ).all()
+        )).scalars().all()
+        cert_types = await reference_cache.by_id("medcertificat_type")
 
         result = []
         for cert in certificates:
-            # Получаем информацию о типе справки
-            cert_type = db.query(MedCertificat_type).filter(
-                MedCertificat_type.id == cert.cert_id
-            ).first()
-
+            cert_type = cert_types.get(cert.cert_id)
             result.append({
                 "id": cert.id,
                 "cert_id": cert.cert_id,
-                "cert_name": cert_type.name_cert if cert_type else "Неизвестная справка",
+                "cert_name": cert_type["name_cert"] if cert_type else "Неизвестная справка",
                 "date_start": cert.date_start.isoformat() if cert.date_start else None,
                 "date_end": cert.date_end.isoformat() if cert.date_end else None,
                 "active": cert.active
@@ -337,12 +339,12 @@ async def get_medical_certificates(student_id: int, db: Session = Depends(get_db
 
 
 @router.get("/edit-students/get-certificate-types")
-async def get_certificate_types(db: Session = Depends(get_db)):
+async def get_certificate_types():
     """Получение списка типов медицинских справок"""
     try:
-        cert_types = db.query(MedCertificat_type).all()
+        cert_types = await reference_cache.all("medcertificat_type")
 
-        result = [{"id": cert.id, "name": cert.name_cert} for cert in cert_types]
+        result = [{"id": cert["id"], "name": cert["name_cert"]} for cert in cert_types]
         return JSONResponse(result)
 
     except Exception as e:
@@ -353,7 +355,7 @@ async def get_certificate_types(db: Session = Depends(get_db)):
 @router.post("/edit-students/update-medical-certificate")
 async def update_medical_certificate(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление медицинской справки"""
     try:
@@ -374,9 +376,7 @@ async def update_medical_certificate(
         if not certificate_id:
             raise HTTPException(status_code=400, detail="ID справки обязательно")
 
-        certificate = db.query(MedCertificat_received).filter(
-            MedCertificat_received.id == certificate_id
-        ).first()
+        certificate = await db.get(MedCertificat_received, certificate_id)
 
         if not certificate:
             raise HTTPException(status_code=404, detail="Справка не найдена")
@@ -393,7 +393,7 @@ async def update_medical_certificate(
         if active is not None:
             certificate.active = active == "on"
 
-        db.commit()
+        await db.commit()
 
         return JSONResponse({
             "status": "success",
@@ -401,11 +401,11 @@ async def update_medical_certificate(
         })
 
     except ValueError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка преобразования типов: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка в данных: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при обновлении справки: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -415,7 +415,7 @@ async def update_medical_certificate(
 @router.post("/edit-students/add-medical-certificate")
 async def add_medical_certificate(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Добавление новой медицинской справки"""
     try:
@@ -442,12 +442,12 @@ async def add_medical_certificate(
             raise HTTPException(status_code=400, detail="Дата окончания обязательна")
 
         # Проверяем существование ученика
-        student = db.query(Students).filter(Students.id == student_id).first()
+        student = await db.get(Students, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Ученик не найден")
 
         # Проверяем существование типа справки
-        cert_type = db.query(MedCertificat_type).filter(MedCertificat_type.id == cert_id).first()
+        cert_type = await reference_cache.get("medcertificat_type", cert_id)
         if not cert_type:
             raise HTTPException(status_code=404, detail="Тип справки не найден")
 
@@ -461,10 +461,10 @@ async def add_medical_certificate(
         )
 
         db.add(new_cert)
-        db.commit()
-        db.refresh(new_cert)
+        await db.commit()
+        await db.refresh(new_cert)
 
-        logger.info(f"✅ Добавлена справка для ученика {student.name}, тип: {cert_type.name_cert}")
+        logger.info(f"✅ Добавлена справка для ученика {student.name}, тип: {cert_type['name_cert']}")
 
         return JSONResponse({
             "status": "success",
@@ -473,11 +473,11 @@ async def add_medical_certificate(
         })
 
     except ValueError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка преобразования типов: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка в данных: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при добавлении справки: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -485,20 +485,18 @@ async def add_medical_certificate(
 
 
 @router.delete("/edit-students/delete-medical-certificate/{certificate_id}")
-async def delete_medical_certificate(certificate_id: int, db: Session = Depends(get_db)):
+async def delete_medical_certificate(certificate_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление медицинской справки"""
     try:
         print(f"🔹 Удаление справки ID: {certificate_id}")
 
-        certificate = db.query(MedCertificat_received).filter(
-            MedCertificat_received.id == certificate_id
-        ).first()
+        certificate = await db.get(MedCertificat_received, certificate_id)
 
         if not certificate:
             raise HTTPException(status_code=404, detail="Справка не найдена")
 
-        db.delete(certificate)
-        db.commit()
+        await db.delete(certificate)
+        await db.commit()
 
         return JSONResponse({
             "status": "success",
@@ -506,7 +504,7 @@ async def delete_medical_certificate(certificate_id: int, db: Session = Depends(
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при удалении справки: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка удаления справки: {str(e)}")
 
@@ -514,23 +512,20 @@ async def delete_medical_certificate(certificate_id: int, db: Session = Depends(
 # -------------------------------------------------------НАГРАДЫ-------------------------------------------------------
 
 @router.get("/edit-students/get-awards/{student_id}")
-async def get_awards(student_id: int, db: Session = Depends(get_db)):
+async def get_awards(student_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение наград и результатов соревнований ученика"""
     try:
         print(f"🔹 Запрос наград ученика ID: {student_id}")
 
         # Получаем записи о соревнованиях ученика
-        awards = db.query(Competition_student).filter(
-            Competition_student.student_id == student_id
-        ).all()
+        awards = (await db.execute(
+            select(Competition_student, Сompetition)
+            .outerjoin(Сompetition, Сompetition.id == Competition_student.competition_id)
+            .where(Competition_student.student_id == student_id)
+        )).all()
 
         result = []
-        for award in awards:
-            # Получаем информацию о соревновании
-            competition = db.query(Сompetition).filter(
-                Сompetition.id == award.competition_id
-            ).first()
-
+        for award, competition in awards:
             result.append({
                 "id": award.id,
                 "competition_id": award.competition_id,
@@ -549,10 +544,10 @@ async def get_awards(student_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/edit-students/get-competitions")
-async def get_competitions(db: Session = Depends(get_db)):
+async def get_competitions(db: AsyncSession = Depends(get_async_db)):
     """Получение списка всех соревнований"""
     try:
-        competitions = db.query(Сompetition).all()
+        competitions = (await db.execute(select(Сompetition))).scalars().all()
 
         result = [{"id": comp.id, "name": comp.name, "date": comp.date.isoformat() if comp.date else None}
                  for comp in competitions]
@@ -566,7 +561,7 @@ async def get_competitions(db: Session = Depends(get_db)):
 @router.post("/edit-students/update-award")
 async def update_award(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление результата соревнования"""
     try:
@@ -585,9 +580,7 @@ async def update_award(
         if not award_id:
             raise HTTPException(status_code=400, detail="ID записи обязательно")
 
-        award = db.query(Competition_student).filter(
-            Competition_student.id == award_id
-        ).first()
+        award = await db.get(Competition_student, award_id)
 
         if not award:
             raise HTTPException(status_code=404, detail="Запись не найдена")
@@ -596,7 +589,7 @@ async def update_award(
         if status_id is not None:
             award.status_id = status_id
 
-        db.commit()
+        await db.commit()
 
         return JSONResponse({
             "status": "success",
@@ -604,11 +597,11 @@ async def update_award(
         })
 
     except ValueError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка преобразования типов: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка в данных: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при обновлении результата: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -618,7 +611,7 @@ async def update_award(
 @router.post("/edit-students/add-award")
 async def add_award(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Добавление новой записи о соревновании"""
     try:
@@ -641,22 +634,24 @@ async def add_award(
             status_id = 0  # По умолчанию "Ожидание"
 
         # Проверяем существование ученика
-        student = db.query(Students).filter(Students.id == student_id).first()
+        student = await db.get(Students, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Ученик не найден")
 
         # Проверяем существование соревнования
-        competition = db.query(Сompetition).filter(Сompetition.id == competition_id).first()
+        competition = await db.get(Сompetition, competition_id)
         if not competition:
             raise HTTPException(status_code=404, detail="Соревнование не найдено")
 
         # Проверяем, не существует ли уже запись для этого ученика и соревнования
-        existing_award = db.query(Competition_student).filter(
-            and_(
-                Competition_student.student_id == student_id,
-                Competition_student.competition_id == competition_id
-            )
-        ).first()
+        existing_award = (await db.execute(
+            select(Competition_student.id).where(
+                and_(
+                    Competition_student.student_id == student_id,
+                    Competition_student.competition_id == competition_id
+                )
+            ).limit(1)
+        )).scalar()
 
         if existing_award:
             raise HTTPException(status_code=400, detail="Запись для этого соревнования уже существует")
@@ -669,8 +664,8 @@ async def add_award(
         )
 
         db.add(new_award)
-        db.commit()
-        db.refresh(new_award)
+        await db.commit()
+        await db.refresh(new_award)
 
         logger.info(f"✅ Добавлена запись о соревновании для ученика {student.name}, соревнование: {competition.name}")
 
@@ -681,11 +676,11 @@ async def add_award(
         })
 
     except ValueError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка преобразования типов: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка в данных: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при добавлении записи: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -693,20 +688,18 @@ async def add_award(
 
 
 @router.delete("/edit-students/delete-award/{award_id}")
-async def delete_award(award_id: int, db: Session = Depends(get_db)):
+async def delete_award(award_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление записи о соревновании"""
     try:
         print(f"🔹 Удаление записи о соревновании ID: {award_id}")
 
-        award = db.query(Competition_student).filter(
-            Competition_student.id == award_id
-        ).first()
+        award = await db.get(Competition_student, award_id)
 
         if not award:
             raise HTTPException(status_code=404, detail="Запись не найдена")
 
-        db.delete(award)
-        db.commit()
+        await db.delete(award)
+        await db.commit()
 
         return JSONResponse({
             "status": "success",
@@ -714,7 +707,7 @@ async def delete_award(award_id: int, db: Session = Depends(get_db)):
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при удалении записи: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка удаления записи: {str(e)}")
 
@@ -722,23 +715,21 @@ async def delete_award(award_id: int, db: Session = Depends(get_db)):
 # ----------------Родители---------------------
 
 @router.get("/edit-students/get-parents/{student_id}")
-async def get_student_parents(student_id: int, db: Session = Depends(get_db)):
+async def get_student_parents(student_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение списка родителей ученика"""
     try:
         print(f"🔹 Запрос родителей ученика ID: {student_id}")
 
         # Получаем связи ученик-родители
-        parent_relations = db.query(Students_parents).filter(
-            Students_parents.student == student_id
-        ).all()
+        parent_relations = (await db.execute(
+            select(Students_parents, Tg_notif_user)
+            .join(Tg_notif_user, Tg_notif_user.id == Students_parents.parents)
+            .where(Students_parents.student == student_id)
+            .order_by(Students_parents.id)
+        )).all()
 
         result = []
-        for relation in parent_relations:
-            # Получаем информацию о родителе из Tg_notif_user
-            parent = db.query(Tg_notif_user).filter(
-                Tg_notif_user.id == relation.parents
-            ).first()
-
+        for relation, parent in parent_relations:
             if parent:
                 result.append({
                     "id": parent.id,
@@ -761,24 +752,26 @@ async def get_student_parents(student_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/edit-students/search-parents")
-async def search_parents(query: str, db: Session = Depends(get_db)):
+async def search_parents(query: str, db: AsyncSession = Depends(get_async_db)):
     """Поиск родителей для автозаполнения"""
     try:
         if not query or len(query) < 2:
             return JSONResponse([])
 
         # Ищем родителей по различным полям
-        parents = db.query(Tg_notif_user).filter(
-            and_(
-                Tg_notif_user.is_active == True,
-                or_(
-                    Tg_notif_user.full_name.ilike(f"%{query}%"),
-                    Tg_notif_user.telegram_username.ilike(f"%{query}%"),
-                    Tg_notif_user.phone.ilike(f"%{query}%"),
-                    Tg_notif_user.email.ilike(f"%{query}%")
+        parents = (await db.execute(
+            select(Tg_notif_user).where(
+                and_(
+                    Tg_notif_user.is_active == True,
+                    or_(
+                        Tg_notif_user.full_name.ilike(f"%{query}%"),
+                        Tg_notif_user.telegram_username.ilike(f"%{query}%"),
+                        Tg_notif_user.phone.ilike(f"%{query}%"),
+                        Tg_notif_user.email.ilike(f"%{query}%")
+                    )
                 )
-            )
-        ).limit(10).all()
+            ).limit(10)
+        )).scalars().all()
 
         result = [
             {
@@ -802,27 +795,29 @@ async def search_parents(query: str, db: Session = Depends(get_db)):
 async def add_parent(
         student_id: int = Form(...),
         parent_id: int = Form(...),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Добавление родителя к ученику"""
     try:
         # Проверяем существование ученика
-        student = db.query(Students).filter(Students.id == student_id).first()
+        student = await db.get(Students, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Ученик не найден")
 
         # Проверяем существование родителя
-        parent = db.query(Tg_notif_user).filter(Tg_notif_user.id == parent_id).first()
+        parent = await db.get(Tg_notif_user, parent_id)
         if not parent:
             raise HTTPException(status_code=404, detail="Родитель не найден")
 
         # Проверяем, не существует ли уже связь
-        existing_relation = db.query(Students_parents).filter(
-            and_(
-                Students_parents.student == student_id,
-                Students_parents.parents == parent_id
-            )
-        ).first()
+        existing_relation = (await db.execute(
+            select(Students_parents.id).where(
+                and_(
+                    Students_parents.student == student_id,
+                    Students_parents.parents == parent_id
+                )
+            ).limit(1)
+        )).scalar()
 
         if existing_relation:
             raise HTTPException(status_code=400, detail="Родитель уже добавлен к ученику")
@@ -834,8 +829,9 @@ async def add_parent(
         )
 
         db.add(new_relation)
-        db.commit()
-        db.refresh(new_relation)
+        await db.commit()
+        await db.refresh(new_relation)
+        await principal_cache.invalidate(parent.telegram_id)
 
         logger.info(f"✅ Добавлен родитель {parent.full_name} к ученику {student.name}")
 
@@ -846,26 +842,27 @@ async def add_parent(
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при добавлении родителя: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка добавления родителя: {str(e)}")
 
 
 @router.delete("/edit-students/remove-parent/{relation_id}")
-async def remove_parent(relation_id: int, db: Session = Depends(get_db)):
+async def remove_parent(relation_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление связи с родителем"""
     try:
         print(f"🔹 Удаление связи с родителем ID: {relation_id}")
 
-        relation = db.query(Students_parents).filter(
-            Students_parents.id == relation_id
-        ).first()
+        relation = await db.get(Students_parents, relation_id)
 
         if not relation:
             raise HTTPException(status_code=404, detail="Связь не найдена")
 
-        db.delete(relation)
-        db.commit()
+        parent = await db.get(Tg_notif_user, relation.parents)
+        await db.delete(relation)
+        await db.commit()
+        if parent:
+            await principal_cache.invalidate(parent.telegram_id)
 
         return JSONResponse({
             "status": "success",
@@ -873,7 +870,7 @@ async def remove_parent(relation_id: int, db: Session = Depends(get_db)):
         })
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"❌ Ошибка при удалении связи: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка удаления связи: {str(e)}")
 
@@ -885,7 +882,7 @@ async def remove_parent(relation_id: int, db: Session = Depends(get_db)):
 async def process_student_payment(
         student_id: int,
         request: Request,
-        db: AsyncSession = Depends(get_db_async)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Обработка оплаты для ученика через веб-интерфейс"""
     try:
@@ -931,7 +928,7 @@ async def process_student_payment(
 @router.get("/api/prices")
 async def get_prices(
         request: Request,
-        db: AsyncSession = Depends(get_db_async)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Получение списка всех тарифов"""
     try:
@@ -941,17 +938,14 @@ async def get_prices(
             raise HTTPException(status_code=401, detail="Не авторизован")
 
         # Получаем список тарифов
-        prices = await db.execute(
-            select(models.Prices).order_by(models.Prices.price)
-        )
-        price_list = prices.scalars().all()
+        price_list = sorted(await reference_cache.all("price"), key=lambda p: p["price"] or 0)
 
         return [
             {
-                "id": p.id,
-                "price": p.price,
-                "classes_in_price": p.classes_in_price,
-                "description": p.description or f"Тариф {p.id}"
+                "id": p["id"],
+                "price": p["price"],
+                "classes_in_price": p["classes_in_price"],
+                "description": p["description"] or f"Тариф {p['id']}"
             }
             for p in price_list
         ]
@@ -966,7 +960,7 @@ async def get_prices(
 async def add_medical_certificate(
         student_id: int,
         request: Request,
-        db: AsyncSession = Depends(get_db_async)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Добавление справки по болезни"""
     try:
@@ -1009,7 +1003,7 @@ async def add_medical_certificate(
 async def get_medical_certificates(
         student_id: int,
         request: Request,
-        db: AsyncSession = Depends(get_db_async)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Получение списка справок по болезни ученика"""
     try:
@@ -1036,7 +1030,7 @@ async def delete_medical_certificate_endpoint(
         student_id: int,
         certificate_id: int,
         request: Request,
-        db: AsyncSession = Depends(get_db_async)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Удаление справки по болезни"""
     try:
@@ -1,37 +1,58 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
+from typing import Dict, List
 import os
 
-from app_notif.database import get_db
+from database.models import get_async_db
 from database.models import Students_parents, Students, Tg_notif_user
 from config import templates
+from db_handler.principal_cache import principal_cache
 from logger_config import logger
 router = APIRouter(prefix="/admin", tags=["telegram-registrations"])
 
 
 # ====================  Вспомогательные функции ====================
 
-def get_user_students(db: Session, user_id: int):
-    """Получить информацию о детях пользователя"""
-    student_relations = db.query(Students_parents).filter(
-        Students_parents.parents == user_id
-    ).all()
-
-    students_info = []
-    for relation in student_relations:
-        student = db.query(Students).filter(Students.id == relation.student).first()
-        if student:
-            students_info.append({
-                "id": student.id,
-                "name": student.name,
-                "active": student.active,
-                "birthday": student.birthday.strftime('%d.%m.%Y') if student.birthday else None,
-                "sport_discipline": student.sport_discipline
-            })
+async def get_users_students(db: AsyncSession, user_ids: List[int]) -> Dict[int, List[dict]]:
+    """Получить информацию о детях сразу для нескольких пользователей (один запрос)"""
+    students_by_user: Dict[int, List[dict]] = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return students_by_user
+
+    rows = (await db.execute(
+        select(Students_parents.parents, Students)
+        .join(Students, Students.id == Students_parents.student)
+        .where(Students_parents.parents.in_(user_ids))
+        .order_by(Students_parents.id)
+    )).all()
+
+    for parent_id, student in rows:
+        students_by_user[parent_id].append({
+            "id": student.id,
+            "name": student.name,
+            "active": student.active,
+            "birthday": student.birthday.strftime('%d.%m.%Y') if student.birthday else None,
+            "sport_discipline": student.sport_discipline
+        })
+
+    return students_by_user
+
+
+async def attach_students_info(db: AsyncSession, users) -> None:
+    """Добавляет пользователям атрибут students_info"""
+    students_by_user = await get_users_students(db, [user.id for user in users])
+    for user in users:
+        user.students_info = students_by_user[user.id]
+
 
-    return students_info
+async def count_users(db: AsyncSession, *conditions) -> int:
+    """Количество пользователей Tg_notif_user по условиям"""
+    return (await db.execute(
+        select(func.count()).select_from(Tg_notif_user).where(*conditions)
+    )).scalar_one()
 
 
 # def log_action(action: str, user_id: int, user_name: str, reason: str = ""):
@@ -56,7 +77,7 @@ def get_user_students(db: Session, user_id: int):
 # ==================== Роуты ====================
 
 @router.get("/registrations", response_class=HTMLResponse)
-async def admin_panel(request: Request, db: Session = Depends(get_db)):
+async def admin_panel(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Главная страница админ-панели"""
     user_info = getattr(request.state, 'user', None)
 
@@ -65,36 +86,30 @@ async def admin_panel(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/")  # Или на страницу логина
 
     # Получаем пользователей, ожидающих подтверждения
-    pending_users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == False
-    ).order_by(Tg_notif_user.date_reg.desc()).all()
-
-    # Добавляем информацию о детях
-    for user in pending_users:
-        user.students_info = get_user_students(db, user.id)
+    pending_users = (await db.execute(
+        select(Tg_notif_user).where(
+            Tg_notif_user.is_active == False
+        ).order_by(Tg_notif_user.date_reg.desc())
+    )).scalars().all()
 
     # Получаем подтвержденных пользователей (последние 10)
-    approved_users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == True
-    ).order_by(Tg_notif_user.date_reg.desc()).limit(10).all()
+    approved_users = (await db.execute(
+        select(Tg_notif_user).where(
+            Tg_notif_user.is_active == True
+        ).order_by(Tg_notif_user.date_reg.desc()).limit(10)
+    )).scalars().all()
 
-    for user in approved_users:
-        user.students_info = get_user_students(db, user.id)
+    # Добавляем информацию о детях
+    await attach_students_info(db, list(pending_users) + list(approved_users))
 
     # Получаем статистику
-    total_users = db.query(Tg_notif_user).count()
-    total_pending = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == False
-    ).count()
-    total_approved = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == True
-    ).count()
+    total_users = await count_users(db)
+    total_pending = await count_users(db, Tg_notif_user.is_active == False)
+    total_approved = await count_users(db, Tg_notif_user.is_active == True)
 
     # Статистика за последние 7 дней
     week_ago = datetime.now() - timedelta(days=7)
-    recent_registrations = db.query(Tg_notif_user).filter(
-        Tg_notif_user.date_reg >= week_ago
-    ).count()
+    recent_registrations = await count_users(db, Tg_notif_user.date_reg >= week_ago)
 
     return templates.TemplateResponse(
         "tg_membership.html",
@@ -113,41 +128,43 @@ async def admin_panel(request: Request, db: Session = Depends(get_db)):
 
 
 @router.get("/users/pending")
-async def get_pending_users_api(db: Session = Depends(get_db)):
+async def get_pending_users_api(db: AsyncSession = Depends(get_async_db)):
     """API для получения пользователей, ожидающих подтверждения"""
-    users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == False
-    ).order_by(Tg_notif_user.date_reg.desc()).all()
+    users = (await db.execute(
+        select(Tg_notif_user).where(
+            Tg_notif_user.is_active == False
+        ).order_by(Tg_notif_user.date_reg.desc())
+    )).scalars().all()
 
-    for user in users:
-        user.students_info = get_user_students(db, user.id)
+    await attach_students_info(db, users)
 
     return users
 
 
 @router.get("/users/approved")
-async def get_approved_users_api(limit: int = 50, db: Session = Depends(get_db)):
+async def get_approved_users_api(limit: int = 50, db: AsyncSession = Depends(get_async_db)):
     """API для получения подтвержденных пользователей"""
-    users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == True
-    ).order_by(Tg_notif_user.date_reg.desc()).limit(limit).all()
+    users = (await db.execute(
+        select(Tg_notif_user).where(
+            Tg_notif_user.is_active == True
+        ).order_by(Tg_notif_user.date_reg.desc()).limit(limit)
+    )).scalars().all()
 
-    for user in users:
-        user.students_info = get_user_students(db, user.id)
+    await attach_students_info(db, users)
 
     return users
 
 
 @router.post("/users/{user_id}/approve")
-async def approve_user(user_id: int, db: Session = Depends(get_db)):
+async def approve_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """API для подтверждения пользователя"""
-    user = db.query(Tg_notif_user).filter(Tg_notif_user.id == user_id).first()
+    user = await db.get(Tg_notif_user, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
     user.is_active = True
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     # Логируем действие
     logger.info(f"Пользователь {user.full_name} подтвержден")
@@ -156,15 +173,15 @@ async def approve_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/users/{user_id}/reject")
-async def reject_user(user_id: int, reason: str = "", db: Session = Depends(get_db)):
+async def reject_user(user_id: int, reason: str = "", db: AsyncSession = Depends(get_async_db)):
     """API для отклонения пользователя"""
-    user = db.query(Tg_notif_user).filter(Tg_notif_user.id == user_id).first()
+    user = await db.get(Tg_notif_user, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
     user.is_active = False
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     # Логируем действие
     logger.info(f"Пользователь {user.full_name} отклонен")
@@ -176,13 +193,13 @@ async def reject_user(user_id: int, reason: str = "", db: Session = Depends(get_
 async def toggle_notifications(
         user_id: int,
         notification_type: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """API для включения/выключения уведомлений"""
     if notification_type not in ["news", "pays", "info"]:
         raise HTTPException(status_code=400, detail="Неверный тип уведомления")
 
-    user = db.query(Tg_notif_user).filter(Tg_notif_user.id == user_id).first()
+    user = await db.get(Tg_notif_user, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
@@ -193,33 +210,28 @@ async def toggle_notifications(
     elif notification_type == "info":
         user.get_info_student = not user.get_info_student
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     logger.info(f"Настройки уведомлений для {user.full_name}  обновлены")
     return {"status": "success", "message": "Настройки обновлены"}
 
 
 @router.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
     """API для получения статистики"""
-    total_users = db.query(Tg_notif_user).count()
-    pending_users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == False
-    ).count()
-    approved_users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == True
-    ).count()
+    total_users = await count_users(db)
+    pending_users = await count_users(db, Tg_notif_user.is_active == False)
+    approved_users = await count_users(db, Tg_notif_user.is_active == True)
 
     # Статистика за последние 7 дней
     week_ago = datetime.now() - timedelta(days=7)
-    recent_registrations = db.query(Tg_notif_user).filter(
-        Tg_notif_user.date_reg >= week_ago
-    ).count()
+    recent_registrations = await count_users(db, Tg_notif_user.date_reg >= week_ago)
 
-    recent_approvals = db.query(Tg_notif_user).filter(
+    recent_approvals = await count_users(
+        db,
         Tg_notif_user.is_active == True,
         Tg_notif_user.date_reg >= week_ago
-    ).count()
+    )
 
     return {
         "total_users": total_users,
@@ -231,15 +243,17 @@ async def get_stats(db: Session = Depends(get_db)):
 
 
 @router.get("/search/student")
-async def search_student(name: str, db: Session = Depends(get_db)):
+async def search_student(name: str, db: AsyncSession = Depends(get_async_db)):
     """Поиск ученика по имени"""
     if len(name) < 2:
         return []
 
-    students = db.query(Students).filter(
-        Students.name.ilike(f"%{name}%"),
-        Students.active == True
-    ).limit(10).all()
+    students = (await db.execute(
+        select(Students).where(
+            Students.name.ilike(f"%{name}%"),
+            Students.active == True
+        ).limit(10)
+    )).scalars().all()
 
     result = []
     for student in students:
@@ -254,7 +268,7 @@ async def search_student(name: str, db: Session = Depends(get_db)):
 
 #
 @router.get("/users/approved-page", response_class=HTMLResponse)
-async def approved_users_page(request: Request, db: Session = Depends(get_db)):
+async def approved_users_page(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Страница со всеми подтвержденными пользователями"""
     user_info = getattr(request.state, 'user', None)
 
@@ -262,14 +276,17 @@ async def approved_users_page(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/")
 
     # Получаем всех подтвержденных пользователей
-    approved_users = db.query(Tg_notif_user).filter(
-        Tg_notif_user.is_active == True
-    ).order_by(Tg_notif_user.full_name).all()
+    approved_users = (await db.execute(
+        select(Tg_notif_user).where(
+            Tg_notif_user.is_active == True
+        ).order_by(Tg_notif_user.full_name)
+    )).scalars().all()
 
     # Для каждого пользователя получаем информацию о детях
+    students_by_user = await get_users_students(db, [user.id for user in approved_users])
     users_with_students = []
     for user in approved_users:
-        students_info = get_user_students(db, user.id)
+        students_info = students_by_user[user.id]
 
         # Если нет детей, все равно включаем пользователя
         if not students_info:
@@ -299,31 +316,37 @@ async def approved_users_page(request: Request, db: Session = Depends(get_db)):
 async def remove_student_from_user(
         user_id: int,
         student_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Удалить связь между пользователем и учеником"""
     # Находим связь
-    relation = db.query(Students_parents).filter(
-        Students_parents.parents == user_id,
-        Students_parents.student == student_id
-    ).first()
+    relation = (await db.execute(
+        select(Students_parents).where(
+            Students_parents.parents == user_id,
+            Students_parents.student == student_id
+        ).limit(1)
+    )).scalars().first()
 
     if not relation:
         raise HTTPException(status_code=404, detail="Связь не найдена")
 
     # Удаляем связь
-    db.delete(relation)
-    db.commit()
+    await db.delete(relation)
+    await db.commit()
+
+    parent = await db.get(Tg_notif_user, user_id)
+    if parent:
+        await principal_cache.invalidate(parent.telegram_id)
 
     # Проверяем, есть ли у пользователя другие дети
-    remaining_children = db.query(Students_parents).filter(
-        Students_parents.parents == user_id
-    ).count()
+    remaining_children = (await db.execute(
+        select(func.count()).select_from(Students_parents).where(
+            Students_parents.parents == user_id
+        )
+    )).scalar_one()
 
     # Если детей нет, можно предложить удалить пользователя
-    user_info = db.query(Tg_notif_user).filter(
-        Tg_notif_user.id == user_id
-    ).first()
+    user_info = await db.get(Tg_notif_user, user_id)
     logger.info(f"Связь удалена для  {Students_parents.parents} {Students_parents.student} -  обновлены")
     return {
         "status": "success",
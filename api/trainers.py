@@ -1,20 +1,23 @@
 # api/trainers.py
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import datetime
-from database.models import get_db, Trainers, Sport
+from database.models import get_async_db, Trainers
+from database.reference_cache import reference_cache
+from db_handler.principal_cache import principal_cache
 from config import templates
 
 router = APIRouter()
 
 
 @router.get("/edit-trainers", response_class=HTMLResponse)
-async def edit_trainers_page(request: Request, db: Session = Depends(get_db)):
+async def edit_trainers_page(request: Request):
     """Главная страница редактирования тренеров"""
-    trainers = db.query(Trainers).filter(Trainers.active == True).all()
-    sports = db.query(Sport).all()
+    trainers = await reference_cache.active("trainer")
+    sports = await reference_cache.all("sport")
 
     return templates.TemplateResponse("edit_trainers.html", {
         "request": request,
@@ -24,12 +27,12 @@ async def edit_trainers_page(request: Request, db: Session = Depends(get_db)):
 
 
 @router.get("/get-trainer-data/{trainer_id}")
-async def get_trainer_data(trainer_id: int, db: Session = Depends(get_db)):
+async def get_trainer_data(trainer_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение данных тренера - полная версия"""
     try:
         print(f"🔹 Запрос тренера ID: {trainer_id}")
 
-        trainer = db.query(Trainers).filter(Trainers.id == trainer_id).first()
+        trainer = await db.get(Trainers, trainer_id)
         if not trainer:
             return JSONResponse({"error": "Тренер не найден"}, status_code=404)
 
@@ -63,7 +66,7 @@ async def update_trainer(
         telephone: Optional[str] = Form(None),
         telegram_id: Optional[str] = Form(None),
         active: Optional[str] = Form(None),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление данных тренера"""
     try:
@@ -86,10 +89,12 @@ async def update_trainer(
         def parse_bool(value):
             return value == "on"
 
-        trainer = db.query(Trainers).filter(Trainers.id == trainer_id).first()
+        trainer = await db.get(Trainers, trainer_id)
         if not trainer:
             raise HTTPException(status_code=404, detail="Тренер не найден")
 
+        old_telegram_id = trainer.telegram_id
+
         # Обновляем все поля
         trainer.name = name
         trainer.birthday = datetime.fromisoformat(birthday) if birthday else None
@@ -99,21 +104,23 @@ async def update_trainer(
         trainer.telegram_id = parse_int(telegram_id)
         trainer.active = parse_bool(active)
 
-        db.commit()
+        await db.commit()
+        await reference_cache.invalidate("trainer")
+        await principal_cache.invalidate(old_telegram_id, trainer.telegram_id)
 
         print(f"Тренер {trainer_id} успешно обновлен")
         return JSONResponse({"status": "success", "message": "Данные тренера успешно обновлены"})
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Ошибка при обновлении тренера: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка обновления: {str(e)}")
 
 
 @router.get("/debug-trainers")
-async def debug_trainers(db: Session = Depends(get_db)):
+async def debug_trainers(db: AsyncSession = Depends(get_async_db)):
     """Отладочный endpoint для проверки тренеров в БД"""
-    trainers = db.query(Trainers).all()
+    trainers = (await db.execute(select(Trainers))).scalars().all()
 
     result = []
     for trainer in trainers:
@@ -127,10 +134,10 @@ async def debug_trainers(db: Session = Depends(get_db)):
 
 
 @router.get("/debug-trainer-structure")
-async def debug_trainer_structure(db: Session = Depends(get_db)):
+async def debug_trainer_structure(db: AsyncSession = Depends(get_async_db)):
     """Отладочный endpoint для проверки структуры таблицы тренеров"""
     # Получим первого тренера чтобы увидеть все поля
-    trainer = db.query(Trainers).first()
+    trainer = (await db.execute(select(Trainers).limit(1))).scalars().first()
 
     if not trainer:
         return JSONResponse({"error": "Нет тренеров в базе данных"})
@@ -1,19 +1,35 @@
+import asyncio
 import traceback
 
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from datetime import datetime, time, date
 import json
 
-from database.models import get_db, Students, Schedule, Training_place, Sport, Trainers, Students_schedule, Visits
-from config import templates
+from database.attendance_events import attendance_broker
+from database.engines import acquire
+from database.models import get_async_db, schema, Students, Schedule, Training_place, Sport, Students_schedule, Visits
+from database.idempotency import IdempotencyStore
+from database.reference_cache import reference_cache
+from db_handler.attendance_service import AttendanceMark, mark_attendance, mark_attendance_batch
+from db_handler.principal_cache import principal_cache
+from db_handler.roster_cache import roster_cache
+from db_handler.visit_queries import data_between, day_range
+from config import settings, templates
 from logger_config import logger
 
 router = APIRouter()
 
+# Ответы на пакеты офлайн-очереди (static/js/visits_today_outbox.js)
+attendance_idempotency = IdempotencyStore("visits_today")
+MAX_SYNC_BATCHES = 50
+# Отметки из очереди принимаются только за сегодня и столько дней назад:
+# более старые дни уже обработало ночное списание занятий
+SYNC_MAX_DAYS_BACK = 1
+
 
 @router.get("/visits-today/", response_class=HTMLResponse)
 async def visits_today_page(request: Request):
@@ -24,8 +40,21 @@ async def visits_today_page(request: Request):
     })
 
 
+@router.get("/visits-today/sw.js")
+async def visits_today_service_worker():
+    """
+    Service worker страницы: кэш оболочки и отправка офлайн-очереди
+    Отдается из /visits-today/, чтобы его область действия покрывала страницу
+    """
+    return FileResponse(
+        "static/js/visits_today_sw.js",
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 @router.get("/visits-today/get-places")
-async def get_places_today(db: Session = Depends(get_db)):
+async def get_places_today(db: AsyncSession = Depends(get_async_db)):
     """Получение мест тренировок, где есть занятия сегодня"""
     try:
         # Получаем текущий день недели (с маленькой буквы как в базе)
@@ -36,11 +65,13 @@ async def get_places_today(db: Session = Depends(get_db)):
         logger.info(f"📅 Сегодня: {today.strftime('%Y-%m-%d')}, день недели в базе: '{today_weekday}'")
 
         # Получаем места с тренировками сегодня
-        places = db.query(Training_place).join(
-            Schedule, Schedule.training_place == Training_place.id
-        ).filter(
-            Schedule.day_week == today_weekday
-        ).distinct().all()
+        places = (await db.execute(
+            select(Training_place).join(
+                Schedule, Schedule.training_place == Training_place.id
+            ).where(
+                Schedule.day_week == today_weekday
+            ).distinct()
+        )).scalars().all()
 
         logger.info(f"🏢 Найдено мест с тренировками сегодня: {len(places)}")
 
@@ -53,13 +84,12 @@ async def get_places_today(db: Session = Depends(get_db)):
 
     except Exception as e:
         logger.error(f"❌ Ошибка получения мест тренировок: {str(e)}")
-        import traceback
         logger.error(f"Подробности ошибки: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Ошибка получения мест: {str(e)}")
 
 
 @router.get("/visits-today/get-trainings/{place_id}")
-async def get_trainings_today(place_id: int, db: Session = Depends(get_db)):
+async def get_trainings_today(place_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение тренировок на сегодня для выбранного места"""
     try:
         # Получаем текущий день недели (с маленькой буквы)
@@ -70,19 +100,21 @@ async def get_trainings_today(place_id: int, db: Session = Depends(get_db)):
         logger.info(f"🔍 Ищем тренировки для места ID: {place_id}, день: '{today_weekday}'")
 
         # Получаем тренировки на сегодня
-        trainings = db.query(
-            Schedule.id,
-            Schedule.time_start,
-            Schedule.time_end,
-            Sport.name.label("sport_name")
-        ).join(
-            Sport, Schedule.sport_discipline == Sport.id
-        ).filter(
-            and_(
-                Schedule.training_place == place_id,
-                Schedule.day_week == today_weekday
-            )
-        ).order_by(Schedule.time_start).all()
+        trainings = (await db.execute(
+            select(
+                Schedule.id,
+                Schedule.time_start,
+                Schedule.time_end,
+                Sport.name.label("sport_name")
+            ).join(
+                Sport, Schedule.sport_discipline == Sport.id
+            ).where(
+                and_(
+                    Schedule.training_place == place_id,
+                    Schedule.day_week == today_weekday
+                )
+            ).order_by(Schedule.time_start)
+        )).all()
 
         logger.info(f"📋 Найдено тренировок: {len(trainings)}")
 
@@ -104,70 +136,61 @@ async def get_trainings_today(place_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/visits-today/get-students/{schedule_id}")
-async def get_students_for_training(schedule_id: int, db: Session = Depends(get_db)):
+async def get_students_for_training(schedule_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение студентов, записанных на тренировку"""
     try:
         logger.info(f"👥 Запрос студентов для расписания ID: {schedule_id}")
 
         # Получаем информацию о тренировке
-        training_info = db.query(
-            Schedule.time_start,
-            Schedule.day_week
-        ).filter(Schedule.id == schedule_id).first()
+        training_info = (await db.execute(
+            select(
+                Schedule.time_start,
+                Schedule.day_week
+            ).where(Schedule.id == schedule_id)
+        )).first()
 
         if training_info:
             logger.info(f"📅 Тренировка: день '{training_info.day_week}', время {training_info.time_start}")
 
-        # Получаем студентов, привязанных к расписанию
-        students = db.query(
-            Students.id,
-            Students.name,
-            Students.birthday,
-            Students.rang
-        ).join(
-            Students_schedule, Students_schedule.student == Students.id
-        ).filter(
-            and_(
-                Students_schedule.schedule == schedule_id,
-                Students.active == True
-            )
-        ).order_by(Students.name).all()
+        # Студенты, привязанные к расписанию (общий кэш списков тренировок)
+        students = await roster_cache.get(schedule_id)
 
         logger.info(f"📊 Найдено студентов в расписании: {len(students)}")
 
         # Получаем эмодзи поясов
-        from database.models import Belt_сolor
-        belts = {belt.id: belt.color for belt in db.query(Belt_сolor).all()}
+        belts = {belt_id: belt["color"] for belt_id, belt in (await reference_cache.by_id("belt_color")).items()}
 
         # Получаем уже посещенных студентов сегодня
         today = date.today()
-        visited_students = db.query(Visits.student).filter(
-            and_(
-                Visits.shedule == schedule_id,
-                Visits.data >= datetime.combine(today, time.min),
-                Visits.data <= datetime.combine(today, time.max)
+        visited_students = (await db.execute(
+            select(Visits.student).where(
+                and_(
+                    Visits.shedule == schedule_id,
+                    Visits.data >= datetime.combine(today, time.min),
+                    Visits.data <= datetime.combine(today, time.max)
+                )
             )
-        ).all()
-        visited_ids = {v.student for v in visited_students}
+        )).scalars().all()
+        visited_ids = set(visited_students)
 
         logger.info(f"✅ Уже посещено сегодня: {len(visited_ids)} студентов")
 
         result = []
         for student in students:
             # Получаем эмодзи пояса
-            belt_emoji = belts.get(student.rang, "⚪️")
+            belt_emoji = belts.get(student["rang"], "⚪️")
 
             # Год рождения
-            birth_year = student.birthday.year if student.birthday else ""
+            birth_year = int(student["birthday"][:4]) if student["birthday"] else ""
 
-            is_visited = student.id in visited_ids
+            is_visited = student["id"] in visited_ids
 
             result.append({
-                "id": student.id,
-                "name": student.name,
+                "id": student["id"],
+                "name": student["name"],
                 "birth_year": birth_year,
                 "belt_emoji": belt_emoji,
-                "display_name": f"{belt_emoji} {student.name} {birth_year}",
+                "display_name": f"{belt_emoji} {student['name']} {birth_year}",
                 "is_visited": is_visited
             })
 
@@ -175,36 +198,36 @@ async def get_students_for_training(schedule_id: int, db: Session = Depends(get_
 
     except Exception as e:
         logger.error(f"❌ Ошибка получения студентов: {str(e)}")
-        import traceback
         logger.error(f"Подробности ошибки: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Ошибка получения студентов: {str(e)}")
 
 
 @router.get("/visits-today/search-extra-student")
-async def search_extra_student(query: str, db: Session = Depends(get_db)):
+async def search_extra_student(query: str, db: AsyncSession = Depends(get_async_db)):
     """Поиск ученика для добавления вне расписания"""
     try:
         if len(query) < 2:
             return JSONResponse([])
 
-        students = db.query(
-            Students.id,
-            Students.name,
-            Students.birthday,
-            Students.rang
-        ).filter(
-            and_(
-                Students.active == True,
-                or_(
-                    Students.name.ilike(f"%{query}%"),
-                    Students.name.ilike(f"{query}%")
+        students = (await db.execute(
+            select(
+                Students.id,
+                Students.name,
+                Students.birthday,
+                Students.rang
+            ).where(
+                and_(
+                    Students.active == True,
+                    or_(
+                        Students.name.ilike(f"%{query}%"),
+                        Students.name.ilike(f"{query}%")
+                    )
                 )
-            )
-        ).limit(10).all()
+            ).limit(10)
+        )).all()
 
         # Получаем эмодзи поясов
-        from database.models import Belt_сolor
-        belts = {belt.id: belt.color for belt in db.query(Belt_сolor).all()}
+        belts = {belt_id: belt["color"] for belt_id, belt in (await reference_cache.by_id("belt_color")).items()}
 
         result = []
         for student in students:
@@ -229,7 +252,7 @@ async def search_extra_student(query: str, db: Session = Depends(get_db)):
 @router.post("/visits-today/save-attendance")
 async def save_attendance(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Сохранение посещений"""
     try:
@@ -247,164 +270,97 @@ async def save_attendance(
             raise HTTPException(status_code=400, detail="Не указано расписание")
 
         # Получаем информацию о тренировке
-        schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+        schedule = await db.get(Schedule, schedule_id)
         if not schedule:
             raise HTTPException(status_code=404, detail="Расписание не найдено")
 
         # Создаем дату и время для посещения
         visit_datetime = datetime.combine(date.today(), schedule.time_start)
 
-        # Получаем информацию о тренере (пока заглушка)
-        # TODO: Получать trainer_id из сессии пользователя
-        trainer = db.query(Trainers).filter(Trainers.telegram_id == 1).first()
-        trainer_id = trainer.id if trainer else 1
+        # Тренер из сессии - тот же, что и для отметок из офлайн-очереди
+        trainer_id = await _session_trainer_id(request)
 
         logger.info(f"👨‍🏫 Тренер: {trainer_id}, время: {visit_datetime}")
 
-        # Сохраняем посещения для студентов из расписания
-        saved_count = 0
-        errors = []
-
-        # Сначала обрабатываем обычных студентов
-        for student_id in student_ids:
-            try:
-                # Проверяем, не было ли уже посещения сегодня
-                existing = db.query(Visits).filter(
-                    and_(
-                        Visits.student == student_id,
-                        Visits.shedule == schedule_id,
-                        Visits.data >= datetime.combine(date.today(), time.min),
-                        Visits.data <= datetime.combine(date.today(), time.max)
-                    )
-                ).first()
-
-                if not existing:
-                    visit = Visits(
-                        data=visit_datetime,
-                        trainer=trainer_id,
-                        student=student_id,
-                        place=schedule.training_place,
-                        sport_discipline=schedule.sport_discipline,
-                        shedule=schedule_id
-                    )
-                    db.add(visit)
-                    saved_count += 1
-
-            except Exception as e:
-                error_msg = f"Студент {student_id}: {str(e)}"
-                errors.append(error_msg)
-                logger.error(error_msg)
-
-        # Обрабатываем дополнительных студентов
-        for student_data in extra_students:
-            try:
-                student_id = student_data.get("id")
-                student_name = student_data.get("name", "Неизвестный")
-
-                if not student_id:
-                    continue
-
-                # Проверяем, не было ли уже посещения сегодня
-                existing = db.query(Visits).filter(
-                    and_(
-                        Visits.student == student_id,
-                        Visits.shedule == schedule_id,
-                        Visits.data >= datetime.combine(date.today(), time.min),
-                        Visits.data <= datetime.combine(date.today(), time.max)
-                    )
-                ).first()
-
-                if not existing:
-                    visit = Visits(
-                        data=visit_datetime,
-                        trainer=trainer_id,
-                        student=student_id,
-                        place=schedule.training_place,
-                        sport_discipline=schedule.sport_discipline,
-                        shedule=schedule_id
-                    )
-                    db.add(visit)
-                    saved_count += 1
-
-            except Exception as e:
-                error_msg = f"Доп. студент {student_name}: {str(e)}"
-                errors.append(error_msg)
-                logger.error(error_msg)
-
-        db.commit()
+        # Все ученики (из расписания и дополнительные) - одним запросом
+        extra_ids = [student_data.get("id") for student_data in extra_students if student_data.get("id")]
+        result = await mark_attendance(schedule_id, [*student_ids, *extra_ids], visit_datetime, trainer_id)
+        if not result.schedule_found:
+            raise HTTPException(status_code=404, detail="Расписание не найдено")
 
-        logger.info(f"✅ Сохранено посещений: {saved_count}, ошибок: {len(errors)}")
+        saved_count = result.created_count
+        logger.info(f"✅ Сохранено посещений: {saved_count}, уже были отмечены: {result.duplicate_count}")
 
         return JSONResponse({
             "status": "success",
             "message": f"Сохранено {saved_count} посещений",
             "saved_count": saved_count,
-            "errors": errors[:5] if errors else []
+            "duplicates": result.duplicates,
+            "errors": []
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
         logger.error(f"❌ Ошибка сохранения посещений: {str(e)}")
-        import traceback
         logger.error(f"Подробности ошибки: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Ошибка сохранения: {str(e)}")
 
 
 @router.get("/visits-today/get-attendance-status/{schedule_id}")
-async def get_attendance_status(schedule_id: int, db: Session = Depends(get_db)):
+async def get_attendance_status(schedule_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение статуса посещений на тренировке"""
     try:
         today = date.today()
 
         # Получаем тренировку
-        training = db.query(
-            Schedule.time_start,
-            Schedule.time_end,
-            Training_place.name.label("place_name"),
-            Sport.name.label("sport_name")
-        ).join(
-            Training_place, Schedule.training_place == Training_place.id
-        ).join(
-            Sport, Schedule.sport_discipline == Sport.id
-        ).filter(Schedule.id == schedule_id).first()
-
+        training = await db.get(Schedule, schedule_id)
         if not training:
             raise HTTPException(status_code=404, detail="Тренировка не найдена")
 
+        # Названия зала и дисциплины берем из кэша справочников
+        place = await reference_cache.get("training_place", training.training_place)
+        sport = await reference_cache.get("sport", training.sport_discipline)
+        if not place or not sport:
+            raise HTTPException(status_code=404, detail="Тренировка не найдена")
+
         # Получаем всех кто пришел (включая дополнительных)
-        visited = db.query(
-            Visits.student,
-            Students.name,
-            Students.birthday,
-            Students.rang
-        ).join(
-            Students, Visits.student == Students.id
-        ).filter(
-            and_(
-                Visits.shedule == schedule_id,
-                Visits.data >= datetime.combine(today, time.min),
-                Visits.data <= datetime.combine(today, time.max)
+        visited = (await db.execute(
+            select(
+                Visits.student,
+                Students.name,
+                Students.birthday,
+                Students.rang
+            ).join(
+                Students, Visits.student == Students.id
+            ).where(
+                and_(
+                    Visits.shedule == schedule_id,
+                    Visits.data >= datetime.combine(today, time.min),
+                    Visits.data <= datetime.combine(today, time.max)
+                )
             )
-        ).all()
+        )).all()
 
         # Получаем всех кто должен был прийти по расписанию
-        scheduled = db.query(
-            Students.id,
-            Students.name,
-            Students.birthday,
-            Students.rang
-        ).join(
-            Students_schedule, Students_schedule.student == Students.id
-        ).filter(
-            and_(
-                Students_schedule.schedule == schedule_id,
-                Students.active == True
+        scheduled = (await db.execute(
+            select(
+                Students.id,
+                Students.name,
+                Students.birthday,
+                Students.rang
+            ).join(
+                Students_schedule, Students_schedule.student == Students.id
+            ).where(
+                and_(
+                    Students_schedule.schedule == schedule_id,
+                    Students.active == True
+                )
             )
-        ).all()
+        )).all()
 
         # Получаем эмодзи поясов
-        from database.models import Belt_сolor
-        belts = {belt.id: belt.color for belt in db.query(Belt_сolor).all()}
+        belts = {belt_id: belt["color"] for belt_id, belt in (await reference_cache.by_id("belt_color")).items()}
 
         visited_ids = {v.student for v in visited}
 
@@ -439,10 +395,10 @@ async def get_attendance_status(schedule_id: int, db: Session = Depends(get_db))
 
         return JSONResponse({
             "training_info": {
-                "place_name": training.place_name,
+                "place_name": place["name"],
                 "time_start": training.time_start.strftime("%H:%M"),
                 "time_end": training.time_end.strftime("%H:%M"),
-                "sport_name": training.sport_name
+                "sport_name": sport["name"]
             },
             "present_students": present_students,
             "absent_students": absent_students,
@@ -456,4 +412,167 @@ async def get_attendance_status(schedule_id: int, db: Session = Depends(get_db))
 
     except Exception as e:
         logger.error(f"❌ Ошибка получения статуса: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Ошибка получения статуса: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка получения статуса: {str(e)}")
+
+
+async def _session_trainer_id(request: Request) -> int:
+    """Тренер из сессии; если его нет - прежняя заглушка (тренер с telegram_id = 1)"""
+    user = getattr(request.state, "user", None) or {}
+    for telegram_id in (user.get("telegram_id"), 1):
+        if telegram_id:
+            trainer = await principal_cache.trainer(telegram_id)
+            if trainer:
+                return trainer["id"]
+    return 1
+
+
+@router.post("/visits-today/sync")
+async def sync_attendance(request: Request):
+    """
+    Пакеты отметок из офлайн-очереди страницы
+    Тело: {"batches": [{"key", "schedule_id", "day", "student_ids"}, ...]}
+    Новые пакеты всех тренировок записываются одним запросом. Повтор пакета
+    с тем же ключом получает сохраненный ответ. Пакеты за будущие дни или
+    старше SYNC_MAX_DAYS_BACK получают статус rejected и не записываются.
+    """
+    try:
+        payload = await request.json()
+        batches = payload.get("batches") if isinstance(payload, dict) else None
+        if not isinstance(batches, list) or len(batches) > MAX_SYNC_BATCHES:
+            raise HTTPException(status_code=400, detail=f"Ожидается от 0 до {MAX_SYNC_BATCHES} пакетов")
+
+        today = date.today()
+        keys = []
+        marks = {}
+        rejected = {}
+        for batch in batches:
+            try:
+                key = str(batch["key"])
+                mark = AttendanceMark(
+                    schedule_id=int(batch["schedule_id"]),
+                    day=date.fromisoformat(batch["day"]) if batch.get("day") else today,
+                    student_ids=[int(student_id) for student_id in batch.get("student_ids", [])]
+                )
+            except (KeyError, TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Некорректный пакет отметок")
+
+            keys.append(key)
+            if not 0 <= (today - mark.day).days <= SYNC_MAX_DAYS_BACK:
+                rejected[key] = {
+                    "status": "rejected",
+                    "schedule_id": mark.schedule_id,
+                    "day": mark.day.isoformat(),
+                    "created": [],
+                    "duplicates": [],
+                    "error": "Отметки за этот день больше не принимаются"
+                }
+                continue
+            marks[key] = mark
+
+        if rejected:
+            logger.warning(f"⚠️ Офлайн-очередь: отклонено пакетов за недопустимые дни: {len(rejected)}")
+
+        responses = await attendance_idempotency.get_many(marks.keys())
+        responses.update(rejected)
+        fresh = {key: mark for key, mark in marks.items() if key not in responses}
+
+        if fresh:
+            trainer_id = await _session_trainer_id(request)
+            results = await mark_attendance_batch(list(fresh.values()), trainer_id)
+            processed = {
+                key: {
+                    "status": "success" if result.schedule_found else "not_found",
+                    "schedule_id": mark.schedule_id,
+                    "day": mark.day.isoformat(),
+                    "created": result.created,
+                    "duplicates": result.duplicates
+                }
+                for (key, mark), result in zip(fresh.items(), results)
+            }
+            await attendance_idempotency.store_many(processed)
+            responses.update(processed)
+
+            created = sum(len(response["created"]) for response in processed.values())
+            logger.info(f"📥 Офлайн-очередь: {len(fresh)} пакетов, новых отметок: {created}")
+
+        return JSONResponse({
+            "status": "success",
+            "results": {key: responses[key] for key in keys}
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Ошибка синхронизации посещений: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка синхронизации: {str(e)}")
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _marked_today(schedule_id: Optional[int], place_id: Optional[int]) -> dict:
+    """
+    Кто уже отмечен сегодня - одним запросом
+    По тренировке: {schedule_id: [ученики]}, по залу - по всем его тренировкам
+    """
+    start, end = day_range(date.today())
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            f"""SELECT shedule AS schedule_id, array_agg(student) AS students
+                FROM {schema}.visit
+                WHERE {data_between('', 1)}
+                  AND ($3::int IS NULL OR shedule = $3)
+                  AND ($4::int IS NULL OR place = $4)
+                GROUP BY shedule""",
+            start, end, schedule_id, place_id
+        )
+    return {row['schedule_id']: list(row['students']) for row in rows}
+
+
+@router.get("/visits-today/events")
+async def attendance_events(request: Request, schedule_id: Optional[int] = None, place_id: Optional[int] = None):
+    """
+    Поток SSE отметок за сегодня по тренировке или залу
+    Сначала событие snapshot (кто уже отмечен), затем marked при каждой
+    новой отметке (страница, бот, /visits/). resync - нужно перечитать
+    состояние: клиент переподключается и получает новый snapshot.
+    """
+    if schedule_id is None and place_id is None:
+        raise HTTPException(status_code=400, detail="Нужен schedule_id или place_id")
+
+    channels = [f"schedule:{schedule_id}"] if schedule_id is not None else [f"place:{place_id}"]
+    heartbeat = settings.attendance_events.heartbeat
+
+    async def stream():
+        # Подписка (с подтверждением SUBSCRIBE в Redis) раньше снимка: отметка между ними придет событием
+        async with attendance_broker.subscription(channels) as queue:
+            today = date.today().isoformat()
+            try:
+                snapshot = await _marked_today(schedule_id, place_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка снимка посещений для SSE: {e}")
+                yield _sse("error", {"error": "Не удалось получить отметки"})
+                return
+            yield _sse("snapshot", {
+                "day": today,
+                "schedules": {str(key): students for key, students in snapshot.items()}
+            })
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+
+                if event.get("type") == "resync":
+                    yield _sse("resync", {})
+                    return
+                if event.get("day") == today:
+                    yield _sse("marked", event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
@@ -18,12 +18,37 @@ from api.trainers import router as trainers_router
 from api.tg_membership import router as admin_router
 from api.visits import router as visits_router
 from api.competitions import router as competitions_router
-from api.auth import router as auth_router
+from api.auth import router as auth_router, revoke_refresh_cookie
 from api.visits_today import router as visits_today_router
+from api.broadcasts import router as broadcasts_router
 from config import templates
+from database.attendance_events import attendance_broker
+from database.engines import engines, init_pool, pool_stats
+from database.reference_cache import reference_cache
+from database.superset_session import superset_validator
+from database.token_revocation import token_revocation
+from db_handler.broadcast_worker import broadcast_worker
+from db_handler.roster_cache import roster_cache
 from logger_config import logger
 
 app = FastAPI(title="Student Management System")
+
+
+@app.on_event("startup")
+async def on_startup():
+    """Создаем общий пул соединений asyncpg и запускаем воркер рассылок при старте приложения"""
+    await init_pool()
+    broadcast_worker.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Закрываем все пулы соединений (asyncpg и engine SQLAlchemy) при остановке приложения"""
+    await superset_validator.close()
+    await attendance_broker.close()
+    await broadcast_worker.stop()
+    await engines.dispose()
+
 app.add_middleware(SimpleCSRFProtection)
 # Монтируем статические файлы
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -67,13 +92,41 @@ app.include_router(competitions_router, tags=["competitions"])
 app.include_router(admin_router, tags=["admin"])
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])  # Оставляем /api/auth для API
 app.include_router(visits_today_router, tags=["visits-today"])
+app.include_router(broadcasts_router, tags=["broadcasts"])
 
 
 
 @app.get("/health")
 async def health_check():
     """Эндпоинт для проверки здоровья приложения"""
-    return {"status": "healthy", "service": "Student Management System"}
+    return {
+        "status": "healthy",
+        "service": "Student Management System",
+        "db_pool": pool_stats(),
+        "reference_cache": reference_cache.stats(),
+        "superset_sessions": superset_validator.stats(),
+        "token_revocation": token_revocation.stats(),
+        "attendance_events": attendance_broker.stats(),
+        "roster_cache": roster_cache.stats(),
+        "broadcast": broadcast_worker.stats()
+    }
+
+
+@app.post("/reference-cache/invalidate")
+async def invalidate_reference_cache(request: Request, table: str = None):
+    """Сбросить кэш справочников после правки таблиц напрямую в БД (без параметра - все таблицы)"""
+    user_info = getattr(request.state, 'user', None) or {}
+    if not user_info.get("is_admin"):
+        return JSONResponse({"success": False, "error": "Требуются права администратора"}, status_code=403)
+
+    try:
+        if table:
+            await reference_cache.invalidate(table)
+        else:
+            await reference_cache.invalidate()
+    except KeyError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=404)
+    return {"success": True}
 
 @app.get("/auth/callback")
 async def auth_callback(request: Request, return_url: str = "/"):
@@ -84,9 +137,7 @@ async def auth_callback(request: Request, return_url: str = "/"):
 
     if session_cookie:
         # Проверяем, что сессия действительно валидна
-        from database.middleware import DualAuthMiddleware
-        checker = DualAuthMiddleware(app=None, superset_base_url=SUPERSET_BASE_URL)
-        user_info = await checker._authenticate_superset(session_cookie)
+        user_info = await superset_validator.validate(session_cookie)
 
         if user_info and user_info.get("authenticated"):
             safe_return_url = return_url.replace('http://', 'https://')
@@ -117,9 +168,16 @@ async def logout(request: Request):
 
     response = RedirectResponse(url="/choose-login")
 
+    session_cookie = request.cookies.get("session")
+    if session_cookie:
+        superset_validator.forget(session_cookie)
+
+    await revoke_refresh_cookie(request)
+
     # Удаляем ВСЕ возможные авторизационные cookies
     response.delete_cookie("session")  # Superset
     response.delete_cookie("access_token")  # JWT
+    response.delete_cookie("refresh_token")  # JWT refresh
 
     # Также можно удалить через JavaScript localStorage
     return response
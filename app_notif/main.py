@@ -18,9 +18,16 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Импортируем наши модели и зависимости
 
 from config import settings
+from database.engines import engines
 
 app = FastAPI(title="Панель администратора регистраций", version="1.0.0")
 
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Закрываем пулы соединений при остановке приложения"""
+    await engines.dispose()
+
 # Настраиваем CORS
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,152 @@
+"""
+Режим webhook бота (aiohttp), включается секцией [bot_webhook] ENABLED = true.
+
+Telegram шлет обновления на BASE_URL + PATH с заголовком
+X-Telegram-Bot-Api-Secret-Token; запросы без верного токена отклоняются.
+Ответ 200 отдается сразу, обработка идет в фоне:
+
+- обновления одного чата обрабатываются строго по очереди, разных чатов -
+  параллельно (ChatOrderedFeeder);
+- при нескольких репликах за балансировщиком события одного пользователя
+  дополнительно сериализуются блокировкой в Redis (RedisEventIsolation в
+  create_bot), FSM уже хранится в общем Redis.
+
+Проверка без Telegram: utils/fake_telegram.py.
+"""
+import asyncio
+import hashlib
+import hmac
+from typing import Any, Dict, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import settings
+from logger_config import logger
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def secret_token(bot: Bot) -> str:
+    """Секрет из конфига или, если он не задан, одинаковый для всех реплик хэш токена бота"""
+    if settings.bot_webhook.secret_token:
+        return settings.bot_webhook.secret_token
+    return hashlib.sha256(f"webhook:{bot.token}".encode()).hexdigest()
+
+
+def chat_key(update: Update) -> Optional[int]:
+    """Чат (или пользователь), в порядке которого нужно обрабатывать обновление"""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = event.message.chat
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    return user.id if user is not None else None
+
+
+class ChatOrderedFeeder:
+    """Обновления одного чата - по очереди, разных чатов - параллельно"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot):
+        self.dp = dp
+        self.bot = bot
+        self._tails: Dict[int, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"received": 0, "processed": 0, "errors": 0}
+
+    def feed(self, update: Update):
+        self._stats["received"] += 1
+        key = chat_key(update)
+        previous = self._tails.get(key) if key is not None else None
+        task = asyncio.create_task(self._process(update, previous))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if key is not None:
+            self._tails[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+
+    def _release(self, key: int, task: asyncio.Task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _process(self, update: Update, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            # Ошибка предыдущего обновления не должна останавливать очередь чата
+            await asyncio.wait([previous])
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self._stats["processed"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+
+    async def wait_all(self):
+        """Дождаться обновлений, принятых до остановки"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._tasks), "chats": len(self._tails)}
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    conf = settings.bot_webhook
+    token = secret_token(bot)
+    feeder = ChatOrderedFeeder(dp, bot)
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), token):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except Exception as e:
+            logger.warning(f"⚠️ Webhook: некорректное обновление: {e}")
+            return web.Response(status=400)
+        feeder.feed(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "healthy", "webhook": feeder.stats()})
+
+    async def on_startup(app: web.Application):
+        await dp.emit_startup(bot=bot)
+        url = conf.base_url.rstrip("/") + conf.path
+        await bot.set_webhook(
+            url,
+            secret_token=token,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=conf.max_connections,
+        )
+        logger.success(f"Webhook установлен: {url}")
+
+    async def on_shutdown(app: web.Application):
+        # Webhook не снимаем: остальные реплики продолжают принимать обновления
+        await feeder.wait_all()
+        await dp.emit_shutdown(bot=bot)
+
+    app = web.Application()
+    app["feeder"] = feeder
+    app.router.add_post(conf.path, handle_update)
+    app.router.add_get("/health", health)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Сервер webhook до остановки процесса"""
+    conf = settings.bot_webhook
+    if not conf.base_url:
+        raise RuntimeError("Для режима webhook нужен [bot_webhook] BASE_URL")
+
+    runner = web.AppRunner(create_app(dp, bot))
+    await runner.setup()
+    await web.TCPSite(runner, conf.host, conf.port).start()
+    logger.info(f"Webhook слушает {conf.host}:{conf.port}{conf.path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -58,6 +58,51 @@ class DB(BaseSettings):
         return PG_LINK
 
 
+class DBPool(BaseSettings):
+    """Настройки пула соединений asyncpg (секция [db_pool] в config.ini, все ключи необязательны)"""
+    min_size: int = config.getint('db_pool', 'MIN_SIZE', fallback=2)
+    max_size: int = config.getint('db_pool', 'MAX_SIZE', fallback=10)
+    # Таймаут на выполнение одной команды на стороне клиента (секунды)
+    command_timeout: float = config.getfloat('db_pool', 'COMMAND_TIMEOUT', fallback=30.0)
+    # statement_timeout на стороне PostgreSQL (миллисекунды, 0 - без ограничения)
+    statement_timeout_ms: int = config.getint('db_pool', 'STATEMENT_TIMEOUT_MS', fallback=30000)
+    # Закрывать соединения, простаивающие дольше указанного времени (секунды)
+    max_inactive_connection_lifetime: float = config.getfloat('db_pool', 'MAX_INACTIVE_LIFETIME', fallback=300.0)
+
+    # Пулы SQLAlchemy (sync psycopg2 и async asyncpg engine)
+    sa_pool_size: int = config.getint('db_pool', 'SA_POOL_SIZE', fallback=5)
+    sa_max_overflow: int = config.getint('db_pool', 'SA_MAX_OVERFLOW', fallback=5)
+    sa_pool_timeout: float = config.getfloat('db_pool', 'SA_POOL_TIMEOUT', fallback=30.0)
+    pool_recycle: int = config.getint('db_pool', 'POOL_RECYCLE', fallback=1800)
+    pool_pre_ping: bool = config.getboolean('db_pool', 'POOL_PRE_PING', fallback=True)
+    echo: bool = config.getboolean('db_pool', 'ECHO', fallback=False)
+
+
+class ReferenceCacheConf(BaseSettings):
+    """Кэш справочников в памяти процесса (секция [reference_cache], все ключи необязательны)"""
+    # Время жизни строк справочника (секунды)
+    default_ttl: float = config.getfloat('reference_cache', 'DEFAULT_TTL', fallback=3600.0)
+    trainer_ttl: float = config.getfloat('reference_cache', 'TRAINER_TTL', fallback=600.0)
+    # Как часто сверять локальную версию с версией в Redis (секунды)
+    version_check_interval: float = config.getfloat('reference_cache', 'VERSION_CHECK_INTERVAL', fallback=10.0)
+
+
+class PrincipalCacheConf(BaseSettings):
+    """Кэш прав и данных пользователей бота (секция [principal_cache], все ключи необязательны)"""
+    max_size: int = config.getint('principal_cache', 'MAX_SIZE', fallback=2000)
+    # Время жизни записи в памяти процесса и в Redis (секунды)
+    local_ttl: float = config.getfloat('principal_cache', 'LOCAL_TTL', fallback=300.0)
+    redis_ttl: int = config.getint('principal_cache', 'REDIS_TTL', fallback=3600)
+    # Как часто сверять версию в Redis (секунды)
+    version_check_interval: float = config.getfloat('principal_cache', 'VERSION_CHECK_INTERVAL', fallback=5.0)
+
+
+class RosterCacheConf(BaseSettings):
+    """Общий кэш списков учеников тренировок (секция [roster_cache], ключи необязательны)"""
+    # Страховочный срок жизни списка в Redis; актуальность держит версия (секунды)
+    ttl: int = config.getint('roster_cache', 'TTL', fallback=86400)
+
+
 class Redis_conf(BaseSettings):
     REDIS_HOST: str = config['redis']['REDIS_HOST']
     REDIS_PORT: str = config['redis']['REDIS_PORT']
@@ -67,6 +112,27 @@ class Redis_conf(BaseSettings):
 class Superset_conf(BaseSettings):
     base_url: str = config['superset']["SUPERSET_BASE_URL"]
 
+    # Проверка сессий Superset в DualAuthMiddleware (ключи необязательны)
+    session_ttl: float = config.getfloat('superset', 'SESSION_TTL', fallback=300.0)
+    negative_ttl: float = config.getfloat('superset', 'NEGATIVE_TTL', fallback=30.0)
+    stale_grace: float = config.getfloat('superset', 'STALE_GRACE', fallback=900.0)
+    cache_size: int = config.getint('superset', 'SESSION_CACHE_SIZE', fallback=5000)
+    request_timeout: float = config.getfloat('superset', 'REQUEST_TIMEOUT', fallback=3.0)
+    connect_timeout: float = config.getfloat('superset', 'CONNECT_TIMEOUT', fallback=1.0)
+    # Circuit breaker: сколько ошибок подряд и на сколько секунд отключать адрес
+    failure_threshold: int = config.getint('superset', 'FAILURE_THRESHOLD', fallback=3)
+    cooldown: float = config.getfloat('superset', 'COOLDOWN', fallback=30.0)
+
+
+class AttendanceEventsConf(BaseSettings):
+    """Поток отметок посещений для страницы /visits-today/ (секция [attendance_events], ключи необязательны)"""
+    # Рассылка событий между процессами (воркеры API, бот) через Redis pub/sub
+    redis_fanout: bool = config.getboolean('attendance_events', 'REDIS_FANOUT', fallback=True)
+    # Сколько событий ждет медленного подписчика, прежде чем он получит resync
+    queue_size: int = config.getint('attendance_events', 'QUEUE_SIZE', fallback=100)
+    # Пустое сообщение в поток раз в N секунд, чтобы прокси не закрывали соединение
+    heartbeat: float = config.getfloat('attendance_events', 'HEARTBEAT', fallback=15.0)
+
 
 class Tg(BaseSettings):
     token_notif: str = config['tg']["TOKEN_notif"]
@@ -74,12 +140,47 @@ class Tg(BaseSettings):
     root_pass: str = config['tg']["ROOT_PASS"]
 
 
+class BroadcastConf(BaseSettings):
+    """Рассылки в бот уведомлений (секция [broadcast], ключи необязательны)"""
+    # Воркер отправки в процессе API
+    enabled: bool = config.getboolean('broadcast', 'ENABLED', fallback=True)
+    # Лимиты Telegram: всего сообщений в секунду и пауза между сообщениями одному чату
+    global_rate: float = config.getfloat('broadcast', 'GLOBAL_RATE', fallback=25.0)
+    per_chat_interval: float = config.getfloat('broadcast', 'PER_CHAT_INTERVAL', fallback=1.0)
+    # Сколько получателей воркер забирает из очереди за раз
+    batch_size: int = config.getint('broadcast', 'BATCH_SIZE', fallback=100)
+    # Повторы: пауза RETRY_BASE * 2^попытка секунд, после MAX_ATTEMPTS - failed
+    max_attempts: int = config.getint('broadcast', 'MAX_ATTEMPTS', fallback=5)
+    retry_base: float = config.getfloat('broadcast', 'RETRY_BASE', fallback=5.0)
+    # Как часто проверять очередь, если она пуста (секунды)
+    poll_interval: float = config.getfloat('broadcast', 'POLL_INTERVAL', fallback=2.0)
+
+
+class BotWebhookConf(BaseSettings):
+    """Режим webhook бота (секция [bot_webhook], ключи необязательны; по умолчанию - long polling)"""
+    enabled: bool = config.getboolean('bot_webhook', 'ENABLED', fallback=False)
+    # Внешний адрес, на который Telegram шлет обновления: BASE_URL + PATH
+    base_url: str = config.get('bot_webhook', 'BASE_URL', fallback='')
+    path: str = config.get('bot_webhook', 'PATH', fallback='/tg/webhook')
+    host: str = config.get('bot_webhook', 'HOST', fallback='0.0.0.0')
+    port: int = config.getint('bot_webhook', 'PORT', fallback=8081)
+    # Заголовок X-Telegram-Bot-Api-Secret-Token; пустой - выводится из токена бота
+    secret_token: str = config.get('bot_webhook', 'SECRET_TOKEN', fallback='')
+    max_connections: int = config.getint('bot_webhook', 'MAX_CONNECTIONS', fallback=40)
+    # Блокировка пользователя в Redis на время обработки (несколько реплик), секунды
+    lock_timeout: int = config.getint('bot_webhook', 'LOCK_TIMEOUT', fallback=60)
+    # Другой адрес Bot API (например utils/fake_telegram.py для проверки без сети)
+    api_server: str = config.get('bot_webhook', 'API_SERVER', fallback='')
+
+
 class JWTConfig(BaseSettings):
     """Конфигурация JWT для локальной авторизации"""
     secret_key: str = SECRET or "fallback-secret-key-change-me-in-production"  # Устанавливаем дефолтное значение
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    # Как часто сверять версию токенов пользователя с Redis (отзыв токенов)
+    version_check_interval: float = config.getfloat('jwt', 'VERSION_CHECK_INTERVAL', fallback=30.0)
 
 
 class AuthConfig(BaseSettings):
@@ -91,9 +192,16 @@ class AuthConfig(BaseSettings):
 
 class Settings(BaseSettings):
     db: DB = DB()
+    db_pool: DBPool = DBPool()
+    reference_cache: ReferenceCacheConf = ReferenceCacheConf()
+    principal_cache: PrincipalCacheConf = PrincipalCacheConf()
     tg: Tg = Tg()
     redis_conf: Redis_conf = Redis_conf()
     superset_conf: Superset_conf = Superset_conf()
+    attendance_events: AttendanceEventsConf = AttendanceEventsConf()
+    roster_cache: RosterCacheConf = RosterCacheConf()
+    bot_webhook: BotWebhookConf = BotWebhookConf()
+    broadcast: BroadcastConf = BroadcastConf()
     jwt: JWTConfig = JWTConfig()
     auth: AuthConfig = AuthConfig()
 
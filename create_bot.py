@@ -1,5 +1,7 @@
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from asyncpg_lite import DatabaseManager
 from decouple import config
@@ -10,17 +12,23 @@ from logger_config import logger
 
 # Импортируем Redis и middleware
 from database.redis.redis_config import get_redis_client
-from database.redis.redis_storage import RedisStorage as CustomRedisStorage
+from database.redis.redis_storage_v2 import RedisStorageV2 as CustomRedisStorage
 # from database.middleware import LoggingMiddleware
 
 
 
 db_manager = DatabaseManager(db_url=settings.db.db_url, deletion_password=config('ROOT_PASS'))
-bot = Bot(token=config('TOKEN'), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Другой сервер Bot API (utils/fake_telegram.py) - для проверки без Telegram
+session = None
+if settings.bot_webhook.api_server:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot_webhook.api_server))
+    logger.info(f"Bot API: {settings.bot_webhook.api_server}")
+bot = Bot(token=config('TOKEN'), session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
 # ИНИЦИАЛИЗАЦИЯ STORAGE
 redis_storage = None
 fsm_storage = None
+events_isolation = None
 
 logger.info(f"Попытка подключения к Redis: {settings.redis_conf.REDIS_HOST}:{settings.redis_conf.REDIS_PORT}")
 
@@ -36,6 +44,13 @@ try:
 
     fsm_storage = FSMRedisStorage(redis=redis_client)
 
+    # В режиме webhook реплик может быть несколько: события одного пользователя
+    # обрабатываются по очереди под блокировкой в Redis
+    if settings.bot_webhook.enabled:
+        events_isolation = fsm_storage.create_isolation(
+            lock_kwargs={"timeout": settings.bot_webhook.lock_timeout}
+        )
+
     # Инициализируем кастомный Redis storage
     redis_storage = CustomRedisStorage(redis_client)
     logger.info("✅ Redis storage инициализирован успешно")
@@ -49,7 +64,7 @@ except Exception as e:
     logger.info("✅ Используется MemoryStorage как fallback")
 
 # инициируем объект диспетчера с выбранным storage
-dp = Dispatcher(storage=fsm_storage)
+dp = Dispatcher(storage=fsm_storage, events_isolation=events_isolation)
 
 # Middleware для логирования (всегда добавляем)
 # logging_middleware = LoggingMiddleware()
@@ -0,0 +1,180 @@
+"""
+Рассылка отметок посещений подписчикам (поток SSE страницы /visits-today/).
+
+attendance_service после записи отметок публикует событие
+
+    {"type": "marked", "schedule_id": ..., "place_id": ..., "day": "YYYY-MM-DD",
+     "students": [id, ...]}
+
+AttendanceBroker раздает его подписчикам своего процесса по каналам
+schedule:<id> и place:<id>. Если включен REDIS_FANOUT, событие идет через
+Redis pub/sub (канал attendance:events), и его получают все воркеры API,
+в том числе отметки, сделанные в боте. Без Redis события доставляются
+только внутри процесса.
+
+С Redis подписка ждет подтверждения SUBSCRIBE от сервера (не дольше
+SUBSCRIBE_TIMEOUT секунд): событие, опубликованное после выхода из
+subscription(), уже не потеряется.
+
+Очередь каждого подписчика ограничена QUEUE_SIZE: если клиент не успевает
+читать, очередь очищается и он получает {"type": "resync"} - клиенту нужно
+заново запросить состояние.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config import settings
+from database.redis.redis_config import LazyRedis
+from logger_config import logger
+
+REDIS_CHANNEL = "attendance:events"
+SUBSCRIBE_TIMEOUT = 5.0
+
+
+def event_channels(event: Dict[str, Any]) -> List[str]:
+    channels = []
+    if event.get("schedule_id") is not None:
+        channels.append(f"schedule:{event['schedule_id']}")
+    if event.get("place_id") is not None:
+        channels.append(f"place:{event['place_id']}")
+    return channels
+
+
+class AttendanceBroker:
+    """Подписки на события посещений внутри процесса и через Redis"""
+
+    def __init__(self):
+        self.conf = settings.attendance_events
+        # канал -> очереди подписчиков
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._redis = LazyRedis("События посещений", fallback="рассылка только внутри процесса")
+        self._listener: Optional[asyncio.Task] = None
+        # Установлен, пока слушатель подписан на канал Redis
+        self._subscribed = asyncio.Event()
+        self._stats = {"published": 0, "delivered": 0, "resyncs": 0, "redis_errors": 0}
+
+    # ==================== Redis ====================
+
+    def _get_redis(self):
+        return self._redis.get() if self.conf.redis_fanout else None
+
+    def _ensure_listener(self):
+        """Один слушатель Redis на процесс, запускается с первым подписчиком"""
+        if self._listener is None or self._listener.done():
+            if self._get_redis() is not None:
+                self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        delay = 1.0
+        while self._subscribers:
+            client = self._get_redis()
+            if client is None:
+                await asyncio.sleep(delay)
+                continue
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(REDIS_CHANNEL)
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") == "subscribe":
+                        self._subscribed.set()
+                    elif message.get("type") == "message":
+                        self._dispatch(json.loads(message["data"]))
+                    if not self._subscribers:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"⚠️ События посещений: слушатель Redis остановлен ({e}), переподключение")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                self._subscribed.clear()
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    # ==================== Публикация ====================
+
+    async def publish(self, event: Dict[str, Any]):
+        """Опубликовать событие (через Redis, если он есть, иначе внутри процесса)"""
+        self._stats["published"] += 1
+        client = self._get_redis()
+        if client is not None:
+            try:
+                await client.publish(REDIS_CHANNEL, json.dumps(event, ensure_ascii=False, default=str))
+                return
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"⚠️ События посещений: не удалось опубликовать в Redis: {e}")
+        self._dispatch(event)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        queues: Set[asyncio.Queue] = set()
+        for channel in event_channels(event):
+            queues.update(self._subscribers.get(channel, ()))
+
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Клиент отстал: вместо части событий - сигнал перечитать состояние
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                self._stats["resyncs"] += 1
+        self._stats["delivered"] += len(queues)
+
+    # ==================== Подписка ====================
+
+    @asynccontextmanager
+    async def subscription(self, channels: Iterable[str]):
+        """Очередь событий по каналам на время блока"""
+        channels = list(channels)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.conf.queue_size)
+        for channel in channels:
+            self._subscribers.setdefault(channel, set()).add(queue)
+        self._ensure_listener()
+        try:
+            await self._wait_subscribed()
+            yield queue
+        finally:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(queue)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    async def _wait_subscribed(self):
+        """Дождаться, пока слушатель Redis подпишется на канал"""
+        if self._listener is None or self._listener.done() or self._subscribed.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout=SUBSCRIBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ События посещений: нет подтверждения подписки Redis, события могут задержаться")
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "channels": len(self._subscribers),
+            "subscribers": len({id(q) for queues in self._subscribers.values() for q in queues}),
+            "redis_listener": self._listener is not None and not self._listener.done(),
+        }
+
+
+attendance_broker = AttendanceBroker()
@@ -1,17 +1,20 @@
 # database/auth.py - должно содержать все эти функции:
 import bcrypt
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import jwt
 from config import settings
 
 from database.models import Telegram_user
+from database.token_revocation import token_revocation
 
 SECRET_KEY = settings.jwt.secret_key
 ALGORITHM = settings.jwt.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.jwt.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_DAYS = settings.jwt.refresh_token_expire_days
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -58,6 +61,19 @@ async def authenticate_user(
     return user
 
 
+async def user_claims(user: Telegram_user) -> Dict[str, Any]:
+    """Клеймы токена: все, что нужно middleware без запроса в БД"""
+    return {
+        "sub": user.phone,
+        "tid": user.telegram_id,
+        "name": user.full_name or user.phone,
+        "email": user.email,
+        "permissions": user.permissions or 0,
+        "ver": await token_revocation.current_version(user.telegram_id),
+        "gen": await token_revocation.session_generation(user.telegram_id),
+    }
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Создание JWT токена"""
     to_encode = data.copy()
@@ -66,11 +82,85 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def create_refresh_token(data: dict) -> str:
+    """
+    Refresh-токен: только идентификатор пользователя и поколение сессий,
+    клеймы перечитываются из БД
+    """
+    to_encode = {
+        "sub": data["sub"],
+        "tid": data["tid"],
+        "gen": data.get("gen", 0),
+        "jti": uuid.uuid4().hex,
+        "type": "refresh",
+        "exp": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_token(token: str, token_type: str = "access") -> Optional[Dict[str, Any]]:
+    """Проверка подписи и срока токена, без обращения к БД"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("type", "access") != token_type or payload.get("tid") is None:
+        return None
+    return payload
+
+
+def principal_from_claims(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """user_info для request.state из клеймов access-токена"""
+    permissions = payload.get("permissions", 0)
+    return {
+        "authenticated": True,
+        "username": payload.get("name") or payload.get("sub"),
+        "user_id": payload.get("tid"),
+        "telegram_id": payload.get("tid"),
+        "phone": payload.get("sub"),
+        "email": payload.get("email"),
+        "permissions": permissions,
+        "is_superuser": permissions == 99,
+        "is_admin": permissions in [99, 2],
+        "is_trainer": permissions in [99, 2, 1],
+        "auth_type": "jwt"
+    }
+
+
+async def refresh_access_token(
+        db: AsyncSession,
+        refresh_token: str
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Новый access-токен по refresh-токену
+    Пользователь перечитывается из БД, поэтому изменения прав и деактивация
+    вступают в силу при обновлении токена
+    """
+    payload = decode_token(refresh_token, token_type="refresh")
+    if not payload or await token_revocation.is_denied(payload):
+        return None
+    # После смены пароля refresh-токены прежних сессий не принимаются
+    if not await token_revocation.is_session_current(payload):
+        return None
+
+    query = select(Telegram_user).where(
+        Telegram_user.telegram_id == payload["tid"],
+        Telegram_user.is_active == True
+    )
+    result = await db.execute(query)
+    user = result.scalar_one_or_none()
+    if not user or user.phone != payload.get("sub"):
+        return None
+
+    claims = await user_claims(user)
+    return create_access_token(claims), claims
+
+
 async def get_current_user_from_token(
         db: AsyncSession,
         token: str
@@ -91,4 +181,4 @@ async def get_current_user_from_token(
         return user
 
     except jwt.PyJWTError:
-        return None
\ No newline at end of file
+        return None
@@ -1,8 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import sessionmaker
-from config import settings
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.engines import engines
 from database.models import Visits
 from db_handler.db_funk import execute_raw_sql
 
@@ -70,28 +69,12 @@ async def save_selection(schedule_id: int, student_ids: list):
 
 
 async def create_db_session():
-    DATABASE_URL = settings.db.db_url_asinc
-    engine = create_async_engine(DATABASE_URL)
-    return async_sessionmaker(engine, expire_on_commit=False)
+    # Общая фабрика сессий из реестра, новый engine не создается
+    return engines.async_session_factory
 
 
 async def setup_db():
-    # Создаем асинхронный engine
-    engine = create_async_engine(
-        settings.db.db_url_asinc,
-        echo=True,  # Логирование запросов (можно отключить в production)
-        pool_size=5,
-        max_overflow=10
-    )
-
-    # Создаем фабрику сессий
-    async_session = sessionmaker(
-        engine,
-        expire_on_commit=False,
-        class_=AsyncSession
-    )
-
-    return async_session
+    return engines.async_session_factory
 
 
 async def create_visit_record_model(
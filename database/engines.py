@@ -0,0 +1,203 @@
+"""
+Единый реестр подключений к Postgres.
+
+Все движки и пулы процесса (sync engine SQLAlchemy, async engine SQLAlchemy и
+пул asyncpg для сырого SQL) создаются здесь один раз по настройкам
+settings.db_pool. Веб-приложения, бот и скрипты regulatory_tasks берут
+подключения только отсюда, поэтому общее число соединений с сервером
+ограничено и предсказуемо:
+
+    на процесс <= (SA_POOL_SIZE + SA_MAX_OVERFLOW) * число используемых engine + MAX_SIZE
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+import asyncpg
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from logger_config import logger
+
+
+class EngineRegistry:
+    """Реестр движков SQLAlchemy и пула asyncpg (один экземпляр на процесс)"""
+
+    def __init__(self):
+        self.conf = settings.db_pool
+        self._sync_engine: Optional[Engine] = None
+        self._async_engine: Optional[AsyncEngine] = None
+        self._session_factory: Optional[sessionmaker] = None
+        self._async_session_factory: Optional[async_sessionmaker] = None
+        self._pg_pool: Optional[asyncpg.Pool] = None
+        self._pg_pool_lock = asyncio.Lock()
+        # Счетчики использования пула asyncpg
+        self._pg_stats = {"acquired": 0, "released": 0, "errors": 0}
+
+    # ==================== SQLAlchemy ====================
+
+    def _pool_kwargs(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.conf.sa_pool_size,
+            "max_overflow": self.conf.sa_max_overflow,
+            "pool_timeout": self.conf.sa_pool_timeout,
+            "pool_recycle": self.conf.pool_recycle,
+            "pool_pre_ping": self.conf.pool_pre_ping,
+            "echo": self.conf.echo,
+        }
+
+    @property
+    def sync_engine(self) -> Engine:
+        """Синхронный engine (psycopg2) - app_notif, trainer_salary, утилиты"""
+        if self._sync_engine is None:
+            self._sync_engine = create_engine(
+                settings.db.db_url,
+                connect_args={"options": "-c timezone=Europe/Moscow"},
+                **self._pool_kwargs()
+            )
+        return self._sync_engine
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        """Асинхронный engine (asyncpg) - роутеры FastAPI и авторизация"""
+        if self._async_engine is None:
+            self._async_engine = create_async_engine(settings.db.db_url_asinc, **self._pool_kwargs())
+        return self._async_engine
+
+    @property
+    def session_factory(self) -> sessionmaker:
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.sync_engine)
+        return self._session_factory
+
+    @property
+    def async_session_factory(self) -> async_sessionmaker:
+        if self._async_session_factory is None:
+            self._async_session_factory = async_sessionmaker(
+                self.async_engine,
+                class_=AsyncSession,
+                expire_on_commit=False,
+                autocommit=False,
+                autoflush=False,
+            )
+        return self._async_session_factory
+
+    # ==================== asyncpg ====================
+
+    async def init_pg_pool(self) -> asyncpg.Pool:
+        """Создает пул asyncpg, если он еще не создан, и возвращает его"""
+        if self._pg_pool is not None and not self._pg_pool.is_closing():
+            return self._pg_pool
+
+        async with self._pg_pool_lock:
+            if self._pg_pool is not None and not self._pg_pool.is_closing():
+                return self._pg_pool
+
+            server_settings = {}
+            if self.conf.statement_timeout_ms:
+                server_settings["statement_timeout"] = str(self.conf.statement_timeout_ms)
+
+            self._pg_pool = await asyncpg.create_pool(
+                **settings.db.pg_link,
+                min_size=self.conf.min_size,
+                max_size=self.conf.max_size,
+                command_timeout=self.conf.command_timeout,
+                max_inactive_connection_lifetime=self.conf.max_inactive_connection_lifetime,
+                server_settings=server_settings,
+            )
+            logger.info(f"🏊 Пул соединений asyncpg создан (min={self.conf.min_size}, max={self.conf.max_size})")
+            return self._pg_pool
+
+    async def get_pg_pool(self) -> asyncpg.Pool:
+        """Возвращает пул asyncpg, создавая его при первом обращении"""
+        if self._pg_pool is None or self._pg_pool.is_closing():
+            return await self.init_pg_pool()
+        return self._pg_pool
+
+    async def close_pg_pool(self):
+        """Корректно закрывает пул asyncpg"""
+        if self._pg_pool is None:
+            return
+
+        pool, self._pg_pool = self._pg_pool, None
+        try:
+            await asyncio.wait_for(pool.close(), timeout=10)
+            logger.info("🏊 Пул соединений asyncpg закрыт")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при закрытии пула соединений: {e}")
+            pool.terminate()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Берет соединение из пула asyncpg и возвращает его обратно после использования"""
+        pool = await self.get_pg_pool()
+        async with pool.acquire() as conn:
+            self._pg_stats["acquired"] += 1
+            try:
+                yield conn
+            except Exception:
+                self._pg_stats["errors"] += 1
+                raise
+            finally:
+                self._pg_stats["released"] += 1
+
+    # ==================== Общее ====================
+
+    async def dispose(self):
+        """Закрывает все пулы процесса (вызывается при остановке)"""
+        await self.close_pg_pool()
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+        if self._sync_engine is not None:
+            self._sync_engine.dispose()
+        logger.info("🔌 Подключения к базе данных закрыты")
+
+    def pg_pool_stats(self) -> Dict[str, Any]:
+        """Статистика использования пула asyncpg"""
+        stats: Dict[str, Any] = dict(self._pg_stats)
+        stats["in_use"] = self._pg_stats["acquired"] - self._pg_stats["released"]
+
+        if self._pg_pool is None:
+            stats.update({"initialized": False, "size": 0, "idle": 0})
+            return stats
+
+        stats.update({
+            "initialized": True,
+            "size": self._pg_pool.get_size(),
+            "idle": self._pg_pool.get_idle_size(),
+            "min_size": self._pg_pool.get_min_size(),
+            "max_size": self._pg_pool.get_max_size(),
+        })
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика по всем пулам процесса"""
+        result: Dict[str, Any] = {"asyncpg": self.pg_pool_stats()}
+        if self._sync_engine is not None:
+            result["sync_engine"] = self._sync_engine.pool.status()
+        if self._async_engine is not None:
+            result["async_engine"] = self._async_engine.pool.status()
+        return result
+
+
+engines = EngineRegistry()
+
+
+# Функции-обертки для сырого SQL через asyncpg
+async def init_pool() -> asyncpg.Pool:
+    return await engines.init_pg_pool()
+
+
+async def close_pool():
+    await engines.close_pg_pool()
+
+
+def acquire():
+    return engines.acquire()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return engines.stats()
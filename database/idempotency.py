@@ -0,0 +1,65 @@
+"""
+Ключи идемпотентности для повторяемых POST-запросов.
+
+Клиент (офлайн-очередь страницы /visits-today/) присваивает каждому пакету
+ключ и повторяет отправку, пока не получит ответ. Сервер запоминает ответ
+на пакет в Redis (idempotency:<scope>:<key>) на TTL секунд, и повторная
+отправка того же пакета получает тот же ответ без повторной обработки.
+
+Без Redis ключи не хранятся: повтор обрабатывается заново, поэтому сама
+операция тоже должна быть безопасной для повтора (ON CONFLICT DO NOTHING).
+"""
+import json
+from typing import Any, Dict, Iterable
+
+from database.redis.redis_config import LazyRedis
+from logger_config import logger
+
+KEY = "idempotency:{scope}:{key}"
+DEFAULT_TTL = 2 * 24 * 3600
+
+
+class IdempotencyStore:
+    """Сохраненные ответы на пакеты по ключу клиента"""
+
+    def __init__(self, scope: str, ttl: int = DEFAULT_TTL):
+        self.scope = scope
+        self.ttl = ttl
+        self._redis = LazyRedis(f"Идемпотентность ({scope})")
+        self._stats = {"replayed": 0, "stored": 0}
+
+    def _key(self, key: str) -> str:
+        return KEY.format(scope=self.scope, key=key)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Ранее сохраненные ответы: ключ -> ответ"""
+        keys = list(keys)
+        client = self._redis.get()
+        if not keys or client is None:
+            return {}
+        try:
+            values = await client.mget([self._key(key) for key in keys])
+        except Exception as e:
+            logger.warning(f"⚠️ Идемпотентность ({self.scope}): не удалось прочитать ключи: {e}")
+            return {}
+
+        found = {key: json.loads(value) for key, value in zip(keys, values) if value}
+        self._stats["replayed"] += len(found)
+        return found
+
+    async def store_many(self, responses: Dict[str, Any]):
+        """Запомнить ответы на пакеты (одним pipeline)"""
+        client = self._redis.get()
+        if not responses or client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for key, response in responses.items():
+                    pipe.set(self._key(key), json.dumps(response, ensure_ascii=False, default=str), ex=self.ttl)
+                await pipe.execute()
+            self._stats["stored"] += len(responses)
+        except Exception as e:
+            logger.warning(f"⚠️ Идемпотентность ({self.scope}): не удалось сохранить ответы: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
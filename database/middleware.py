@@ -1,7 +1,6 @@
 import json
 from fastapi import Request, HTTPException
 from fastapi.responses import RedirectResponse
-import httpx
 import secrets
 from urllib.parse import urlencode, urlparse
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -9,8 +8,10 @@ from starlette.types import ASGIApp
 from logger_config import logger
 from typing import Optional, Dict, Any, Set, List
 # Импортируем функции для обычной авторизации
-from database.auth import get_current_user_from_token
+from database.auth import decode_token, principal_from_claims, refresh_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 from database.models import get_db_async
+from database.token_revocation import token_revocation
+from database.superset_session import superset_validator
 import jwt
 
 
@@ -36,13 +37,10 @@ class DualAuthMiddleware(BaseHTTPMiddleware):
             "/local-login",
             "/api/auth/login",  # ✅ API для входа
             "/api/auth/register",  # ✅ API для регистрации
+            "/api/auth/refresh",  # ✅ API для обновления токена
             "/api/auth/me",  # ✅ API для проверки пользователя
             "/debug/"
         ]
-        self.check_urls = [
-            "http://localhost:8088",
-            "http://172.17.0.1:8088"
-        ]
 
     async def dispatch(self, request: Request, call_next):
         # Пропускаем исключенные пути
@@ -66,13 +64,20 @@ class DualAuthMiddleware(BaseHTTPMiddleware):
             if jwt_cookie:
                 user_info = await self._authenticate_jwt(request, jwt_cookie)
 
-        # 3. Если нет JWT, пробуем авторизацию через Superset
+        # 3. Access-токен истек или отозван - молча обновляем по refresh-токену
+        refreshed_token = None
+        if not user_info:
+            refresh_cookie = request.cookies.get("refresh_token")
+            if refresh_cookie:
+                refreshed_token, user_info = await self._refresh_jwt(refresh_cookie)
+
+        # 4. Если нет JWT, пробуем авторизацию через Superset
         if not user_info:
             session_cookie = request.cookies.get("session")
             if session_cookie:
                 user_info = await self._authenticate_superset(session_cookie)
 
-        # 4. Если ни один способ не сработал
+        # 5. Если ни один способ не сработал
         if not user_info:
             logger.warning("❌ Пользователь не авторизован")
             # Перенаправляем на страницу выбора способа входа
@@ -82,84 +87,46 @@ class DualAuthMiddleware(BaseHTTPMiddleware):
         request.state.user = user_info
         logger.info(f"✅ Пользователь авторизован: {user_info.get('username', 'Unknown')}")
 
-        return await call_next(request)
+        response = await call_next(request)
+        if refreshed_token:
+            response.set_cookie(
+                key="access_token",
+                value=refreshed_token,
+                secure=request.url.scheme == "https",
+                max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+                samesite="strict",
+                path="/"
+            )
+        return response
 
     async def _authenticate_jwt(self, request: Request, token: str) -> Optional[Dict[str, Any]]:
-        """Аутентификация через JWT токен"""
+        """Аутентификация через JWT токен: подпись и клеймы, без запроса в БД"""
         try:
-            async with get_db_async() as db:
-                user = await get_current_user_from_token(db, token)
-                if user:
-                    return {
-                        "authenticated": True,
-                        "username": user.full_name or user.phone,
-                        "user_id": user.telegram_id,
-                        "phone": user.phone,
-                        "email": user.email,
-                        "auth_type": "jwt"
-                    }
+            payload = decode_token(token)
+            if payload and await token_revocation.is_current(payload):
+                return principal_from_claims(payload)
         except Exception as e:
             logger.debug(f"🔹 Ошибка JWT аутентификации: {e}")
 
         return None
 
-    async def _authenticate_superset(self, session_cookie: str) -> Optional[Dict[str, Any]]:
-        """Аутентификация через Superset (старый способ)"""
-        for base_url in self.check_urls:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{base_url}/api/v1/dashboard/",
-                        cookies={"session": session_cookie},
-                        timeout=3.0,
-                        follow_redirects=True
-                    )
-
-                    final_url = str(response.url)
-                    logger.debug(f"🔹 {base_url}: final URL = {final_url}, status = {response.status_code}")
-
-                    if '/login/' not in final_url and response.status_code in [200, 403]:
-                        # Пытаемся получить имя пользователя
-                        username = await self._get_superset_username(session_cookie)
-                        return {
-                            "authenticated": True,
-                            "username": username,
-                            "auth_type": "superset"
-                        }
-
-                    if '/login/' in final_url:
-                        return None
-
-            except Exception as e:
-                logger.debug(f"🔹 {base_url}: ошибка - {e}")
-                continue
-
-        return None
-
-    async def _get_superset_username(self, session_cookie: str) -> str:
-        """Безопасное получение имени пользователя из Superset"""
-        for base_url in self.check_urls:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{base_url}/api/v1/me",
-                        cookies={"session": session_cookie},
-                        timeout=2.0,
-                        follow_redirects=False
-                    )
-
-                    if response.status_code == 200:
-                        user_data = response.json()
-                        username = user_data.get('username')
-                        if username:
-                            logger.debug(f"🔹 Получено имя пользователя: {username}")
-                            return username
+    async def _refresh_jwt(self, refresh_token: str):
+        """(новый access-токен, user_info) или (None, None)"""
+        try:
+            async with get_db_async() as db:
+                refreshed = await refresh_access_token(db, refresh_token)
+            if refreshed:
+                access_token, claims = refreshed
+                logger.info(f"🔄 Access-токен обновлен для {claims.get('sub')}")
+                return access_token, principal_from_claims(claims)
+        except Exception as e:
+            logger.debug(f"🔹 Ошибка обновления JWT: {e}")
 
-            except Exception as e:
-                logger.debug(f"🔹 Ошибка получения имени пользователя: {e}")
-                continue
+        return None, None
 
-        return "Пользователь (Superset)"
+    async def _authenticate_superset(self, session_cookie: str) -> Optional[Dict[str, Any]]:
+        """Аутентификация через Superset (старый способ), результат кэшируется"""
+        return await superset_validator.validate(session_cookie)
 
     def _should_exclude_path(self, path: str) -> bool:
         for excluded in self.excluded_paths:
@@ -1,26 +1,21 @@
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-from sqlalchemy import create_engine, Column, Integer, String, MetaData, Date, Boolean, ForeignKey, DateTime, Time, \
-    BigInteger, UniqueConstraint
-from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import Column, Integer, String, MetaData, Date, Boolean, ForeignKey, DateTime, Time, \
+    BigInteger, UniqueConstraint, Index, text
+from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
-from config import settings
-
-engine = create_engine(settings.db.db_url, connect_args={"options": "-c timezone=Europe/Moscow"})
-engine_async = create_async_engine(
-    settings.db.db_url_asinc,
-    echo=True,  # Включите для отладки SQL запросов
-    pool_pre_ping=True,  # Проверять соединение перед использованием
-    pool_recycle=3600,  # Пересоздавать соединение каждые 3600 секунд
-)
+from database.engines import engines
+
+# Движки и пулы создаются в database.engines (один набор на процесс)
+engine = engines.sync_engine
+engine_async = engines.async_engine
 Base = declarative_base()
 metadata = MetaData()
 
 schema = 'public'
 
 # Создаем сессию базы данных
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = engines.session_factory
 
 
 # Зависимость для получения сессии БД
@@ -33,13 +28,16 @@ def get_db():
 
 
 # Асинхронная фабрика сессий
-AsyncSessionLocal = async_sessionmaker(
-    engine_async,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False,
-)
+AsyncSessionLocal = engines.async_session_factory
+
+
+async def get_async_db():
+    """
+    Зависимость FastAPI: асинхронная сессия БД на время запроса
+    Использование: db: AsyncSession = Depends(get_async_db)
+    """
+    async with AsyncSessionLocal() as session:
+        yield session
 
 
 @asynccontextmanager
@@ -59,7 +57,13 @@ async def get_db_async():
 # Посещения
 class Visits(Base):
     __tablename__ = 'visit'
-    __table_args__ = {'schema': schema}
+    __table_args__ = (
+        Index('ix_visit_student_data', 'student', 'data'),
+        Index('ix_visit_shedule_data', 'shedule', 'data'),
+        # Одна отметка ученика на тренировке за день: db_handler/attendance_service.py
+        Index('uq_visit_student_shedule_day', 'student', 'shedule', text('(data::date)'), unique=True),
+        {'schema': schema}
+    )
     id = Column(Integer(), primary_key=True, autoincrement=True)
     data = Column(DateTime())
     trainer = Column(Integer())
@@ -72,11 +76,18 @@ class Visits(Base):
 # Посещения
 class Lesson_write_offs(Base):
     __tablename__ = 'lesson_write_offs'
-    __table_args__ = {'schema': schema}
+    __table_args__ = (
+        Index('ix_lesson_write_offs_student_data', 'student_id', 'data'),
+        # Повторный запуск списания за тот же день не списывает занятия второй раз
+        Index('uq_lesson_write_offs_student_data_reason', 'student_id', 'data', 'reason',
+              unique=True, postgresql_where=text('reason IS NOT NULL')),
+        {'schema': schema}
+    )
     id = Column(Integer(), primary_key=True, autoincrement=True)
-    data = Column(DateTime())
+    data = Column(DateTime())  # день списания (00:00)
     student_id = Column(Integer())
     quantity = Column(Integer())
+    reason = Column(String())  # за что списано: db_handler/write_off_ledger.py
 
 
 # Ученики
@@ -109,7 +120,11 @@ class Students(Base):
 # Связь ученики-расписание
 class Students_schedule(Base):
     __tablename__ = 'student_schedule'
-    __table_args__ = {'schema': schema}
+    __table_args__ = (
+        UniqueConstraint('student', 'schedule', name='uq_student_schedule_student_schedule'),
+        Index('ix_student_schedule_schedule', 'schedule'),
+        {'schema': schema}
+    )
 
     id = Column(Integer(), primary_key=True, autoincrement=True)
     student = Column(Integer())
@@ -119,7 +134,11 @@ class Students_schedule(Base):
 # Связь ученики-родители
 class Students_parents(Base):
     __tablename__ = 'students_parents'
-    __table_args__ = {'schema': schema}
+    __table_args__ = (
+        UniqueConstraint('student', 'parents', name='uq_students_parents_student_parents'),
+        Index('ix_students_parents_parents', 'parents'),
+        {'schema': schema}
+    )
 
     id = Column(Integer(), primary_key=True, autoincrement=True)
     student = Column(Integer())  # student.id
@@ -168,7 +187,10 @@ class Payment(Base):
     Факт оплаты
     """
     __tablename__ = 'payment'
-    __table_args__ = {'schema': schema}
+    __table_args__ = (
+        Index('ix_payment_student_date', 'student_id', 'payment_date'),
+        {'schema': schema}
+    )
     id = Column(Integer(), primary_key=True, autoincrement=True)
     student_id = Column(Integer())
     price_id = Column(Integer())
@@ -385,7 +407,12 @@ class MedCertificat_received(Base):
     Факт получения справки (разрешалки)
     """
     __tablename__ = 'medcertificat_received'
-    __table_args__ = {'schema': schema}
+    __table_args__ = (
+        Index('ix_medcertificat_received_student_date_end', 'student_id', 'date_end'),
+        Index('ix_medcertificat_received_active', 'student_id', 'cert_id', 'date_end',
+              postgresql_where=text('active')),
+        {'schema': schema}
+    )
     id = Column(Integer(), primary_key=True, autoincrement=True)
     student_id = Column(Integer())
     cert_id = Column(Integer())  # id справки из medcertificat_type
@@ -409,6 +436,53 @@ class MedicalCertificates(Base):
     processed_date = Column(Date())
 
 
+class Closure_day(Base):
+    """
+    Праздники и дни, когда зал закрыт: занятия в эти дни не проводятся
+    и не учитываются в расчетах по расписанию (db_handler/schedule_calendar.py)
+    """
+    __tablename__ = 'closure_day'
+    __table_args__ = (
+        UniqueConstraint('day', name='uq_closure_day_day'),
+        {'schema': schema}
+    )
+    id = Column(Integer(), primary_key=True, autoincrement=True)
+    day = Column(Date(), nullable=False)
+    description = Column(String())
+
+
+class Broadcast(Base):
+    """
+    Рассылка в бот уведомлений: приглашение на соревнование, новости, оплата
+    (получатели и статусы - broadcast_delivery, отправка - db_handler/broadcast_worker.py)
+    """
+    __tablename__ = 'broadcast'
+    __table_args__ = {'schema': schema}
+    id = Column(Integer(), primary_key=True, autoincrement=True)
+    kind = Column(String(), nullable=False)  # competition / news / pays
+    ref_id = Column(Integer())  # например competition.id
+    text = Column(String(), nullable=False)  # {student} - имя ребенка получателя
+    created_at = Column(DateTime(), nullable=False, server_default=func.now())
+
+
+class Broadcast_delivery(Base):
+    """Доставка рассылки одному получателю"""
+    __tablename__ = 'broadcast_delivery'
+    __table_args__ = (
+        UniqueConstraint('broadcast_id', 'telegram_id', 'student_id', name='uq_broadcast_delivery_recipient'),
+        Index('ix_broadcast_delivery_pending', 'next_attempt_at', postgresql_where=text("status = 'pending'")),
+        {'schema': schema}
+    )
+    id = Column(Integer(), primary_key=True, autoincrement=True)
+    broadcast_id = Column(Integer(), ForeignKey(f'{schema}.broadcast.id', ondelete='CASCADE'), nullable=False)
+    telegram_id = Column(BigInteger(), nullable=False)
+    student_id = Column(Integer(), nullable=False, server_default='0')  # 0 - рассылка не про ребенка
+    status = Column(String(), nullable=False, server_default='pending')  # pending / sent / failed / blocked
+    attempts = Column(Integer(), nullable=False, server_default='0')
+    next_attempt_at = Column(DateTime(), nullable=False, server_default=func.now())
+    sent_at = Column(DateTime())
+    last_error = Column(String())
+
 
 if __name__ == "__main__":
     Base.metadata.create_all(engine)
@@ -1,8 +1,12 @@
+import time
+from typing import Any, Callable, Optional
+
 import redis.asyncio as redis
 from config import settings
-import logging
+from logger_config import logger
 
-logger = logging.getLogger(__name__)
+# Повторная попытка подключиться к Redis после неудачи - не раньше, чем через столько секунд
+REDIS_RETRY_AFTER = 60
 
 
 def get_redis_client() -> redis.Redis:
@@ -28,4 +32,35 @@ def get_redis_client() -> redis.Redis:
 
     except Exception as e:
         logger.error(f"❌ Failed to initialize Redis client: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class LazyRedis:
+    """
+    Клиент Redis, создаваемый при первом обращении (кэши, отзыв токенов, события).
+
+    get() возвращает клиент или None, если Redis недоступен: вызывающий в этом
+    случае работает без Redis. После неудачи новая попытка создать клиент -
+    не раньше, чем через REDIS_RETRY_AFTER секунд.
+    """
+
+    def __init__(self, owner: str, factory: Optional[Callable[[], Any]] = None, fallback: str = ""):
+        self.owner = owner
+        self.fallback = fallback
+        self._factory = factory or get_redis_client
+        self._client = None
+        self._failed_at: Optional[float] = None
+
+    def get(self):
+        if self._client is not None:
+            return self._client
+        if self._failed_at is not None and time.monotonic() - self._failed_at < REDIS_RETRY_AFTER:
+            return None
+        try:
+            self._client = self._factory()
+        except Exception as e:
+            suffix = f", {self.fallback}" if self.fallback else ""
+            logger.warning(f"⚠️ {self.owner}: Redis недоступен ({e}){suffix}")
+        if self._client is None:
+            self._failed_at = time.monotonic()
+        return self._client
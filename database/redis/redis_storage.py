@@ -61,6 +61,14 @@ class RedisStorage:
         except Exception as e:
             logger.error(f"Error setting user data for user {user_id}, key {key}: {e}")
 
+    async def delete_user_data(self, user_id: int, key: str):
+        """Удалить данные пользователя по ключу"""
+        try:
+            redis_key = self._get_session_key(user_id, key)
+            await self.redis.delete(redis_key)
+        except Exception as e:
+            logger.error(f"Error deleting user data for user {user_id}, key {key}: {e}")
+
     async def get_user_data(self, user_id: int, key: str) -> Optional[dict]:
         """Универсальный метод для получения данных пользователя"""
         try:
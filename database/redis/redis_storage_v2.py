@@ -0,0 +1,177 @@
+"""
+RedisStorage v2: выбор учеников - хэш Redis, данные пользователя - msgpack.
+
+Выбор учеников хранится в хэше bot:user:<id>:selected (student_id -> имя),
+поэтому нажатие на ученика - одна атомарная команда (скрипт Lua toggle:
+HDEL или HSET + EXPIRE) вместо чтения, правки и записи всего JSON.
+Два быстрых нажатия больше не теряют друг друга.
+
+set_user_data пишет msgpack (если пакет установлен), с байтом-меткой
+MSGPACK_TAG в начале; get_user_data читает и msgpack, и старый JSON,
+поэтому ключи, записанные RedisStorage v1, продолжают работать.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional
+
+import redis.asyncio as redis
+import logging
+
+from database.redis.redis_storage import RedisStorage
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# 0xC1 никогда не используется в msgpack и не начинает JSON
+MSGPACK_TAG = b"\xc1"
+
+# KEYS[1] - хэш выбора; ARGV: student_id, имя, ttl. Возвращает 1, если ученик выбран
+TOGGLE_SCRIPT = """
+local selected = 0
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    selected = 1
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return selected
+"""
+
+SELECTION_TTL = 3600
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Unsupported type: {type(value)}")
+
+
+def encode(data: Any) -> bytes:
+    if msgpack is not None:
+        return MSGPACK_TAG + msgpack.packb(data, default=_default, use_bin_type=True)
+    return json.dumps(data, ensure_ascii=False, default=_default).encode()
+
+
+def decode(raw: Optional[bytes]) -> Any:
+    if not raw:
+        return None
+    if raw[:1] == MSGPACK_TAG:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(raw[1:], raw=False)
+    return json.loads(raw)
+
+
+def _binary_client(client: redis.Redis) -> redis.Redis:
+    """Клиент к тому же Redis без decode_responses (msgpack - не UTF-8)"""
+    pool = client.connection_pool
+    kwargs = {**pool.connection_kwargs, "decode_responses": False}
+    return redis.Redis(connection_pool=redis.ConnectionPool(connection_class=pool.connection_class, **kwargs))
+
+
+class RedisStorageV2(RedisStorage):
+    def __init__(self, redis_client: redis.Redis):
+        super().__init__(redis_client)
+        self.raw = _binary_client(redis_client)
+        self._toggle = redis_client.register_script(TOGGLE_SCRIPT)
+
+    def _get_selection_key(self, user_id: int) -> str:
+        return f"bot:user:{user_id}:selected"
+
+    # ==================== Выбор учеников ====================
+
+    async def get_selected_students(self, user_id: int) -> Dict[str, str]:
+        """Получить выбранных студентов для пользователя"""
+        try:
+            return await self.redis.hgetall(self._get_selection_key(user_id))
+        except Exception as e:
+            logger.error(f"Error getting selected students for user {user_id}: {e}")
+            return {}
+
+    async def set_selected_students(self, user_id: int, students: Dict[str, str], ttl: int = SELECTION_TTL):
+        """Заменить выбор студентов целиком"""
+        try:
+            key = self._get_selection_key(user_id)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                if students:
+                    pipe.hset(key, mapping=students)
+                    pipe.expire(key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error setting selected students for user {user_id}: {e}")
+
+    async def toggle_student(self, user_id: int, student_id: str, student_name: str,
+                             ttl: int = SELECTION_TTL) -> bool:
+        """Выбрать или снять студента одной атомарной командой; True - студент выбран"""
+        key = self._get_selection_key(user_id)
+        return bool(await self._toggle(keys=[key], args=[student_id, student_name, ttl]))
+
+    async def add_student(self, user_id: int, student_id: str, student_name: str):
+        """Добавить студента в выбор"""
+        try:
+            key = self._get_selection_key(user_id)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, student_id, student_name)
+                pipe.expire(key, SELECTION_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error adding student {student_id} for user {user_id}: {e}")
+
+    async def remove_student(self, user_id: int, student_id: str):
+        """Удалить студента из выбора"""
+        try:
+            await self.redis.hdel(self._get_selection_key(user_id), student_id)
+        except Exception as e:
+            logger.error(f"Error removing student {student_id} for user {user_id}: {e}")
+
+    async def clear_selected_students(self, user_id: int):
+        """Очистить выбор студентов для пользователя"""
+        try:
+            await self.redis.delete(self._get_selection_key(user_id))
+        except Exception as e:
+            logger.error(f"Error clearing selected students for user {user_id}: {e}")
+
+    # ==================== Данные пользователя ====================
+
+    async def set_user_data(self, user_id: int, key: str, data: Any, ttl: int = 3600):
+        """Универсальный метод для сохранения данных пользователя"""
+        try:
+            await self.raw.setex(self._get_session_key(user_id, key), ttl, encode(data))
+        except Exception as e:
+            logger.error(f"Error setting user data for user {user_id}, key {key}: {e}")
+
+    async def get_user_data(self, user_id: int, key: str) -> Optional[Any]:
+        """Универсальный метод для получения данных пользователя"""
+        try:
+            return decode(await self.raw.get(self._get_session_key(user_id, key)))
+        except Exception as e:
+            logger.error(f"Error getting user data for user {user_id}, key {key}: {e}")
+            return None
+
+    async def get_user_data_many(self, user_id: int, keys: Iterable[str]) -> Dict[str, Any]:
+        """Несколько ключей пользователя одним MGET: ключ -> данные (без отсутствующих)"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            values = await self.raw.mget([self._get_session_key(user_id, key) for key in keys])
+            return {key: decode(value) for key, value in zip(keys, values) if value}
+        except Exception as e:
+            logger.error(f"Error getting user data for user {user_id}, keys {keys}: {e}")
+            return {}
+
+    async def set_user_data_many(self, user_id: int, items: Dict[str, Any], ttl: int = 3600):
+        """Несколько ключей пользователя одним pipeline"""
+        if not items:
+            return
+        try:
+            async with self.raw.pipeline(transaction=False) as pipe:
+                for key, data in items.items():
+                    pipe.setex(self._get_session_key(user_id, key), ttl, encode(data))
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error setting user data for user {user_id}, keys {list(items)}: {e}")
@@ -0,0 +1,191 @@
+"""
+Кэш справочников в памяти процесса.
+
+Справочники (виды спорта, тренеры, тарифы, разряды, пояса, типы справок,
+залы) меняются несколько раз в год, а читаются почти на каждой странице.
+ReferenceCache держит их строки в памяти процесса:
+
+- у каждой таблицы свой TTL, по истечении которого строки перечитываются;
+- у каждой таблицы есть версия в Redis (ref_cache:version:<таблица>).
+  Запись в справочник вызывает invalidate(), который увеличивает версию,
+  и остальные процессы (бот, app_notif, cron) перечитают таблицу при
+  следующей проверке версии. Проверка делается не чаще раза в
+  VERSION_CHECK_INTERVAL секунд, поэтому горячие страницы не ходят ни в
+  Postgres, ни в Redis.
+
+Строки отдаются как dict: в шаблонах Jinja доступ через точку работает так же,
+как для ORM-объектов.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+from database.engines import acquire
+from database.models import schema
+from database.redis.redis_config import LazyRedis, get_redis_client
+from logger_config import logger
+
+
+@dataclass
+class _Entry:
+    rows: List[Dict[str, Any]]
+    by_id: Dict[int, Dict[str, Any]]
+    version: int
+    loaded_at: float
+    checked_at: float
+
+
+@dataclass
+class _Table:
+    name: str
+    ttl: float
+    order_by: str = "id"
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class ReferenceCache:
+    """Кэш справочных таблиц с TTL и версионированием"""
+
+    VERSION_KEY = "ref_cache:version:{table}"
+
+    def __init__(self, tables: Dict[str, float], redis_client_factory: Optional[Callable] = None):
+        self.conf = settings.reference_cache
+        self._tables = {name: _Table(name=name, ttl=ttl) for name, ttl in tables.items()}
+        self._entries: Dict[str, _Entry] = {}
+        # Redis нужен только для версий; без него кэш работает локально по TTL
+        self._redis = LazyRedis("Кэш справочников", factory=redis_client_factory or (lambda: None),
+                                fallback="работаем только по TTL")
+        self._stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    # ==================== Redis ====================
+
+    async def _remote_version(self, table: str) -> Optional[int]:
+        client = self._redis.get()
+        if client is None:
+            return None
+        try:
+            value = await client.get(self.VERSION_KEY.format(table=table))
+            return int(value) if value else 0
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш справочников: не удалось прочитать версию {table}: {e}")
+            return None
+
+    # ==================== Чтение ====================
+
+    def _table(self, table: str) -> _Table:
+        try:
+            return self._tables[table]
+        except KeyError:
+            raise KeyError(f"Таблица {table} не зарегистрирована в кэше справочников")
+
+    async def _is_fresh(self, table: _Table, entry: Optional[_Entry]) -> bool:
+        if entry is None:
+            return False
+        now = time.monotonic()
+        if now - entry.loaded_at >= table.ttl:
+            return False
+        if now - entry.checked_at < self.conf.version_check_interval:
+            return True
+
+        remote = await self._remote_version(table.name)
+        entry.checked_at = now
+        return remote is None or remote == entry.version
+
+    async def _load(self, table: _Table) -> _Entry:
+        version = await self._remote_version(table.name)
+        async with acquire() as conn:
+            records = await conn.fetch(f"SELECT * FROM {schema}.{table.name} ORDER BY {table.order_by}")
+
+        rows = [dict(r) for r in records]
+        now = time.monotonic()
+        entry = _Entry(
+            rows=rows,
+            by_id={row["id"]: row for row in rows if "id" in row},
+            version=version or 0,
+            loaded_at=now,
+            checked_at=now,
+        )
+        self._entries[table.name] = entry
+        self._stats["loads"] += 1
+        logger.debug(f"📚 Кэш справочников: {table.name} загружен ({len(rows)} строк)")
+        return entry
+
+    async def _entry(self, table_name: str) -> _Entry:
+        table = self._table(table_name)
+        entry = self._entries.get(table_name)
+        if await self._is_fresh(table, entry):
+            self._stats["hits"] += 1
+            return entry
+
+        stale = entry
+        async with table.lock:
+            # Пока ждали блокировку, таблицу мог перечитать другой запрос
+            entry = self._entries.get(table_name)
+            if entry is not None and entry is not stale:
+                return entry
+            return await self._load(table)
+
+    async def all(self, table: str) -> List[Dict[str, Any]]:
+        """Все строки справочника"""
+        return (await self._entry(table)).rows
+
+    async def active(self, table: str) -> List[Dict[str, Any]]:
+        """Строки справочника с active = true"""
+        return [row for row in await self.all(table) if row.get("active")]
+
+    async def by_id(self, table: str) -> Dict[int, Dict[str, Any]]:
+        """Справочник в виде {id: строка}"""
+        return (await self._entry(table)).by_id
+
+    async def get(self, table: str, row_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Одна строка справочника по id"""
+        if row_id is None:
+            return None
+        try:
+            row_id = int(row_id)
+        except (TypeError, ValueError):
+            return None
+        return (await self.by_id(table)).get(row_id)
+
+    # ==================== Инвалидация ====================
+
+    async def invalidate(self, *tables: str):
+        """
+        Сбросить кэш таблиц (вызывается после записи в справочник)
+        Без аргументов - сбросить все таблицы
+        """
+        names = tables or tuple(self._tables)
+        for name in names:
+            self._table(name)
+            self._entries.pop(name, None)
+            self._stats["invalidations"] += 1
+
+        client = self._redis.get()
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for name in names:
+                    pipe.incr(self.VERSION_KEY.format(table=name))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш справочников: не удалось обновить версию {names}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "tables": {name: len(entry.rows) for name, entry in self._entries.items()}}
+
+
+reference_cache = ReferenceCache(
+    tables={
+        "sport": settings.reference_cache.default_ttl,
+        "trainer": settings.reference_cache.trainer_ttl,
+        "price": settings.reference_cache.default_ttl,
+        "sport_rank": settings.reference_cache.default_ttl,
+        "belt_color": settings.reference_cache.default_ttl,
+        "medcertificat_type": settings.reference_cache.default_ttl,
+        "training_place": settings.reference_cache.default_ttl,
+    },
+    redis_client_factory=get_redis_client,
+)
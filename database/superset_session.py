@@ -0,0 +1,222 @@
+"""
+Проверка cookie сессии Superset с кэшем и общим HTTP-клиентом.
+
+Раньше каждый запрос к странице или XHR делал до четырех холодных
+HTTP-запросов в Superset. SupersetSessionValidator:
+
+- держит один keep-alive httpx.AsyncClient на процесс;
+- кэширует результат проверки по sha256 от cookie: успешный на
+  SESSION_TTL секунд, неуспешный на NEGATIVE_TTL секунд;
+- объединяет одновременные проверки одной и той же cookie в один запрос;
+- для каждого адреса Superset ведет circuit breaker: после
+  FAILURE_THRESHOLD сетевых ошибок подряд адрес пропускается на
+  COOLDOWN секунд. Пока Superset недоступен, ранее проверенные сессии
+  продолжают работать еще STALE_GRACE секунд.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from config import settings
+from logger_config import logger
+
+DEFAULT_USERNAME = "Пользователь (Superset)"
+
+
+class _CircuitBreaker:
+    """Счетчик сетевых ошибок для одного адреса Superset"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        if self.failures < self.threshold:
+            return False
+        # После cooldown пропускаем одну пробную попытку
+        return time.monotonic() - self.opened_at < self.cooldown
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class SupersetUnavailable(Exception):
+    """Ни один адрес Superset не ответил"""
+
+
+class SupersetSessionValidator:
+    """Проверка сессий Superset (один экземпляр на процесс)"""
+
+    def __init__(self, check_urls: List[str]):
+        self.conf = settings.superset_conf
+        self.check_urls = check_urls
+        self._client: Optional[httpx.AsyncClient] = None
+        # ключ -> (время проверки, user_info или None)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._breakers = {url: _CircuitBreaker(self.conf.failure_threshold, self.conf.cooldown)
+                          for url in check_urls}
+        self._stats = {"hits": 0, "negative_hits": 0, "stale_hits": 0, "checks": 0, "errors": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.conf.request_timeout, connect=self.conf.connect_timeout),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                follow_redirects=False,
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _key(session_cookie: str) -> str:
+        return hashlib.sha256(session_cookie.encode()).hexdigest()
+
+    # ==================== Кэш ====================
+
+    def _remember(self, key: str, user_info: Optional[Dict[str, Any]]):
+        self._cache[key] = (time.monotonic(), user_info)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.conf.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cached(self, key: str):
+        """Возвращает (найдено, user_info) с учетом TTL"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+
+        checked_at, user_info = entry
+        ttl = self.conf.session_ttl if user_info else self.conf.negative_ttl
+        if time.monotonic() - checked_at < ttl:
+            self._stats["hits" if user_info else "negative_hits"] += 1
+            return True, user_info
+        return False, None
+
+    def forget(self, session_cookie: str):
+        """Убрать сессию из кэша (выход из системы)"""
+        self._cache.pop(self._key(session_cookie), None)
+
+    # ==================== Проверка ====================
+
+    async def validate(self, session_cookie: str) -> Optional[Dict[str, Any]]:
+        """user_info для валидной сессии или None"""
+        key = self._key(session_cookie)
+        found, user_info = self._cached(key)
+        if found:
+            return user_info
+
+        # Одновременные XHR с одной cookie ждут одну проверку
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            user_info = await self._check(key, session_cookie)
+            future.set_result(user_info)
+            return user_info
+        except Exception as e:
+            future.set_result(None)
+            logger.debug(f"🔹 Ошибка проверки сессии Superset: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _check(self, key: str, session_cookie: str) -> Optional[Dict[str, Any]]:
+        self._stats["checks"] += 1
+        try:
+            user_info = await self._check_remote(session_cookie)
+        except SupersetUnavailable:
+            # Superset недоступен: не разлогиниваем тех, кого недавно проверили
+            entry = self._cache.get(key)
+            if entry and entry[1] and time.monotonic() - entry[0] < self.conf.session_ttl + self.conf.stale_grace:
+                self._stats["stale_hits"] += 1
+                logger.warning("⚠️ Superset недоступен, используем ранее проверенную сессию")
+                return entry[1]
+            return None
+
+        self._remember(key, user_info)
+        return user_info
+
+    async def _check_remote(self, session_cookie: str) -> Optional[Dict[str, Any]]:
+        """Один запрос к /api/v1/me; к /api/v1/dashboard/ - только если /me не поддерживается"""
+        cookies = {"session": session_cookie}
+
+        for base_url in self.check_urls:
+            breaker = self._breakers[base_url]
+            if breaker.is_open:
+                continue
+
+            try:
+                response = await self.client.get(f"{base_url}/api/v1/me", cookies=cookies)
+                if response.status_code >= 500:
+                    raise httpx.HTTPStatusError("Superset error", request=response.request, response=response)
+                breaker.success()
+
+                if response.status_code == 200:
+                    data = response.json()
+                    username = (data.get("result") or {}).get("username") or data.get("username")
+                    return self._user_info(username or DEFAULT_USERNAME)
+
+                if response.status_code == 401 or self._is_login_redirect(response):
+                    return None
+
+                # Старые версии Superset без /api/v1/me
+                response = await self.client.get(f"{base_url}/api/v1/dashboard/", cookies=cookies,
+                                                 follow_redirects=True)
+                if '/login/' not in str(response.url) and response.status_code in (200, 403):
+                    return self._user_info(DEFAULT_USERNAME)
+                return None
+
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                breaker.failure()
+                self._stats["errors"] += 1
+                logger.debug(f"🔹 {base_url}: ошибка - {e}")
+                continue
+
+        # Ни один адрес не ответил
+        raise SupersetUnavailable()
+
+    @staticmethod
+    def _is_login_redirect(response: httpx.Response) -> bool:
+        return response.is_redirect and '/login/' in response.headers.get("location", "")
+
+    @staticmethod
+    def _user_info(username: str) -> Dict[str, Any]:
+        return {
+            "authenticated": True,
+            "username": username,
+            "auth_type": "superset"
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "cached": len(self._cache),
+            "open_circuits": [url for url, b in self._breakers.items() if b.is_open],
+        }
+
+
+superset_validator = SupersetSessionValidator(check_urls=[
+    "http://localhost:8088",
+    "http://172.17.0.1:8088"
+])
@@ -0,0 +1,155 @@
+"""
+Отзыв JWT без запроса в БД на каждый запрос.
+
+Access-токен содержит все, что нужно middleware (телефон, telegram id, имя,
+права), и проверяется только по подписи. Чтобы токен можно было отозвать
+раньше срока, в нем есть версия пользователя `ver`:
+
+- версия хранится в Redis (auth:token_version:<telegram_id>) и кэшируется
+  в памяти процесса на VERSION_CHECK_INTERVAL секунд;
+- revoke_user() увеличивает версию, и все выданные ранее access-токены
+  пользователя перестают приниматься (браузер молча получает новый
+  по refresh-токену, если пользователь все еще активен);
+- refresh-токены отзываются по jti (auth:denied:<jti>) при выходе из
+  системы. Этот список проверяется только при обновлении токена;
+- end_sessions() (смена пароля) дополнительно увеличивает поколение сессий
+  пользователя (auth:session_gen:<telegram_id>): refresh-токены с меньшим
+  `gen` больше не обновляют access-токен, и пользователь входит заново.
+  revoke_user() поколение не меняет - после смены прав браузер обновляет
+  токен молча.
+
+Без Redis версии считаются нулевыми: токены живут до истечения срока.
+"""
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+from database.redis.redis_config import LazyRedis
+from logger_config import logger
+
+VERSION_KEY = "auth:token_version:{telegram_id}"
+DENIED_KEY = "auth:denied:{jti}"
+SESSION_GEN_KEY = "auth:session_gen:{telegram_id}"
+
+
+class TokenRevocation:
+    """Версии токенов пользователей и список отозванных refresh-токенов"""
+
+    def __init__(self):
+        self.check_interval = settings.jwt.version_check_interval
+        # telegram_id -> (время проверки, версия)
+        self._versions: Dict[int, tuple] = {}
+        self._redis = LazyRedis("Отзыв токенов")
+        self._stats = {"hits": 0, "checks": 0, "rejected": 0, "revoked": 0, "sessions_ended": 0}
+
+    async def current_version(self, telegram_id: int) -> int:
+        """Текущая версия токенов пользователя"""
+        cached = self._versions.get(telegram_id)
+        if cached and time.monotonic() - cached[0] < self.check_interval:
+            self._stats["hits"] += 1
+            return cached[1]
+
+        client = self._redis.get()
+        if client is None:
+            return cached[1] if cached else 0
+        try:
+            value = await client.get(VERSION_KEY.format(telegram_id=telegram_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Отзыв токенов: не удалось прочитать версию {telegram_id}: {e}")
+            return cached[1] if cached else 0
+
+        version = int(value) if value else 0
+        self._versions[telegram_id] = (time.monotonic(), version)
+        self._stats["checks"] += 1
+        return version
+
+    async def is_current(self, payload: Dict[str, Any]) -> bool:
+        """Access-токен не отозван (версия в токене не меньше текущей)"""
+        telegram_id = payload.get("tid")
+        if telegram_id is None:
+            return False
+        if payload.get("ver", 0) < await self.current_version(telegram_id):
+            self._stats["rejected"] += 1
+            return False
+        return True
+
+    async def revoke_user(self, *telegram_ids: Optional[int]):
+        """Отозвать все выданные access-токены пользователей"""
+        client = self._redis.get()
+        for telegram_id in telegram_ids:
+            if not telegram_id:
+                continue
+            self._versions.pop(telegram_id, None)
+            self._stats["revoked"] += 1
+            if client is None:
+                continue
+            try:
+                version = await client.incr(VERSION_KEY.format(telegram_id=telegram_id))
+                self._versions[telegram_id] = (time.monotonic(), version)
+            except Exception as e:
+                logger.warning(f"⚠️ Отзыв токенов: не удалось отозвать токены {telegram_id}: {e}")
+
+    async def session_generation(self, telegram_id: int) -> int:
+        """Текущее поколение сессий пользователя (читается при входе и обновлении токена)"""
+        client = self._redis.get()
+        if client is None or telegram_id is None:
+            return 0
+        try:
+            value = await client.get(SESSION_GEN_KEY.format(telegram_id=telegram_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Отзыв токенов: не удалось прочитать поколение сессий {telegram_id}: {e}")
+            return 0
+        return int(value) if value else 0
+
+    async def is_session_current(self, payload: Dict[str, Any]) -> bool:
+        """Refresh-токен выдан в текущем поколении сессий пользователя"""
+        if payload.get("gen", 0) < await self.session_generation(payload.get("tid")):
+            self._stats["rejected"] += 1
+            return False
+        return True
+
+    async def end_sessions(self, *telegram_ids: Optional[int]):
+        """Завершить все сессии пользователей: отозвать access- и refresh-токены"""
+        await self.revoke_user(*telegram_ids)
+        client = self._redis.get()
+        for telegram_id in telegram_ids:
+            if not telegram_id:
+                continue
+            self._stats["sessions_ended"] += 1
+            if client is None:
+                continue
+            try:
+                await client.incr(SESSION_GEN_KEY.format(telegram_id=telegram_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Отзыв токенов: не удалось завершить сессии {telegram_id}: {e}")
+
+    async def deny(self, payload: Dict[str, Any]):
+        """Отозвать один refresh-токен до истечения его срока"""
+        jti = payload.get("jti")
+        client = self._redis.get()
+        if not jti or client is None:
+            return
+        ttl = int(payload.get("exp", 0) - time.time())
+        if ttl <= 0:
+            return
+        try:
+            await client.set(DENIED_KEY.format(jti=jti), 1, ex=ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Отзыв токенов: не удалось отозвать refresh-токен: {e}")
+
+    async def is_denied(self, payload: Dict[str, Any]) -> bool:
+        jti = payload.get("jti")
+        client = self._redis.get()
+        if not jti or client is None:
+            return False
+        try:
+            return bool(await client.exists(DENIED_KEY.format(jti=jti)))
+        except Exception as e:
+            logger.warning(f"⚠️ Отзыв токенов: не удалось проверить refresh-токен: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "cached": len(self._versions)}
+
+
+token_revocation = TokenRevocation()
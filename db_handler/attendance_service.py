@@ -0,0 +1,185 @@
+"""
+Отметка посещений тренировки - общий путь для бота и веб-страниц.
+
+Весь список учеников записывается одним запросом:
+
+    INSERT INTO visit ... SELECT ... FROM unnest($ids)
+    ON CONFLICT (student, shedule, (data::date)) DO NOTHING
+    RETURNING student
+
+Уникальный индекс uq_visit_student_shedule_day (миграция 0004) сам
+отбрасывает повторные отметки за день, поэтому проверка на дубль перед
+каждой вставкой не нужна. Зал и дисциплина берутся из расписания в том же
+запросе: отметка группы из 30 человек - один запрос к БД.
+
+mark_attendance_batch записывает тем же способом отметки сразу нескольких
+тренировок (офлайн-очередь страницы /visits-today/).
+
+Новые отметки публикуются в attendance_broker: открытые страницы
+/visits-today/ получают их потоком SSE без повторных запросов.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from typing import Iterable, List, Optional, Set, Tuple
+
+from database.attendance_events import attendance_broker
+from database.engines import acquire
+from database.models import schema
+from logger_config import logger
+
+
+@dataclass
+class AttendanceResult:
+    created: List[int] = field(default_factory=list)  # отмечены сейчас
+    duplicates: List[int] = field(default_factory=list)  # уже были отмечены за этот день
+    schedule_found: bool = True
+    time_start: Optional[time] = None  # начало тренировки (для отчета)
+
+    @property
+    def created_count(self) -> int:
+        return len(self.created)
+
+    @property
+    def duplicate_count(self) -> int:
+        return len(self.duplicates)
+
+
+_MARK_ATTENDANCE_SQL = f"""WITH sched AS (
+        SELECT id, training_place, sport_discipline, time_start
+        FROM {schema}.schedule
+        WHERE id = $1
+    ),
+    inserted AS (
+        INSERT INTO {schema}.visit (data, trainer, student, place, sport_discipline, shedule)
+        SELECT $2, $3, u.student, sched.training_place, sched.sport_discipline, sched.id
+        FROM unnest($4::int[]) AS u(student)
+        CROSS JOIN sched
+        ON CONFLICT (student, shedule, (data::date)) DO NOTHING
+        RETURNING student
+    )
+    SELECT EXISTS (SELECT 1 FROM sched) AS schedule_found,
+           (SELECT training_place FROM sched) AS place_id,
+           (SELECT time_start FROM sched) AS time_start,
+           ARRAY(SELECT student FROM inserted) AS created"""
+
+
+async def mark_attendance(schedule_id: int, student_ids: Iterable[int], visit_time: datetime,
+                          trainer_id: Optional[int], conn=None) -> AttendanceResult:
+    """
+    Отметить учеников на тренировке одним запросом
+    conn - соединение или Transaction, иначе соединение берется из пула
+    """
+    # Без повторов, в исходном порядке
+    student_ids = list(dict.fromkeys(int(student_id) for student_id in student_ids))
+    if not student_ids:
+        return AttendanceResult()
+
+    params = (schedule_id, visit_time, trainer_id, student_ids)
+    if conn is not None:
+        row = await conn.fetchrow(_MARK_ATTENDANCE_SQL, *params)
+    else:
+        async with acquire() as conn:
+            row = await conn.fetchrow(_MARK_ATTENDANCE_SQL, *params)
+
+    if not row['schedule_found']:
+        return AttendanceResult(schedule_found=False)
+
+    created = set(row['created'])
+    result = AttendanceResult(
+        created=[student_id for student_id in student_ids if student_id in created],
+        duplicates=[student_id for student_id in student_ids if student_id not in created],
+        time_start=row['time_start'],
+    )
+    await _publish_marked(schedule_id, row['place_id'], visit_time.date(), result.created)
+    return result
+
+
+async def _publish_marked(schedule_id: int, place_id: Optional[int], day: date, students: List[int]):
+    """Сообщить открытым страницам о новых отметках"""
+    if not students:
+        return
+    try:
+        await attendance_broker.publish({
+            "type": "marked",
+            "schedule_id": schedule_id,
+            "place_id": place_id,
+            "day": day.isoformat(),
+            "students": students,
+        })
+    except Exception as e:
+        # Отметки уже записаны: без события страницы обновятся при следующем запросе
+        logger.warning(f"⚠️ Не удалось опубликовать отметки тренировки {schedule_id}: {e}")
+
+
+@dataclass
+class AttendanceMark:
+    """Отметки одной тренировки за день; время посещения - начало тренировки"""
+    schedule_id: int
+    day: date
+    student_ids: List[int]
+
+
+_MARK_ATTENDANCE_BATCH_SQL = f"""WITH marks AS (
+        SELECT * FROM unnest($1::int[], $2::date[], $3::int[]) AS m(schedule_id, day, student)
+    ),
+    inserted AS (
+        INSERT INTO {schema}.visit (data, trainer, student, place, sport_discipline, shedule)
+        SELECT m.day + sched.time_start, $4, m.student, sched.training_place, sched.sport_discipline, sched.id
+        FROM marks m
+        JOIN {schema}.schedule sched ON sched.id = m.schedule_id
+        ON CONFLICT (student, shedule, (data::date)) DO NOTHING
+        RETURNING shedule, place, data::date AS day, student
+    )
+    SELECT shedule AS schedule_id, place AS place_id, day, student FROM inserted
+    UNION ALL
+    SELECT sched.id, sched.training_place, NULL, NULL
+    FROM {schema}.schedule sched WHERE sched.id = ANY($1::int[])"""
+
+
+async def mark_attendance_batch(marks: List[AttendanceMark], trainer_id: Optional[int],
+                                conn=None) -> List[AttendanceResult]:
+    """
+    Отметки нескольких тренировок одним запросом
+    Результаты возвращаются в порядке marks
+    """
+    schedule_ids, days, students = [], [], []
+    seen: Set[Tuple[int, date, int]] = set()
+    for mark in marks:
+        for student_id in mark.student_ids:
+            key = (mark.schedule_id, mark.day, int(student_id))
+            if key not in seen:
+                seen.add(key)
+                schedule_ids.append(key[0])
+                days.append(key[1])
+                students.append(key[2])
+    if not students:
+        return [AttendanceResult() for _ in marks]
+
+    params = (schedule_ids, days, students, trainer_id)
+    if conn is not None:
+        rows = await conn.fetch(_MARK_ATTENDANCE_BATCH_SQL, *params)
+    else:
+        async with acquire() as conn:
+            rows = await conn.fetch(_MARK_ATTENDANCE_BATCH_SQL, *params)
+
+    found = {row['schedule_id']: row['place_id'] for row in rows if row['student'] is None}
+    created = {(row['schedule_id'], row['day'], row['student']) for row in rows if row['student'] is not None}
+
+    results = []
+    reported: Set[Tuple[int, date, int]] = set()
+    for mark in marks:
+        if mark.schedule_id not in found:
+            results.append(AttendanceResult(schedule_found=False))
+            continue
+        result = AttendanceResult()
+        for student_id in dict.fromkeys(int(student_id) for student_id in mark.student_ids):
+            key = (mark.schedule_id, mark.day, student_id)
+            # Ученик, повторенный в нескольких пакетах, создан только в первом
+            if key in created and key not in reported:
+                result.created.append(student_id)
+                reported.add(key)
+            else:
+                result.duplicates.append(student_id)
+        results.append(result)
+        await _publish_marked(mark.schedule_id, found[mark.schedule_id], mark.day, result.created)
+    return results
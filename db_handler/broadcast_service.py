@@ -0,0 +1,110 @@
+"""
+Постановка рассылок в очередь (таблицы broadcast и broadcast_delivery).
+
+Получатели выбираются одним запросом вместе с созданием рассылки:
+родители учеников (students_parents -> tg_notif_user) или подписчики по
+флагу get_news / get_pays_notif. Сама отправка идет в фоне
+(db_handler/broadcast_worker.py), поэтому обработчик запроса не ждет
+Telegram. Повторная постановка того же получателя в ту же рассылку
+отбрасывается уникальным индексом.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from database.engines import acquire
+from database.models import schema
+from db_handler.broadcast_worker import broadcast_worker
+from logger_config import logger
+
+# Аудитории рассылок по флагам tg_notif_user
+AUDIENCES = {
+    "news": "get_news",
+    "pays": "get_pays_notif",
+}
+
+_ENQUEUE_PARENTS_SQL = f"""WITH b AS (
+        INSERT INTO {schema}.broadcast (kind, ref_id, text) VALUES ($1, $2, $3) RETURNING id
+    ),
+    inserted AS (
+        INSERT INTO {schema}.broadcast_delivery (broadcast_id, telegram_id, student_id)
+        SELECT b.id, nu.telegram_id, sp.student
+        FROM b
+        CROSS JOIN {schema}.students_parents sp
+        JOIN {schema}.tg_notif_user nu ON nu.id = sp.parents
+        WHERE sp.student = ANY($4::int[])
+          AND nu.is_active AND nu.telegram_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT id FROM b) AS broadcast_id, (SELECT count(*) FROM inserted) AS recipients"""
+
+_ENQUEUE_AUDIENCE_SQL = """WITH b AS (
+        INSERT INTO {schema}.broadcast (kind, ref_id, text) VALUES ($1, $2, $3) RETURNING id
+    ),
+    inserted AS (
+        INSERT INTO {schema}.broadcast_delivery (broadcast_id, telegram_id)
+        SELECT DISTINCT b.id, nu.telegram_id
+        FROM b
+        CROSS JOIN {schema}.tg_notif_user nu
+        WHERE nu.{flag} AND nu.is_active AND nu.telegram_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT id FROM b) AS broadcast_id, (SELECT count(*) FROM inserted) AS recipients"""
+
+
+async def _enqueue(sql: str, *params) -> Dict[str, int]:
+    async with acquire() as conn:
+        row = await conn.fetchrow(sql, *params)
+    result = {"broadcast_id": row["broadcast_id"], "recipients": row["recipients"]}
+    logger.info(f"📨 Рассылка {result['broadcast_id']} ({params[0]}): получателей {result['recipients']}")
+    broadcast_worker.wake()
+    return result
+
+
+async def enqueue_to_parents(kind: str, text: str, student_ids: Iterable[int],
+                             ref_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Рассылка родителям учеников: по сообщению на пару родитель-ученик
+    {student} в тексте заменяется именем ребенка
+    """
+    student_ids = sorted({int(student_id) for student_id in student_ids})
+    return await _enqueue(_ENQUEUE_PARENTS_SQL, kind, ref_id, text, student_ids)
+
+
+async def enqueue_to_audience(audience: str, text: str, ref_id: Optional[int] = None) -> Dict[str, int]:
+    """Рассылка подписчикам: audience - news (get_news) или pays (get_pays_notif)"""
+    try:
+        flag = AUDIENCES[audience]
+    except KeyError:
+        raise ValueError(f"Неизвестная аудитория рассылки: {audience}")
+    return await _enqueue(_ENQUEUE_AUDIENCE_SQL.format(schema=schema, flag=flag), audience, ref_id, text)
+
+
+def competition_invitation_text(name: str, day: Optional[datetime], address: Optional[str]) -> str:
+    lines = [f"🏆 Приглашение на соревнование «{name}»"]
+    if day:
+        lines.append(f"📅 {day.strftime('%d.%m.%Y')}")
+    if address:
+        lines.append(f"📍 {address}")
+    lines.append("👤 Участник: {student}")
+    return "\n".join(lines)
+
+
+async def broadcast_status(broadcast_id: int) -> Optional[Dict[str, Any]]:
+    """Рассылка и число получателей по статусам доставки"""
+    async with acquire() as conn:
+        row = await conn.fetchrow(
+            f"""SELECT b.id, b.kind, b.ref_id, b.created_at,
+                    count(d.id) AS total,
+                    count(*) FILTER (WHERE d.status = 'pending') AS pending,
+                    count(*) FILTER (WHERE d.status = 'sent') AS sent,
+                    count(*) FILTER (WHERE d.status = 'failed') AS failed,
+                    count(*) FILTER (WHERE d.status = 'blocked') AS blocked
+                FROM {schema}.broadcast b
+                LEFT JOIN {schema}.broadcast_delivery d ON d.broadcast_id = b.id
+                WHERE b.id = $1
+                GROUP BY b.id""",
+            broadcast_id
+        )
+    return dict(row) if row else None
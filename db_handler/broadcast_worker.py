@@ -0,0 +1,274 @@
+"""
+Фоновая отправка рассылок из очереди broadcast_delivery.
+
+Воркер работает в процессе API и забирает получателей пачками:
+
+    UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)
+
+Забранные строки получают аренду (next_attempt_at + LEASE): если процесс
+упадет посреди отправки, они вернутся в очередь. Отправлять одновременно
+может только один процесс - тот, кто держит блокировку broadcast:sender в
+Redis, поэтому общий лимит Telegram соблюдается при любом числе воркеров.
+Пока пачка отправляется (в том числе во время паузы RetryAfter),
+блокировка продлевается.
+
+Лимиты: TokenBucket на GLOBAL_RATE сообщений в секунду и пауза
+PER_CHAT_INTERVAL между сообщениями одному чату. TelegramRetryAfter
+останавливает всю отправку на указанное время и не считается попыткой.
+Ошибки сети повторяются через RETRY_BASE * 2^попытка секунд; заблокировавший бота получатель
+получает статус blocked, неверный чат - failed. Итог по каждой строке
+сохраняется одним UPDATE на пачку; время следующей попытки считается по
+часам БД (now() + задержка).
+"""
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from database.engines import acquire
+from database.models import schema
+from database.redis.redis_config import LazyRedis
+from logger_config import logger
+
+SENDER_LOCK_KEY = "broadcast:sender"
+SENDER_LOCK_TTL = 30
+LEASE = timedelta(minutes=5)
+
+_CLAIM_SQL = f"""WITH claimed AS (
+        UPDATE {schema}.broadcast_delivery d
+        SET attempts = d.attempts + 1, next_attempt_at = now() + interval '{int(LEASE.total_seconds())} seconds'
+        WHERE d.id IN (
+            SELECT id FROM {schema}.broadcast_delivery
+            WHERE status = 'pending' AND next_attempt_at <= now()
+            ORDER BY next_attempt_at, id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING d.id, d.broadcast_id, d.telegram_id, d.student_id, d.attempts
+    )
+    SELECT c.id, c.telegram_id, c.attempts, b.text, st.name AS student_name
+    FROM claimed c
+    JOIN {schema}.broadcast b ON b.id = c.broadcast_id
+    LEFT JOIN {schema}.student st ON st.id = c.student_id
+    ORDER BY c.id"""
+
+_SAVE_SQL = f"""UPDATE {schema}.broadcast_delivery d
+    SET status = u.status,
+        last_error = u.error,
+        sent_at = CASE WHEN u.status = 'sent' THEN now() ELSE d.sent_at END,
+        next_attempt_at = CASE WHEN u.delay IS NULL THEN d.next_attempt_at
+                               ELSE now() + make_interval(secs => u.delay) END,
+        attempts = CASE WHEN u.uncounted THEN d.attempts - 1 ELSE d.attempts END
+    FROM unnest($1::int[], $2::text[], $3::text[], $4::float8[], $5::bool[])
+        AS u(id, status, error, delay, uncounted)
+    WHERE d.id = u.id"""
+
+# (id, статус, ошибка, задержка следующей попытки в секундах, попытка не считается)
+Outcome = Tuple[int, str, Optional[str], Optional[float], bool]
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (Telegram ответил RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class BroadcastWorker:
+    """Отправка очереди рассылок ботом уведомлений"""
+
+    def __init__(self):
+        self.conf = settings.broadcast
+        self.bucket = TokenBucket(self.conf.global_rate)
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_sent: Dict[int, float] = {}
+        self._lock_token = uuid.uuid4().hex
+        self._redis = LazyRedis("Рассылки", fallback="отправка без общей блокировки")
+        self._stats = {"sent": 0, "retried": 0, "failed": 0, "blocked": 0, "batches": 0}
+
+    # ==================== Запуск ====================
+
+    def start(self):
+        if not self.conf.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("📨 Воркер рассылок запущен")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._bot is not None:
+            await self._bot.session.close()
+            self._bot = None
+
+    def wake(self):
+        """Новая рассылка в очереди - не ждать POLL_INTERVAL"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _get_bot(self):
+        if self._bot is None:
+            from aiogram import Bot
+            from aiogram.client.session.aiohttp import AiohttpSession
+            from aiogram.client.telegram import TelegramAPIServer
+
+            session = None
+            if settings.bot_webhook.api_server:
+                session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot_webhook.api_server))
+            self._bot = Bot(token=settings.tg.token_notif, session=session)
+        return self._bot
+
+    # ==================== Блокировка отправителя ====================
+
+    async def _hold_sender_lock(self) -> bool:
+        """Отправляет один процесс; без Redis - каждый (строки все равно не пересекаются)"""
+        client = self._redis.get()
+        if client is None:
+            return True
+        try:
+            if await client.set(SENDER_LOCK_KEY, self._lock_token, nx=True, ex=SENDER_LOCK_TTL):
+                return True
+            if await client.get(SENDER_LOCK_KEY) == self._lock_token:
+                await client.expire(SENDER_LOCK_KEY, SENDER_LOCK_TTL)
+                return True
+            return False
+        except Exception as e:
+            logger.warning(f"⚠️ Рассылки: не удалось проверить блокировку отправителя: {e}")
+            return True
+
+    async def _keep_sender_lock(self):
+        """Продлевать блокировку, пока отправляется пачка (пауза RetryAfter может быть дольше TTL)"""
+        while True:
+            await asyncio.sleep(SENDER_LOCK_TTL / 3)
+            await self._hold_sender_lock()
+
+    # ==================== Цикл ====================
+
+    async def _run(self):
+        while True:
+            try:
+                sent = 0
+                if await self._hold_sender_lock():
+                    sent = await self.process_batch()
+                if not sent:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.conf.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Рассылки: ошибка воркера: {e}")
+                await asyncio.sleep(self.conf.poll_interval)
+
+    async def process_batch(self) -> int:
+        """Забрать и отправить одну пачку; возвращает число обработанных строк"""
+        async with acquire() as conn:
+            rows = await conn.fetch(_CLAIM_SQL, self.conf.batch_size)
+        if not rows:
+            return 0
+
+        # Сообщения одному чату - по очереди с паузой, разным чатам - параллельно
+        by_chat: Dict[int, List[Any]] = defaultdict(list)
+        for row in rows:
+            by_chat[row["telegram_id"]].append(row)
+        keeper = asyncio.create_task(self._keep_sender_lock())
+        try:
+            chunks = await asyncio.gather(
+                *(self._send_chat(chat_id, chat_rows) for chat_id, chat_rows in by_chat.items())
+            )
+        finally:
+            keeper.cancel()
+        outcomes = [outcome for chunk in chunks for outcome in chunk]
+
+        async with acquire() as conn:
+            await conn.execute(_SAVE_SQL, *map(list, zip(*outcomes)))
+
+        self._stats["batches"] += 1
+        self._forget_idle_chats()
+        return len(rows)
+
+    async def _send_chat(self, chat_id: int, rows: List[Any]) -> List[Outcome]:
+        outcomes = []
+        for row in rows:
+            wait = self._last_sent.get(chat_id, 0.0) + self.conf.per_chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.bucket.acquire()
+            outcomes.append(await self._deliver(row))
+            self._last_sent[chat_id] = time.monotonic()
+        return outcomes
+
+    async def _deliver(self, row) -> Outcome:
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+        text = row["text"].replace("{student}", row["student_name"] or "")
+        try:
+            await self._get_bot().send_message(row["telegram_id"], text)
+            self._stats["sent"] += 1
+            return row["id"], "sent", None, None, False
+        except TelegramRetryAfter as e:
+            # Превышен лимит: ждут все, попытка не считается
+            self.bucket.pause(e.retry_after)
+            self._stats["retried"] += 1
+            return row["id"], "pending", str(e), float(e.retry_after), True
+        except TelegramForbiddenError as e:
+            self._stats["blocked"] += 1
+            return row["id"], "blocked", str(e), None, False
+        except TelegramBadRequest as e:
+            self._stats["failed"] += 1
+            return row["id"], "failed", str(e), None, False
+        except Exception as e:
+            if row["attempts"] >= self.conf.max_attempts:
+                self._stats["failed"] += 1
+                return row["id"], "failed", str(e), None, False
+            self._stats["retried"] += 1
+            delay = self.conf.retry_base * 2 ** (row["attempts"] - 1)
+            return row["id"], "pending", str(e), float(delay), False
+
+    def _forget_idle_chats(self):
+        threshold = time.monotonic() - self.conf.per_chat_interval
+        for chat_id in [chat_id for chat_id, sent_at in self._last_sent.items() if sent_at < threshold]:
+            del self._last_sent[chat_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "running": self._task is not None and not self._task.done()}
+
+
+broadcast_worker = BroadcastWorker()
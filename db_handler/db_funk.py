@@ -1,31 +1,36 @@
 
-from math import ceil
+from contextlib import asynccontextmanager
+from typing import Any, Iterable, List, Optional, Sequence
 from config import settings
 from datetime import datetime, timedelta
 from logger_config import logger
-import asyncpg
 
 from database.models import schema
+from database.engines import acquire
+from db_handler.principal_cache import principal_cache
+from db_handler.schedule_calendar import (
+    ScheduleCalendar,
+    load_closures,
+    load_student_calendar,
+    project_payment_date,
+    weekday_weights,
+)
 
 
 
 # функция, для получения информации по конкретному пользователю
 async def get_user_data(user_id: int, table_name=f'{schema}.telegram_user'):
-    conn = await asyncpg.connect(**settings.db.pg_link)
-    try:
+    async with acquire() as conn:
         logger.info(f'пытаюсь получить инфу о {user_id}')
         row = await conn.fetchrow(
             f"SELECT * FROM {table_name} WHERE telegram_id = $1",
             user_id
         )
         return dict(row) if row else None
-    finally:
-        await conn.close()
 
 
 async def get_all_users(table_name='student', schema_name=schema, count=False):
-    conn = await asyncpg.connect(**settings.db.pg_link)
-    try:
+    async with acquire() as conn:
         # Формируем полное имя таблицы с учетом схемы
         full_table_name = f"{schema_name}.{table_name}" if schema_name else table_name
 
@@ -39,12 +44,9 @@ async def get_all_users(table_name='student', schema_name=schema, count=False):
             query = f"SELECT * FROM {full_table_name}"
             rows = await conn.fetch(query)
             return [dict(row) for row in rows]
-    finally:
-        await conn.close()
 
 
 async def insert_user(user_data: dict, table_name: str = f'{schema}.telegram_user'):
-    conn = await asyncpg.connect(**settings.db.pg_link)
     try:
         # Подготавливаем SQL-запрос
         columns = ', '.join(user_data.keys())
@@ -57,29 +59,23 @@ async def insert_user(user_data: dict, table_name: str = f'{schema}.telegram_use
         """
 
         # Выполняем запрос
-        row = await conn.fetchrow(query, *user_data.values())
+        async with acquire() as conn:
+            row = await conn.fetchrow(query, *user_data.values())
+        if row and 'telegram_id' in user_data:
+            await principal_cache.invalidate(user_data['telegram_id'])
         return dict(row) if row else None
     except Exception as e:
         logger.error(f"Error inserting user: {e}")
         return None
-    finally:
-        await conn.close()
 
 
 async def get_user_permissions(user_telegram_id: int) -> int:
     """
-    Получает права пользователя из базы данных
+    Получает права пользователя (через кэш principal_cache)
     Возвращает permissions или 0 (гость) если пользователь не найден
     """
     try:
-        result = await execute_raw_sql(
-            f"SELECT permissions FROM {schema}.telegram_user WHERE telegram_id = $1;",
-            user_telegram_id
-        )
-        if result:
-            return result[0]['permissions']
-        else:
-            return 0  # Гость по умолчанию
+        return await principal_cache.permissions(user_telegram_id)
     except Exception as e:
         logger.error(f"Error getting user permissions: {str(e)}")
         return 0  # Гость в случае ошибки
@@ -87,19 +83,62 @@ async def get_user_permissions(user_telegram_id: int) -> int:
 
 
 async def execute_raw_sql(query: str, *params):
-    """Выполняет SQL запрос с параметрами и возвращает результат"""
-    conn = await asyncpg.connect(**settings.db.pg_link)
+    """Выполняет SQL запрос с параметрами и возвращает результат (соединение берется из пула)"""
     try:
-        if params:
-            result = await conn.fetch(query, *params)
-        else:
-            result = await conn.fetch(query)
+        async with acquire() as conn:
+            if params:
+                result = await conn.fetch(query, *params)
+            else:
+                result = await conn.fetch(query)
         return result
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise  # Пробрасываем исключение дальше
-    finally:
-        await conn.close()
+
+
+class Transaction:
+    """
+    Набор запросов, выполняемых на одном соединении из пула внутри одной транзакции.
+    Используется через `async with transaction() as tx:`
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def fetch(self, query: str, *params) -> List[Any]:
+        return await self.conn.fetch(query, *params)
+
+    async def fetchrow(self, query: str, *params) -> Optional[Any]:
+        return await self.conn.fetchrow(query, *params)
+
+    async def fetchval(self, query: str, *params) -> Any:
+        return await self.conn.fetchval(query, *params)
+
+    async def execute(self, query: str, *params) -> str:
+        return await self.conn.execute(query, *params)
+
+    async def executemany(self, query: str, args: Iterable[Sequence]) -> None:
+        """Один запрос для пачки параметров (отправляется конвейером, без ожидания каждого ответа)"""
+        await self.conn.executemany(query, args)
+
+    async def fetchmany(self, query: str, args: Iterable[Sequence]) -> List[Any]:
+        """Как executemany, но возвращает строки из RETURNING для всей пачки"""
+        return await self.conn.fetchmany(query, args)
+
+
+@asynccontextmanager
+async def transaction(isolation: str = 'read_committed'):
+    """
+    Выполняет все запросы внутри блока на одном соединении в одной транзакции.
+    При исключении транзакция откатывается, иначе фиксируется.
+
+        async with transaction() as tx:
+            row = await tx.fetchrow("... RETURNING id", ...)
+            await tx.execute("UPDATE ...", ...)
+    """
+    async with acquire() as conn:
+        async with conn.transaction(isolation=isolation):
+            yield Transaction(conn)
 
 
 async def save_selection(schedule_id: int, student_ids: list, trainer_id: int, place_id: int, discipline_id: int):
@@ -193,141 +232,159 @@ async def save_selection(schedule_id: int, student_ids: list, trainer_id: int, p
         return False, f"Системная ошибка: {str(e)}"
 
 
+async def _estimate_payment_date(tx: Transaction, schedule_days: List[str], new_balance: int,
+                                 is_tariff_8: bool):
+    """
+    Дата следующей оплаты по новому балансу: день, на который придется
+    последнее оплаченное занятие (в субботу списывается 2 занятия, для тарифа 8 - одно)
+    """
+    today = datetime.now().date()
+    closures = await load_closures(tx, today)
+    calendar = ScheduleCalendar(weekday_weights(schedule_days, 1 if is_tariff_8 else 2), closures)
+    return project_payment_date(calendar, new_balance, today)
+
+
+async def _get_payment_prices(tx: Transaction, amount: int, old_price_id: Optional[int]):
+    """
+    Одним запросом получает новый тариф (по сумме) и старый тариф ученика (по id)
+    Возвращает (price, old_price_info)
+    """
+    rows = await tx.fetch(
+        f"""SELECT id, price, classes_in_price, description
+        FROM {schema}.price
+        WHERE price = $1 OR id = $2
+        ORDER BY id;""",
+        amount, old_price_id
+    )
+    price = next((row for row in rows if row['price'] == amount), None)
+    old_price_info = next((row for row in rows if row['id'] == old_price_id), None) if old_price_id else None
+    return price, old_price_info
+
+
+async def _write_payment(tx: Transaction, student_id: int, price_id: int, amount: int,
+                         classes_to_add: int, new_payment_date):
+    """
+    Записывает платеж и обновляет баланс, тариф и дату оплаты ученика одним запросом
+    Возвращает строку с новым балансом и датой платежа
+    """
+    return await tx.fetchrow(
+        f"""WITH pay AS (
+            INSERT INTO {schema}.payment (student_id, price_id, payment_amount, payment_date)
+            VALUES ($1, $2, $3, CURRENT_DATE)
+            RETURNING id, payment_date
+        )
+        UPDATE {schema}.student
+        SET classes_remaining = COALESCE(classes_remaining, 0) + $4,
+            price = $2,
+            expected_payment_date = $5
+        WHERE id = $1
+        RETURNING classes_remaining,
+                  (SELECT id FROM pay) AS payment_id,
+                  (SELECT payment_date FROM pay) AS payment_date;""",
+        student_id, price_id, amount, classes_to_add, new_payment_date
+    )
+
+
+# Дни недели, в которые у ученика тренировки (подзапрос для выборки ученика)
+_SCHEDULE_DAYS_SUBQUERY = f"""ARRAY(SELECT DISTINCT sched.day_week
+                FROM {schema}.student_schedule ss
+                JOIN {schema}.schedule sched ON ss.schedule = sched.id
+                WHERE ss.student = s.id) AS schedule_days"""
+
+
+# Активные ученики по части имени для постраничного выбора ($1 - шаблон ILIKE)
+ACTIVE_STUDENTS_BY_NAME = f"""SELECT id AS key, COALESCE(name, '') AS sort_key, name
+    FROM {schema}.student
+    WHERE active = true AND name ILIKE $1"""
+
+
 async def process_payment(student_name: str, amount: int) -> dict:
     """
     Обрабатывает оплату для ученика
+    Все запросы выполняются в одной транзакции: строка ученика блокируется,
+    платеж и новый баланс записываются атомарно.
     Возвращает словарь с результатом операции
     """
     try:
-        # Улучшенный поиск ученика - ищем по разным вариантам имени
-        student_data = await execute_raw_sql(
-            f"""SELECT id, name, classes_remaining, price 
-            FROM public.student 
-            WHERE active = true 
-            AND (
-                name ILIKE $1 
-                OR name ILIKE $2
-                OR name ILIKE $3
-                OR $4 ILIKE '%' || split_part(name, ' ', 1) || '%'
-                OR $4 ILIKE '%' || split_part(name, ' ', 1) || ' ' || split_part(name, ' ', 2) || '%'
-            )
-            ORDER BY 
-                CASE 
-                    WHEN name ILIKE $1 THEN 1
-                    WHEN name ILIKE $2 THEN 2
-                    WHEN name ILIKE $3 THEN 3
-                    ELSE 4
-                END
-            LIMIT 1;""",
-            student_name,
-            f"{student_name}%",
-            f"%{student_name}%",
-            student_name
-        )
-
-        if not student_data:
-            # Try to find by surname and name (first two words)
-            name_parts = student_name.split()
-            if len(name_parts) >= 2:
-                surname_name = f"{name_parts[0]} {name_parts[1]}"
-                student_data = await execute_raw_sql(
-                    f"""SELECT id, name, classes_remaining, price 
-                    FROM public.student 
-                    WHERE active = true 
-                    AND name ILIKE $1
-                    LIMIT 1;""",
-                    f"{surname_name}%"
+        async with transaction() as tx:
+            # Улучшенный поиск ученика - ищем по разным вариантам имени
+            student = await tx.fetchrow(
+                f"""SELECT s.id, s.name, s.classes_remaining, s.price,
+                    {_SCHEDULE_DAYS_SUBQUERY}
+                FROM {schema}.student s
+                WHERE s.active = true 
+                AND (
+                    s.name ILIKE $1 
+                    OR s.name ILIKE $2
+                    OR s.name ILIKE $3
+                    OR $4 ILIKE '%' || split_part(s.name, ' ', 1) || '%'
+                    OR $4 ILIKE '%' || split_part(s.name, ' ', 1) || ' ' || split_part(s.name, ' ', 2) || '%'
                 )
+                ORDER BY 
+                    CASE 
+                        WHEN s.name ILIKE $1 THEN 1
+                        WHEN s.name ILIKE $2 THEN 2
+                        WHEN s.name ILIKE $3 THEN 3
+                        ELSE 4
+                    END
+                LIMIT 1
+                FOR UPDATE OF s;""",
+                student_name,
+                f"{student_name}%",
+                f"%{student_name}%",
+                student_name
+            )
 
-        if not student_data:
-            return {"success": False, "error": f"Ученик '{student_name}' не найден"}
+            if not student:
+                # Try to find by surname and name (first two words)
+                name_parts = student_name.split()
+                if len(name_parts) >= 2:
+                    surname_name = f"{name_parts[0]} {name_parts[1]}"
+                    student = await tx.fetchrow(
+                        f"""SELECT s.id, s.name, s.classes_remaining, s.price,
+                            {_SCHEDULE_DAYS_SUBQUERY}
+                        FROM {schema}.student s
+                        WHERE s.active = true 
+                        AND s.name ILIKE $1
+                        LIMIT 1
+                        FOR UPDATE OF s;""",
+                        f"{surname_name}%"
+                    )
 
-        student = student_data[0]
-        student_id = student['id']
-        old_price_id = student['price']  # Теперь это ID тарифа, а не сумма
+            if not student:
+                return {"success": False, "error": f"Ученик '{student_name}' не найден"}
 
-        # Ищем цену в таблице price
-        price_data = await execute_raw_sql(
-            f"SELECT id, price, classes_in_price, description FROM public.price WHERE price = $1;",
-            amount
-        )
+            student_id = student['id']
+            old_price_id = student['price']  # Теперь это ID тарифа, а не сумма
 
-        if not price_data:
-            return {"success": False, "error": f"Тариф с суммой {amount} руб. не найден"}
+            # Ищем новый тариф по сумме и старый тариф для сравнения
+            price, old_price_info = await _get_payment_prices(tx, amount, old_price_id)
 
-        price = price_data[0]
-        price_id = price['id']
-        classes_to_add = price['classes_in_price']
+            if not price:
+                return {"success": False, "error": f"Тариф с суммой {amount} руб. не найден"}
 
-        # Получаем информацию о старом тарифе для сравнения
-        old_price_info = None
-        if old_price_id:
-            old_price_data = await execute_raw_sql(
-                f"SELECT price, description FROM public.price WHERE id = $1;",
-                old_price_id
-            )
-            if old_price_data:
-                old_price_info = old_price_data[0]
+            price_id = price['id']
 
-        # Проверяем и устанавливаем значения по умолчанию
-        current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
-        classes_to_add = classes_to_add if classes_to_add is not None else 0
+            # Проверяем и устанавливаем значения по умолчанию
+            current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
+            classes_to_add = price['classes_in_price'] if price['classes_in_price'] is not None else 0
 
-        # Рассчитываем новую дату оплаты
-        from datetime import datetime, timedelta
-        
-        # Получаем расписание студента для расчета дней в неделю
-        schedule_data = await execute_raw_sql(
-            f"""SELECT COUNT(DISTINCT ss.schedule) as training_days_per_week
-            FROM {schema}.student_schedule ss
-            JOIN {schema}.schedule sched ON ss.schedule = sched.id
-            WHERE ss.student = $1""",
-            student_id
-        )
-        
-        days_per_week = schedule_data[0]['training_days_per_week'] if schedule_data and schedule_data[0]['training_days_per_week'] else 1
-        
-        # Рассчитываем, на сколько недель хватит нового баланса
-        new_balance = current_balance + classes_to_add
-        
-        if days_per_week > 0 and new_balance > 0:
-            # Рассчитываем количество недель, на которое хватит занятий
-            weeks_remaining = new_balance / days_per_week
-            
-            # Если студент ходит реже, чем 1 раз в неделю, берем минимум 1 неделю
-            if weeks_remaining < 1:
-                weeks_remaining = 1
-            else:
-                weeks_remaining = ceil(weeks_remaining)
-            
-            # Устанавливаем дату оплаты через рассчитанное количество недель + буфер 3 дня
-            new_payment_date = datetime.now().date() + timedelta(days=weeks_remaining * 7 + 3)
-        else:
-            # Если нет расписания или нулевой баланс - ставим дату через 30 дней
-            new_payment_date = datetime.now().date() + timedelta(days=30)
-
-        # Начинаем транзакцию
-        # 1. Добавляем запись в payment
-        payment_result = await execute_raw_sql(
-            f"""INSERT INTO public.payment 
-                (student_id, price_id, payment_amount, payment_date) 
-            VALUES ($1, $2, $3, CURRENT_DATE) 
-            RETURNING id;""",
-            student_id, price_id, amount
-        )
+            # Рассчитываем новую дату оплаты
+            new_balance = current_balance + classes_to_add
+            new_payment_date = await _estimate_payment_date(
+                tx, student['schedule_days'], new_balance, price['classes_in_price'] == 8
+            )
 
-        if not payment_result:
-            return {"success": False, "error": "Ошибка при записи платежа"}
+            # Записываем платеж и обновляем баланс, price_id и дату оплаты у ученика
+            payment_result = await _write_payment(
+                tx, student_id, price_id, amount, classes_to_add, new_payment_date
+            )
 
-        # 2. Обновляем баланс занятий, price_id и дату оплаты у ученика
-        update_result = await execute_raw_sql(
-            f"UPDATE public.student SET classes_remaining = $1, price = $2, expected_payment_date = $3 WHERE id = $4;",
-            new_balance, price_id, new_payment_date, student_id
-        )
+            if not payment_result or not payment_result['payment_id']:
+                raise RuntimeError("Ошибка при записи платежа")
 
-        # Получаем текущую дату для ответа
-        current_date_data = await execute_raw_sql(f"SELECT CURRENT_DATE as today;")
-        payment_date = current_date_data[0]['today'].strftime("%d.%m.%Y") if current_date_data else "сегодня"
+            new_balance = payment_result['classes_remaining']
+            payment_date = payment_result['payment_date'].strftime("%d.%m.%Y")
 
         # Формируем информацию об изменении тарифа
         price_change_info = ""
@@ -361,28 +418,22 @@ async def process_payment(student_name: str, amount: int) -> dict:
         return {"success": False, "error": f"Системная ошибка: {str(e)}"}
 
 
-async def get_all_certificates():
-    """Получает все медицинские справки"""
-    query = """
-    SELECT 
-        s.name as student_name,
-        mt.name_cert as certificate_type,
-        TO_CHAR(mr.date_start, 'DD.MM.YYYY') as start_date,
-        TO_CHAR(mr.date_end, 'DD.MM.YYYY') as end_date,
-        CASE 
+# Все справки для постраничного списка (keyboards/pagination.py): key - id справки, sort_key - имя ученика
+ALL_CERTIFICATES_PAGE_SQL = f"""SELECT
+        mr.id AS key,
+        COALESCE(s.name, '') AS sort_key,
+        mt.name_cert AS certificate_type,
+        TO_CHAR(mr.date_start, 'DD.MM.YYYY') AS start_date,
+        TO_CHAR(mr.date_end, 'DD.MM.YYYY') AS end_date,
+        CASE
             WHEN mr.active = true AND mr.date_end >= CURRENT_DATE THEN 'active'
             WHEN mr.active = true AND mr.date_end < CURRENT_DATE THEN 'expired'
             ELSE 'inactive'
-        END as status,
-        mr.id as record_id
-    FROM public.medcertificat_received mr
-    JOIN public.student s ON mr.student_id = s.id
-    JOIN public.medcertificat_type mt ON mr.cert_id = mt.id
-    WHERE s.active = true
-    ORDER BY s.name, mr.date_end DESC;
-    """
-
-    return await execute_raw_sql(query)
+        END AS status
+    FROM {schema}.medcertificat_received mr
+    JOIN {schema}.student s ON mr.student_id = s.id
+    JOIN {schema}.medcertificat_type mt ON mr.cert_id = mt.id
+    WHERE s.active = true"""
 
 
 async def get_student_certificates(student_id: int):
@@ -417,96 +468,53 @@ async def get_student_certificates(student_id: int):
 async def process_payment_via_web(student_id: int, amount: int) -> dict:
     """
     Обрабатывает оплату для ученика через веб-интерфейс
+    Платеж и обновление баланса выполняются в одной транзакции
     Возвращает словарь с результатом операции
     """
     try:
-        # Получаем информацию об ученике
-        student_data = await execute_raw_sql(
-            """SELECT id, name, classes_remaining, price 
-            FROM public.student 
-            WHERE id = $1 AND active = true;""",
-            student_id
-        )
-
-        if not student_data:
-            return {"success": False, "error": "Ученик не найден"}
-
-        student = student_data[0]
-        old_price_id = student['price']
+        async with transaction() as tx:
+            # Получаем информацию об ученике (строка блокируется до конца транзакции)
+            student = await tx.fetchrow(
+                f"""SELECT s.id, s.name, s.classes_remaining, s.price,
+                    {_SCHEDULE_DAYS_SUBQUERY}
+                FROM {schema}.student s
+                WHERE s.id = $1 AND s.active = true
+                FOR UPDATE OF s;""",
+                student_id
+            )
 
-        # Ищем цену в таблице price
-        price_data = await execute_raw_sql(
-            "SELECT id, price, classes_in_price, description FROM public.price WHERE price = $1;",
-            amount
-        )
+            if not student:
+                return {"success": False, "error": "Ученик не найден"}
 
-        if not price_data:
-            return {"success": False, "error": f"Тариф с суммой {amount} руб. не найден"}
+            old_price_id = student['price']
 
-        price = price_data[0]
-        price_id = price['id']
-        classes_to_add = price['classes_in_price'] or 0
+            # Ищем новый тариф по сумме и старый тариф для сравнения
+            price, old_price_info = await _get_payment_prices(tx, amount, old_price_id)
 
-        # Текущий баланс
-        current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
-        new_balance = current_balance + classes_to_add
+            if not price:
+                return {"success": False, "error": f"Тариф с суммой {amount} руб. не найден"}
 
-        # Рассчитываем новую дату оплаты
-        from datetime import datetime, timedelta
-        from math import ceil
+            price_id = price['id']
+            classes_to_add = price['classes_in_price'] or 0
 
-        # Получаем расписание студента
-        schedule_data = await execute_raw_sql(
-            """SELECT COUNT(DISTINCT ss.schedule) as training_days_per_week
-            FROM public.student_schedule ss
-            JOIN public.schedule sched ON ss.schedule = sched.id
-            WHERE ss.student = $1""",
-            student_id
-        )
+            # Текущий баланс
+            current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
+            new_balance = current_balance + classes_to_add
 
-        days_per_week = schedule_data[0]['training_days_per_week'] if schedule_data and schedule_data[0][
-            'training_days_per_week'] else 1
-
-        # Рассчитываем дату следующей оплаты
-        if days_per_week > 0 and new_balance > 0:
-            weeks_remaining = new_balance / days_per_week
-            if weeks_remaining < 1:
-                weeks_remaining = 1
-            else:
-                weeks_remaining = ceil(weeks_remaining)
-
-            new_payment_date = datetime.now().date() + timedelta(days=weeks_remaining * 7 + 3)
-        else:
-            new_payment_date = datetime.now().date() + timedelta(days=30)
-
-        # Начинаем транзакцию
-        # 1. Добавляем запись в payment
-        payment_result = await execute_raw_sql(
-            """INSERT INTO public.payment 
-                (student_id, price_id, payment_amount, payment_date) 
-            VALUES ($1, $2, $3, CURRENT_DATE) 
-            RETURNING id;""",
-            student_id, price_id, amount
-        )
+            # Рассчитываем дату следующей оплаты
+            new_payment_date = await _estimate_payment_date(
+                tx, student['schedule_days'], new_balance, price['classes_in_price'] == 8
+            )
 
-        if not payment_result:
-            return {"success": False, "error": "Ошибка при записи платежа"}
+            # Записываем платеж и обновляем баланс, price_id и дату оплаты у ученика
+            payment_result = await _write_payment(
+                tx, student_id, price_id, amount, classes_to_add, new_payment_date
+            )
 
-        # 2. Обновляем баланс занятий, price_id и дату оплаты у ученика
-        await execute_raw_sql(
-            "UPDATE public.student SET classes_remaining = $1, price = $2, expected_payment_date = $3 WHERE id = $4;",
-            new_balance, price_id, new_payment_date, student_id
-        )
+            if not payment_result or not payment_result['payment_id']:
+                raise RuntimeError("Ошибка при записи платежа")
 
-        # Получаем информацию о старом тарифе для сравнения
-        old_price_info = None
-        if old_price_id:
-            old_price_data = await execute_raw_sql(
-                "SELECT price, description FROM public.price WHERE id = $1;",
-                old_price_id
-            )
-            if old_price_data:
-                old_price_info = old_price_data[0]
+            new_balance = payment_result['classes_remaining']
 
         # Формируем информацию об изменении тарифа
         price_change_info = ""
@@ -550,46 +558,44 @@ async def process_medical_certificate(student_id: int, start_date: str, end_date
         if start_date_dt > end_date_dt:
             return {"success": False, "error": "Дата начала не может быть позже даты окончания"}
 
-        # Получаем информацию об ученике
-        student_data = await execute_raw_sql(
-            """SELECT id, name, classes_remaining 
-            FROM public.student 
-            WHERE id = $1 AND active = true;""",
-            student_id
-        )
-
-        if not student_data:
-            return {"success": False, "error": "Ученик не найден"}
-
-        student = student_data[0]
-        current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
-
-        # Рассчитываем количество пропущенных занятий
-        missed_classes_result = await calculate_missed_classes(student_id, start_date_dt, end_date_dt)
+        async with transaction() as tx:
+            # Получаем информацию об ученике (строка блокируется до конца транзакции)
+            student = await tx.fetchrow(
+                f"""SELECT id, name, classes_remaining 
+                FROM {schema}.student 
+                WHERE id = $1 AND active = true
+                FOR UPDATE;""",
+                student_id
+            )
 
-        if not missed_classes_result["success"]:
-            return missed_classes_result
+            if not student:
+                return {"success": False, "error": "Ученик не найден"}
 
-        missed_classes = missed_classes_result["missed_classes"]
+            # Рассчитываем количество пропущенных занятий
+            missed_classes_result = await calculate_missed_classes(student_id, start_date_dt, end_date_dt, tx=tx)
 
-        if missed_classes == 0:
-            return {"success": False, "error": "За указанный период у ученика не было запланированных занятий"}
+            if not missed_classes_result["success"]:
+                return missed_classes_result
 
-        # Обновляем баланс ученика
-        new_balance = current_balance + missed_classes
+            missed_classes = missed_classes_result["missed_classes"]
 
-        await execute_raw_sql(
-            "UPDATE public.student SET classes_remaining = $1 WHERE id = $2;",
-            new_balance, student_id
-        )
+            if missed_classes == 0:
+                return {"success": False, "error": "За указанный период у ученика не было запланированных занятий"}
 
-        # Записываем информацию о справке в историю
-        await execute_raw_sql(
-            """INSERT INTO public.medical_certificates 
-                (student_id, start_date, end_date, missed_classes, added_classes, processed_date) 
-            VALUES ($1, $2, $3, $4, $5, CURRENT_DATE);""",
-            student_id, start_date_dt, end_date_dt, missed_classes, missed_classes
-        )
+            # Записываем справку в историю и возвращаем занятия на баланс одним запросом
+            new_balance = await tx.fetchval(
+                f"""WITH cert AS (
+                    INSERT INTO {schema}.medical_certificates 
+                        (student_id, start_date, end_date, missed_classes, added_classes, processed_date) 
+                    VALUES ($1, $2, $3, $4, $4, CURRENT_DATE)
+                    RETURNING id
+                )
+                UPDATE {schema}.student
+                SET classes_remaining = COALESCE(classes_remaining, 0) + $4
+                WHERE id = $1 AND EXISTS (SELECT 1 FROM cert)
+                RETURNING classes_remaining;""",
+                student_id, start_date_dt, end_date_dt, missed_classes
+            )
 
         return {
             "success": True,
@@ -609,47 +615,24 @@ async def process_medical_certificate(student_id: int, start_date: str, end_date
         return {"success": False, "error": f"Системная ошибка: {str(e)}"}
 
 
-async def calculate_missed_classes(student_id: int, start_date, end_date) -> dict:
-    """Рассчитывает количество пропущенных занятий за период болезни"""
+async def calculate_missed_classes(student_id: int, start_date, end_date, tx: Optional[Transaction] = None) -> dict:
+    """
+    Рассчитывает количество пропущенных занятий за период болезни
+    Закрытые дни (праздники) не считаются пропущенными
+    Если передан tx - запрос выполняется внутри этой транзакции
+    """
     try:
+        calendar = await load_student_calendar(student_id, conn=tx, date_from=start_date)
 
-
-        # Получаем расписание ученика
-        schedule_data = await execute_raw_sql(
-            """SELECT DISTINCT sched.day_week, sched.time_start
-            FROM public.student_schedule ss
-            JOIN public.schedule sched ON ss.schedule = sched.id
-            WHERE ss.student = $1;""",
-            student_id
-        )
-
-        if not schedule_data:
+        if not calendar.weekly:
             return {"success": False, "error": "У ученика нет расписания", "missed_classes": 0}
 
-        weekdays_ru_to_int = {
-            'понедельник': 0,
-            'вторник': 1,
-            'среда': 2,
-            'четверг': 3,
-            'пятница': 4,
-            'суббота': 5,
-            'воскресенье': 6
-        }
-
-        student_weekdays = [weekdays_ru_to_int[row['day_week']] for row in schedule_data]
-
-        missed_classes = 0
-        current_date = start_date
-
-        while current_date <= end_date:
-            if current_date.weekday() in student_weekdays:
-                missed_classes += 1
-            current_date += timedelta(days=1)
+        missed_classes = calendar.count_sessions(start_date, end_date)
 
         return {
             "success": True,
             "missed_classes": missed_classes,
-            "schedule_days": len(schedule_data)
+            "schedule_days": calendar.weekly
         }
 
     except Exception as e:
@@ -685,50 +668,42 @@ async def delete_medical_certificate(certificate_id: int, student_id: int) -> di
     Удаляет справку по болезни и корректирует баланс
     """
     try:
-        # Получаем данные о справке
-        cert_data = await execute_raw_sql(
-            """SELECT missed_classes, added_classes 
-            FROM public.medical_certificates 
-            WHERE id = $1 AND student_id = $2;""",
-            certificate_id, student_id
-        )
-
-        if not cert_data:
-            return {"success": False, "error": "Справка не найдена"}
-
-        cert = cert_data[0]
-        classes_to_remove = cert['added_classes'] or cert['missed_classes'] or 0
-
-        if classes_to_remove <= 0:
-            return {"success": False, "error": "Некорректное количество занятий в справке"}
+        async with transaction() as tx:
+            # Получаем данные о справке и текущий баланс ученика, блокируя обе строки
+            cert = await tx.fetchrow(
+                f"""SELECT mc.missed_classes, mc.added_classes, s.classes_remaining
+                FROM {schema}.medical_certificates mc
+                JOIN {schema}.student s ON s.id = mc.student_id
+                WHERE mc.id = $1 AND mc.student_id = $2
+                FOR UPDATE OF mc, s;""",
+                certificate_id, student_id
+            )
 
-        # Получаем текущий баланс ученика
-        student_data = await execute_raw_sql(
-            "SELECT classes_remaining FROM public.student WHERE id = $1;",
-            student_id
-        )
+            if not cert:
+                return {"success": False, "error": "Справка не найдена"}
 
-        if not student_data:
-            return {"success": False, "error": "Ученик не найден"}
+            classes_to_remove = cert['added_classes'] or cert['missed_classes'] or 0
 
-        current_balance = student_data[0]['classes_remaining'] or 0
+            if classes_to_remove <= 0:
+                return {"success": False, "error": "Некорректное количество занятий в справке"}
 
-        # Проверяем, что баланс не уйдет в минус
-        new_balance = current_balance - classes_to_remove
-        if new_balance < 0:
-            return {"success": False, "error": "Нельзя удалить справку: баланс уйдет в отрицательное значение"}
+            current_balance = cert['classes_remaining'] or 0
 
-        # Обновляем баланс
-        await execute_raw_sql(
-            "UPDATE public.student SET classes_remaining = $1 WHERE id = $2;",
-            new_balance, student_id
-        )
+            # Проверяем, что баланс не уйдет в минус
+            new_balance = current_balance - classes_to_remove
+            if new_balance < 0:
+                return {"success": False, "error": "Нельзя удалить справку: баланс уйдет в отрицательное значение"}
 
-        # Удаляем справку
-        await execute_raw_sql(
-            "DELETE FROM public.medical_certificates WHERE id = $1;",
-            certificate_id
-        )
+            # Удаляем справку и обновляем баланс одним запросом
+            await tx.execute(
+                f"""WITH deleted AS (
+                    DELETE FROM {schema}.medical_certificates WHERE id = $1 RETURNING id
+                )
+                UPDATE {schema}.student
+                SET classes_remaining = $2
+                WHERE id = $3 AND EXISTS (SELECT 1 FROM deleted);""",
+                certificate_id, new_balance, student_id
+            )
 
         return {
             "success": True,
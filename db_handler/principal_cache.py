@@ -0,0 +1,186 @@
+"""
+Кэш «кто это» для бота: права, тренер и дети пользователя по telegram id.
+
+Клавиатуры (main_kb, home_page_kb), проверки прав в admin_panel и выбор
+тренировки спрашивают одно и то же на каждое сообщение. PrincipalCache
+отвечает из локального LRU, при промахе - из RedisStorage, и только если
+нет и там - одним запросом из Postgres.
+
+Изменения telegram_user, trainer и связей родитель-ученик должны вызывать
+invalidate(telegram_id): запись удаляется из Redis, а общая версия
+bot:principal:version увеличивается, поэтому остальные процессы сбрасывают
+локальный LRU при следующей проверке версии.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from database.engines import acquire
+from database.models import schema
+from database.redis.redis_config import LazyRedis, get_redis_client
+from database.redis.redis_storage import RedisStorage
+from logger_config import logger
+
+PRINCIPAL_KEY = "principal"
+VERSION_KEY = "bot:principal:version"
+
+
+def _redis_storage() -> Optional[RedisStorage]:
+    client = get_redis_client()
+    return RedisStorage(client) if client is not None else None
+
+
+class PrincipalCache:
+    """Локальный LRU с TTL поверх RedisStorage"""
+
+    def __init__(self):
+        self.conf = settings.principal_cache
+        self._local: "OrderedDict[int, tuple]" = OrderedDict()
+        self._storage = LazyRedis("Кэш пользователей", factory=_redis_storage)
+        self._version: Optional[int] = None
+        self._version_checked_at = 0.0
+        self._stats = {"local_hits": 0, "redis_hits": 0, "db_loads": 0, "invalidations": 0}
+
+    # ==================== Redis ====================
+
+    async def _sync_version(self):
+        """Сбросить локальный LRU, если другой процесс что-то инвалидировал"""
+        now = time.monotonic()
+        if now - self._version_checked_at < self.conf.version_check_interval:
+            return
+        self._version_checked_at = now
+
+        storage = self._storage.get()
+        if storage is None:
+            return
+        try:
+            value = await storage.redis.get(VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш пользователей: не удалось прочитать версию: {e}")
+            return
+
+        version = int(value) if value else 0
+        if self._version is not None and version != self._version:
+            self._local.clear()
+        self._version = version
+
+    # ==================== Чтение ====================
+
+    async def _load(self, telegram_id: int) -> Dict[str, Any]:
+        """Права, тренер и дети пользователя одним запросом"""
+        async with acquire() as conn:
+            row = await conn.fetchrow(
+                f"""SELECT tu.permissions,
+                    t.id AS trainer_id,
+                    t.name AS trainer_name,
+                    t.active AS trainer_active,
+                    nu.id AS parent_id,
+                    COALESCE(
+                        (SELECT array_agg(sp.student ORDER BY sp.id)
+                         FROM {schema}.students_parents sp
+                         WHERE sp.parents = nu.id),
+                        '{{}}'
+                    ) AS student_ids
+                FROM (SELECT $1::bigint AS telegram_id) q
+                LEFT JOIN {schema}.telegram_user tu ON tu.telegram_id = q.telegram_id
+                LEFT JOIN LATERAL (
+                    SELECT id, name, active FROM {schema}.trainer
+                    WHERE telegram_id = q.telegram_id
+                    ORDER BY active DESC NULLS LAST, id LIMIT 1
+                ) t ON true
+                LEFT JOIN LATERAL (
+                    SELECT id FROM {schema}.tg_notif_user
+                    WHERE telegram_id = q.telegram_id
+                    ORDER BY id LIMIT 1
+                ) nu ON true""",
+                telegram_id
+            )
+
+        self._stats["db_loads"] += 1
+        return {
+            "telegram_id": telegram_id,
+            "permissions": row["permissions"] or 0,
+            "trainer_id": row["trainer_id"],
+            "trainer_name": row["trainer_name"],
+            "trainer_active": bool(row["trainer_active"]),
+            "parent_id": row["parent_id"],
+            "student_ids": list(row["student_ids"]),
+        }
+
+    def _remember(self, telegram_id: int, principal: Dict[str, Any]):
+        self._local[telegram_id] = (time.monotonic(), principal)
+        self._local.move_to_end(telegram_id)
+        while len(self._local) > self.conf.max_size:
+            self._local.popitem(last=False)
+
+    async def get(self, telegram_id: int) -> Dict[str, Any]:
+        """Данные пользователя по telegram id"""
+        await self._sync_version()
+
+        cached = self._local.get(telegram_id)
+        if cached and time.monotonic() - cached[0] < self.conf.local_ttl:
+            self._local.move_to_end(telegram_id)
+            self._stats["local_hits"] += 1
+            return cached[1]
+
+        storage = self._storage.get()
+        if storage is not None:
+            principal = await storage.get_user_data(telegram_id, PRINCIPAL_KEY)
+            if principal:
+                self._stats["redis_hits"] += 1
+                self._remember(telegram_id, principal)
+                return principal
+
+        principal = await self._load(telegram_id)
+        self._remember(telegram_id, principal)
+        if storage is not None:
+            await storage.set_user_data(telegram_id, PRINCIPAL_KEY, principal, self.conf.redis_ttl)
+        return principal
+
+    async def permissions(self, telegram_id: int) -> int:
+        return (await self.get(telegram_id))["permissions"]
+
+    async def trainer(self, telegram_id: int, active_only: bool = False) -> Optional[Dict[str, Any]]:
+        """{'id': ..., 'name': ...} или None, если пользователь не тренер"""
+        principal = await self.get(telegram_id)
+        if principal["trainer_id"] is None:
+            return None
+        if active_only and not principal["trainer_active"]:
+            return None
+        return {"id": principal["trainer_id"], "name": principal["trainer_name"]}
+
+    async def student_ids(self, telegram_id: int) -> List[int]:
+        """Дети пользователя (связи students_parents через tg_notif_user)"""
+        return (await self.get(telegram_id))["student_ids"]
+
+    # ==================== Инвалидация ====================
+
+    async def invalidate(self, *telegram_ids: Optional[int]):
+        """Сбросить кэш пользователей после изменения telegram_user, trainer или связей с детьми"""
+        ids: List[int] = [tid for tid in telegram_ids if tid]
+        for tid in ids:
+            self._local.pop(tid, None)
+            self._stats["invalidations"] += 1
+
+        storage = self._storage.get()
+        if storage is None:
+            return
+        try:
+            for tid in ids:
+                await storage.delete_user_data(tid, PRINCIPAL_KEY)
+                # Профиль в user_router тоже содержит права
+                await storage.delete_user_data(tid, "profile")
+            version = await storage.redis.incr(VERSION_KEY)
+            # Пропустили чужую инвалидацию - сбрасываем локальный LRU целиком
+            if self._version is not None and version != self._version + 1:
+                self._local.clear()
+            self._version = version
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш пользователей: не удалось сбросить {ids}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "local_size": len(self._local)}
+
+
+principal_cache = PrincipalCache()
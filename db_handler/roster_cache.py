@@ -0,0 +1,132 @@
+"""
+Общий кэш списков учеников тренировок (бот и веб-страницы посещений).
+
+Список тренировки хранится в Redis один на всех пользователей и процессы:
+
+    roster:<schedule_id>          хэш {version, students (JSON)}
+    roster:version:<schedule_id>  счетчик изменений списка
+
+Чтение - один pipeline (GET версии + HGETALL списка): список отдается,
+только если записан при текущей версии. Каждая запись в student_schedule
+и правка ученика (имя, активность, пояс) вызывают invalidate /
+invalidate_student, которые увеличивают версию после коммита, поэтому
+первый же запрос после изменения перечитывает список из Postgres, а
+устаревший список не отдается никогда.
+
+При загрузке в хэш пишется версия, прочитанная до запроса к БД: если
+список изменился во время загрузки, запись сразу считается устаревшей.
+Без Redis каждый запрос идет в Postgres.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import settings
+from database.engines import acquire
+from database.models import schema
+from database.redis.redis_config import LazyRedis
+from logger_config import logger
+
+ROSTER_KEY = "roster:{schedule_id}"
+VERSION_KEY = "roster:version:{schedule_id}"
+
+
+class RosterCache:
+    """Ученики тренировки с версией в Redis"""
+
+    def __init__(self):
+        self.conf = settings.roster_cache
+        self._redis = LazyRedis("Кэш учеников тренировок")
+        self._stats = {"hits": 0, "db_loads": 0, "invalidations": 0}
+
+    # ==================== Чтение ====================
+
+    async def _load(self, schedule_id: int) -> List[Dict[str, Any]]:
+        """Активные ученики тренировки по алфавиту"""
+        async with acquire() as conn:
+            rows = await conn.fetch(
+                f"""SELECT st.id, st.name, st.birthday, st.rang
+                FROM {schema}.student_schedule ss
+                JOIN {schema}.student st ON ss.student = st.id
+                WHERE ss.schedule = $1 AND st.active = true
+                ORDER BY st.name""",
+                schedule_id
+            )
+        self._stats["db_loads"] += 1
+        return [{
+            "id": row["id"],
+            "name": row["name"],
+            "birthday": row["birthday"].isoformat() if row["birthday"] else None,
+            "rang": row["rang"],
+        } for row in rows]
+
+    async def get(self, schedule_id: int) -> List[Dict[str, Any]]:
+        """Ученики тренировки: [{'id', 'name', 'birthday' (ISO), 'rang'}]"""
+        client = self._redis.get()
+        if client is None:
+            return await self._load(schedule_id)
+
+        version = None
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.get(VERSION_KEY.format(schedule_id=schedule_id))
+                pipe.hgetall(ROSTER_KEY.format(schedule_id=schedule_id))
+                version, cached = await pipe.execute()
+            version = version or "0"
+            if cached and cached.get("version") == version:
+                self._stats["hits"] += 1
+                return json.loads(cached["students"])
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш учеников тренировок: не удалось прочитать {schedule_id}: {e}")
+
+        students = await self._load(schedule_id)
+        if version is not None:
+            try:
+                key = ROSTER_KEY.format(schedule_id=schedule_id)
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.hset(key, mapping={"version": version, "students": json.dumps(students, ensure_ascii=False)})
+                    pipe.expire(key, self.conf.ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"⚠️ Кэш учеников тренировок: не удалось сохранить {schedule_id}: {e}")
+        return students
+
+    # ==================== Инвалидация ====================
+
+    async def invalidate(self, schedule_ids: Iterable[Optional[int]]):
+        """Увеличить версии списков после коммита изменений student_schedule"""
+        ids = sorted({int(schedule_id) for schedule_id in schedule_ids if schedule_id is not None})
+        client = self._redis.get()
+        if not ids or client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for schedule_id in ids:
+                    pipe.incr(VERSION_KEY.format(schedule_id=schedule_id))
+                await pipe.execute()
+            self._stats["invalidations"] += len(ids)
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш учеников тренировок: не удалось сбросить {ids}: {e}")
+
+    async def schedules_of(self, student_id: int) -> List[int]:
+        """Тренировки, в списках которых есть ученик"""
+        async with acquire() as conn:
+            rows = await conn.fetch(
+                f"SELECT DISTINCT schedule FROM {schema}.student_schedule WHERE student = $1",
+                student_id
+            )
+        return [row["schedule"] for row in rows]
+
+    async def invalidate_student(self, student_id: int):
+        """Сбросить списки всех тренировок ученика (после правки ученика или его расписания)"""
+        try:
+            schedule_ids = await self.schedules_of(student_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш учеников тренировок: не удалось найти тренировки ученика {student_id}: {e}")
+            return
+        await self.invalidate(schedule_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+roster_cache = RosterCache()
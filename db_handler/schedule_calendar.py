@@ -0,0 +1,150 @@
+"""
+Календарь тренировок ученика без перебора дней.
+
+Расписание ученика сводится к весам по дням недели (сколько занятий
+списывается в этот день: 0 - тренировки нет). Отсюда за O(1) считается:
+
+- сколько занятий между двумя датами (count_sessions);
+- на какую дату придется N-е занятие (session_date).
+
+Праздники и дни закрытия зала (таблица closure_day) вычитаются отдельно:
+их немного, поэтому поправка стоит O(число закрытых дней в периоде).
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from database.engines import acquire
+from database.models import schema
+
+WEEKDAYS_RU_TO_INT = {
+    'понедельник': 0,
+    'вторник': 1,
+    'среда': 2,
+    'четверг': 3,
+    'пятница': 4,
+    'суббота': 5,
+    'воскресенье': 6
+}
+
+SATURDAY = 5
+
+
+def weekday_weights(days_ru: Iterable[str], saturday_weight: int = 1) -> Tuple[int, ...]:
+    """
+    Веса дней недели (пн=0 ... вс=6) по названиям дней из schedule.day_week
+    saturday_weight - сколько занятий списывается в субботу
+    """
+    weights = [0] * 7
+    for day_ru in days_ru:
+        weekday = WEEKDAYS_RU_TO_INT.get(day_ru)
+        if weekday is not None:
+            weights[weekday] = saturday_weight if weekday == SATURDAY else 1
+    return tuple(weights)
+
+
+class ScheduleCalendar:
+    """Тренировочные дни ученика с учетом закрытых дней"""
+
+    def __init__(self, weights: Sequence[int], closures: Iterable[date] = ()):
+        self.weights = tuple(weights)
+        self.weekly = sum(self.weights)
+        self.closures: List[date] = sorted(set(closures))
+
+    @classmethod
+    def from_mask(cls, mask: int, closures: Iterable[date] = ()) -> "ScheduleCalendar":
+        """Календарь по битовой маске дней недели (бит 0 - понедельник)"""
+        return cls([(mask >> day) & 1 for day in range(7)], closures)
+
+    @property
+    def mask(self) -> int:
+        return sum(1 << day for day, weight in enumerate(self.weights) if weight)
+
+    def _closed_weight(self, start: date, end: date) -> int:
+        """Сколько занятий отменено закрытыми днями в [start, end]"""
+        lo = bisect_left(self.closures, start)
+        hi = bisect_right(self.closures, end)
+        return sum(self.weights[day.weekday()] for day in self.closures[lo:hi])
+
+    def _plain_count(self, start: date, end: date) -> int:
+        days = (end - start).days + 1
+        full_weeks, rest = divmod(days, 7)
+        first = start.weekday()
+        return full_weeks * self.weekly + sum(self.weights[(first + i) % 7] for i in range(rest))
+
+    def _plain_session_date(self, n: int, start: date) -> date:
+        """Дата N-го занятия начиная со start без учета закрытых дней (weekly > 0)"""
+        full_weeks = (n - 1) // self.weekly
+        remaining = n - full_weeks * self.weekly
+        day = start + timedelta(weeks=full_weeks)
+        while True:
+            remaining -= self.weights[day.weekday()]
+            if remaining <= 0:
+                return day
+            day += timedelta(days=1)
+
+    def count_sessions(self, start: date, end: date) -> int:
+        """Количество занятий с start по end включительно"""
+        if end < start or not self.weekly:
+            return 0
+        return self._plain_count(start, end) - self._closed_weight(start, end)
+
+    def session_date(self, n: int, start: date) -> Optional[date]:
+        """
+        Дата, на которую придется N-е занятие, считая со start включительно
+        None - если у ученика нет тренировок
+        """
+        if not self.weekly:
+            return None
+        n = max(n, 1)
+        day = self._plain_session_date(n, start)
+        # Каждый закрытый день в периоде сдвигает дату дальше
+        while True:
+            short = n - self.count_sessions(start, day)
+            if short <= 0:
+                return day
+            day = self._plain_session_date(short, day + timedelta(days=1))
+
+    def next_session(self, start: date) -> Optional[date]:
+        """Ближайший тренировочный день, начиная со start"""
+        return self.session_date(1, start)
+
+
+def project_payment_date(calendar: ScheduleCalendar, balance: int, today: date) -> date:
+    """
+    Дата, к которой баланс дойдет до нуля (занятия сегодня учитываются)
+    При нулевом или отрицательном балансе - ближайшая тренировка
+    Без расписания: завтра при долге, через 30 дней при положительном балансе
+    """
+    if balance <= 0:
+        return calendar.next_session(today) or today + timedelta(days=1)
+    return calendar.session_date(balance, today) or today + timedelta(days=30)
+
+
+async def load_closures(conn=None, date_from: Optional[date] = None) -> List[date]:
+    """Закрытые дни начиная с date_from (conn - соединение или Transaction)"""
+    query = f"SELECT day FROM {schema}.closure_day WHERE $1::date IS NULL OR day >= $1::date ORDER BY day"
+    if conn is not None:
+        rows = await conn.fetch(query, date_from)
+    else:
+        async with acquire() as conn:
+            rows = await conn.fetch(query, date_from)
+    return [row['day'] for row in rows]
+
+
+async def load_student_calendar(student_id: int, conn=None, saturday_weight: int = 1,
+                                date_from: Optional[date] = None) -> ScheduleCalendar:
+    """Календарь ученика по student_schedule (conn - соединение или Transaction)"""
+    query = f"""SELECT DISTINCT sched.day_week
+        FROM {schema}.student_schedule ss
+        JOIN {schema}.schedule sched ON ss.schedule = sched.id
+        WHERE ss.student = $1"""
+    if conn is not None:
+        rows = await conn.fetch(query, student_id)
+        closures = await load_closures(conn, date_from)
+    else:
+        async with acquire() as conn:
+            rows = await conn.fetch(query, student_id)
+            closures = await load_closures(conn, date_from)
+    weights = weekday_weights((row['day_week'] for row in rows), saturday_weight)
+    return ScheduleCalendar(weights, closures)
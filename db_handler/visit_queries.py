@@ -0,0 +1,74 @@
+"""
+Запросы к таблице visit по дню и неделе.
+
+Все фильтры по дате выражены полуоткрытым диапазоном
+`data >= начало AND data < конец`, а не `DATE(data) = день`: функция над
+колонкой отключает индексы ix_visit_student_data / ix_visit_shedule_data
+и заставляет Postgres читать всю историю посещений.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple, Union
+
+from database.engines import acquire
+from database.models import schema
+
+DateLike = Union[date, datetime]
+
+
+def _start_of_day(day: DateLike) -> datetime:
+    if isinstance(day, datetime):
+        day = day.date()
+    return datetime.combine(day, time.min)
+
+
+def day_range(day: DateLike) -> Tuple[datetime, datetime]:
+    """Границы дня: [00:00 дня, 00:00 следующего дня)"""
+    start = _start_of_day(day)
+    return start, start + timedelta(days=1)
+
+
+def period_range(date_from: DateLike, date_to: DateLike) -> Tuple[datetime, datetime]:
+    """Границы периода с date_from по date_to включительно"""
+    return _start_of_day(date_from), _start_of_day(date_to) + timedelta(days=1)
+
+
+def week_range(day: DateLike) -> Tuple[datetime, datetime]:
+    """Границы недели (пн-вс), в которую попадает day"""
+    start = _start_of_day(day)
+    start -= timedelta(days=start.weekday())
+    return start, start + timedelta(days=7)
+
+
+def data_between(alias: str, start_param: int) -> str:
+    """
+    SQL-условие на диапазон по visit.data
+    Пример: data_between('v', 2) -> "v.data >= $2 AND v.data < $3"
+    """
+    column = f"{alias}.data" if alias else "data"
+    return f"{column} >= ${start_param} AND {column} < ${start_param + 1}"
+
+
+async def visit_exists(student_id: int, schedule_id: int, day: DateLike) -> bool:
+    """Есть ли уже отметка ученика на этой тренировке за день"""
+    start, end = day_range(day)
+    async with acquire() as conn:
+        row = await conn.fetchval(
+            f"""SELECT 1 FROM {schema}.visit v
+            WHERE v.student = $1 AND v.shedule = $2
+            AND {data_between('v', 3)}
+            LIMIT 1""",
+            student_id, schedule_id, start, end
+        )
+    return row is not None
+
+
+async def count_student_visits(student_id: int, date_from: DateLike, date_to: Optional[DateLike] = None) -> int:
+    """Количество посещений ученика за период (по умолчанию - за один день)"""
+    start, end = period_range(date_from, date_to if date_to is not None else date_from)
+    async with acquire() as conn:
+        count = await conn.fetchval(
+            f"""SELECT COUNT(*) FROM {schema}.visit v
+            WHERE v.student = $1 AND {data_between('v', 2)}""",
+            student_id, start, end
+        )
+    return count or 0
@@ -0,0 +1,85 @@
+"""
+Журнал списаний занятий (lesson_write_offs) с защитой от повторного запуска.
+
+WriteOffLedger копит списания в памяти и записывает их за один проход:
+
+1. COPY (copy_records_to_table) во временную таблицу lesson_write_offs_staging;
+2. один запрос переносит строки в lesson_write_offs через
+   ON CONFLICT (student_id, data, reason) DO NOTHING и уменьшает баланс
+   учеников только на те списания, которые действительно вставились.
+
+Дата списания приводится к 00:00 дня, поэтому повторный запуск cron за ту же
+дату упирается в уникальный индекс и ничего не списывает второй раз.
+Работает только внутри транзакции: временная таблица удаляется при COMMIT.
+"""
+from datetime import date, datetime
+from typing import Any, List, Tuple, Union
+
+from database.models import schema
+from db_handler.visit_queries import day_range
+
+# Причины списания
+REASON_DAY = "day"  # занятие по расписанию или посещение за день
+REASON_WEEK_TOP_UP = "week_top_up"  # тариф 8: добор до 2 занятий за неделю
+
+STAGING_TABLE = "lesson_write_offs_staging"
+STAGING_COLUMNS = ("student_id", "data", "quantity", "reason")
+
+
+class WriteOffLedger:
+    """Буфер списаний, записываемый одним COPY и одним INSERT ... ON CONFLICT"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._buffer: List[Tuple[int, datetime, int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def add(self, student_id: int, quantity: int, day: Union[date, datetime], reason: str = REASON_DAY):
+        """Добавить списание в буфер (нулевые списания не записываются)"""
+        if quantity > 0:
+            self._buffer.append((student_id, day_range(day)[0], quantity, reason))
+
+    async def flush(self) -> List[Any]:
+        """
+        Записать буфер в lesson_write_offs и уменьшить балансы
+        Возвращает строки учеников, у которых занятия списаны сейчас
+        (id, name, classes_remaining, price, quantity)
+        """
+        if not self._buffer:
+            return []
+        if not self.conn.is_in_transaction():
+            raise RuntimeError("WriteOffLedger.flush нужно вызывать внутри транзакции")
+
+        await self.conn.execute(
+            f"""CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                student_id integer,
+                data timestamp,
+                quantity integer,
+                reason text
+            ) ON COMMIT DROP"""
+        )
+        await self.conn.execute(f"TRUNCATE {STAGING_TABLE}")
+        await self.conn.copy_records_to_table(STAGING_TABLE, records=self._buffer, columns=STAGING_COLUMNS)
+
+        rows = await self.conn.fetch(
+            f"""WITH inserted AS (
+                INSERT INTO {schema}.lesson_write_offs (student_id, data, quantity, reason)
+                SELECT student_id, data, quantity, reason FROM {STAGING_TABLE}
+                ON CONFLICT (student_id, data, reason) WHERE reason IS NOT NULL DO NOTHING
+                RETURNING student_id, quantity
+            ),
+            totals AS (
+                SELECT student_id, SUM(quantity)::int AS quantity
+                FROM inserted
+                GROUP BY student_id
+            )
+            UPDATE {schema}.student s
+            SET classes_remaining = s.classes_remaining - t.quantity
+            FROM totals t
+            WHERE s.id = t.student_id
+            RETURNING s.id, s.name, s.classes_remaining, s.price, t.quantity"""
+        )
+        self._buffer.clear()
+        return rows
@@ -162,6 +162,7 @@ async def create_db_user(user_data: dict) -> Tuple[bool, str, Optional[dict]]:
     """
     try:
         from database.models import Telegram_user, AsyncSessionLocal
+        from db_handler.principal_cache import principal_cache
 
         # Проверяем права доступа
         permissions = user_data.get('permissions', 1)  # По умолчанию тренер
@@ -199,6 +200,7 @@ async def create_db_user(user_data: dict) -> Tuple[bool, str, Optional[dict]]:
 
             # Получаем созданного пользователя
             await session.refresh(new_user)
+            await principal_cache.invalidate(new_user.telegram_id)
 
             # Определяем уровень доступа
             is_superuser = permissions == 99
@@ -303,6 +305,10 @@ async def update_user_password(phone: str, new_password: str) -> Tuple[bool, str
             user.password_hash = hash_password(new_password)
             await session.commit()
 
+            # Все сессии пользователя завершаются: и access-, и refresh-токены
+            from database.token_revocation import token_revocation
+            await token_revocation.end_sessions(user.telegram_id)
+
             return True, "Пароль успешно обновлен"
 
     except Exception as e:
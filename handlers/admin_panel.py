@@ -10,8 +10,12 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 import re
 from create_bot import bot
 from db_handler.db_funk import get_user_permissions, process_payment, execute_raw_sql, get_student_certificates, \
-    get_all_certificates
+    calculate_missed_classes, process_payment_via_web, ACTIVE_STUDENTS_BY_NAME, ALL_CERTIFICATES_PAGE_SQL
+from db_handler.principal_cache import principal_cache
+from db_handler.visit_queries import count_student_visits
+from database.reference_cache import reference_cache
 from keyboards.kbs import home_page_kb, admin_page_kb, medical_certificate_kb, main_kb
+from keyboards.pagination import KeysetList, Page, PageCallback
 from logger_config import logger
 from utils.utils import prepare_state_data, convert_to_serializable
 
@@ -33,6 +37,68 @@ class MedicalCertificateStates(StatesGroup):
     waiting_for_student_for_list = State()
 
 
+# ===== ПОСТРАНИЧНЫЕ СПИСКИ =====
+
+def _render_certificates(page: Page) -> str:
+    if not page.items:
+        return "❌ В системе нет медицинских справок."
+
+    students_certs = {}
+    for cert in page.items:
+        students_certs.setdefault(cert['sort_key'], []).append(cert)
+
+    message_text = "📋 Все медицинские справки:\n\n"
+    for student_name, certs in students_certs.items():
+        message_text += f"👤 <b>{student_name}</b>:\n"
+
+        for cert in certs:
+            status_icon = "✅" if cert['status'] == 'active' else "❌" if cert['status'] == 'expired' else "🚫"
+            status_text = "Активная" if cert['status'] == 'active' else "Просрочена" if cert[
+                                                                                            'status'] == 'expired' else "Неактивна"
+
+            message_text += (
+                f"  {status_icon} <b>{cert['certificate_type']}</b>\n"
+                f"     📅 {cert['start_date']} - {cert['end_date']} ({status_text})\n"
+            )
+
+        message_text += "\n"
+    return message_text
+
+
+def _payment_text(result: dict) -> str:
+    if not result["success"]:
+        return f"❌ Ошибка: {result['error']}"
+
+    # process_payment возвращает дату платежа, process_payment_via_web - дату следующей оплаты
+    if result.get('payment_date'):
+        date_line = f"📅 Дата: <b>{result['payment_date']}</b>"
+    else:
+        date_line = f"📅 Следующая оплата: <b>{result['next_payment_date']}</b>"
+
+    return (
+        f"✅ Оплата успешно обработана!\n\n"
+        f"👤 Ученик: <b>{result['student_name']}</b>\n"
+        f"💳 Сумма: <b>{result['amount']} руб.</b>\n"
+        f"🎯 Тариф: <b>{result['price_description']}</b>\n"
+        f"📦 Занятий добавлено: <b>{result['classes_added']}</b>\n"
+        f"📊 Остаток занятий: <b>{result['new_balance']}</b>\n"
+        f"{result['price_change_info']}\n"
+        f"{date_line}"
+    )
+
+
+certificates_list = KeysetList("cert", ALL_CERTIFICATES_PAGE_SQL, render=_render_certificates, page_size=15)
+
+# Выбор ученика для оплаты, если по введенному имени нашлось несколько
+payment_students_list = KeysetList(
+    "pay",
+    ACTIVE_STUDENTS_BY_NAME,
+    render=lambda page: "🔍 Найдено несколько учеников, выберите, за кого внесена оплата:" if page.items
+    else "❌ Ученики не найдены",
+    item_button=lambda item: InlineKeyboardButton(text=item['name'], callback_data=f"pay_student:{item['key']}"),
+)
+
+
 # ===== ОБРАБОТЧИКИ КОМАНД (ВЫСОКИЙ ПРИОРИТЕТ) =====
 
 @admin_router.message(F.text.endswith('Админ панель'))
@@ -163,13 +229,9 @@ async def process_payment_input(message: Message, state: FSMContext):
         )
 
         if len(possible_students) > 1:
-            students_list = "\n".join([f"• {s['name']}" for s in possible_students])
-            await message.answer(
-                f"🔍 Найдено несколько учеников по запросу '{student_name}':\n\n"
-                f"{students_list}\n\n"
-                f"Уточните ФИО ученика:",
-                reply_markup=await home_page_kb(message.from_user.id)
-            )
+            # Состояние сохраняется: можно выбрать кнопкой или ввести ФИО точнее
+            await state.update_data(payment_query=f"%{student_name}%", payment_amount=amount)
+            await payment_students_list.show(message, f"%{student_name}%")
             return
         elif len(possible_students) == 0:
             await message.answer(
@@ -182,21 +244,7 @@ async def process_payment_input(message: Message, state: FSMContext):
         # Обработка оплаты
         result = await process_payment(student_name, amount)
 
-        if result["success"]:
-            response_text = (
-                f"✅ Оплата успешно обработана!\n\n"
-                f"👤 Ученик: <b>{result['student_name']}</b>\n"
-                f"💳 Сумма: <b>{result['amount']} руб.</b>\n"
-                f"🎯 Тариф: <b>{result['price_description']}</b>\n"
-                f"📦 Занятий добавлено: <b>{result['classes_added']}</b>\n"
-                f"📊 Остаток занятий: <b>{result['new_balance']}</b>\n"
-                f"{result['price_change_info']}\n"
-                f"📅 Дата: <b>{result['payment_date']}</b>"
-            )
-        else:
-            response_text = f"❌ Ошибка: {result['error']}"
-
-        await message.answer(response_text)
+        await message.answer(_payment_text(result))
         await state.clear()
 
     except Exception as e:
@@ -204,6 +252,32 @@ async def process_payment_input(message: Message, state: FSMContext):
         await state.clear()
 
 
+@admin_router.callback_query(PaymentStates.waiting_for_payment_data, PageCallback.filter(F.list == "pay"))
+async def turn_payment_students_page(callback: CallbackQuery, callback_data: PageCallback, state: FSMContext):
+    """Листание списка учеников для оплаты"""
+    data = await state.get_data()
+    await payment_students_list.turn(callback, callback_data, data.get('payment_query', '%'))
+
+
+@admin_router.callback_query(PaymentStates.waiting_for_payment_data, F.data.startswith("pay_student:"))
+async def pick_payment_student(callback: CallbackQuery, state: FSMContext):
+    """Оплата за ученика, выбранного из списка"""
+    try:
+        student_id = int(callback.data.split(":")[1])
+        data = await state.get_data()
+
+        result = await process_payment_via_web(student_id, data['payment_amount'])
+
+        await callback.message.edit_text(_payment_text(result))
+        await callback.answer()
+        await state.clear()
+
+    except Exception as e:
+        await callback.answer("Ошибка при обработке оплаты", show_alert=True)
+        logger.error(f"❌ Ошибка оплаты за ученика из списка: {str(e)}")
+        await state.clear()
+
+
 @admin_router.message(MedicalCertificateStates.waiting_for_certificate_dates)
 async def process_medical_certificate(message: Message, state: FSMContext):
     """Обработка введенных данных о справке по болезни"""
@@ -322,51 +396,6 @@ async def parse_and_process_certificate(input_text: str) -> dict:
         return {"success": False, "error": f"Системная ошибка: {str(e)}"}
 
 
-async def calculate_missed_classes(student_id: int, start_date: date, end_date: date) -> dict:
-    """Рассчитывает количество пропущенных занятий за период болезни"""
-    try:
-        schedule_data = await execute_raw_sql(
-            """SELECT DISTINCT sched.day_week, sched.time_start
-            FROM public.student_schedule ss
-            JOIN public.schedule sched ON ss.schedule = sched.id
-            WHERE ss.student = $1;""",
-            student_id
-        )
-
-        if not schedule_data:
-            return {"success": False, "error": "У ученика нет расписания", "missed_classes": 0}
-
-        weekdays_ru_to_int = {
-            'понедельник': 0,
-            'вторник': 1,
-            'среда': 2,
-            'четверг': 3,
-            'пятница': 4,
-            'суббота': 5,
-            'воскресенье': 6
-        }
-
-        student_weekdays = [weekdays_ru_to_int[row['day_week']] for row in schedule_data]
-
-        missed_classes = 0
-        current_date = start_date
-
-        while current_date <= end_date:
-            if current_date.weekday() in student_weekdays:
-                missed_classes += 1
-            current_date += timedelta(days=1)
-
-        return {
-            "success": True,
-            "missed_classes": missed_classes,
-            "schedule_days": len(schedule_data)
-        }
-
-    except Exception as e:
-        print(f"Error calculating missed classes: {str(e)}")
-        return {"success": False, "error": f"Ошибка расчета пропущенных занятий: {str(e)}", "missed_classes": 0}
-
-
 @admin_router.message(MedicalCertificateStates.waiting_for_action, F.text.contains('➕ Добавить справку'))
 async def start_add_certificate(message: Message, state: FSMContext):
     """Начало процесса добавления новой справки"""
@@ -425,9 +454,7 @@ async def process_student_name_for_certificate(message: Message, state: FSMConte
             student_name=str(student['name'])
         )
 
-        cert_types = await execute_raw_sql(
-            "SELECT id, name_cert FROM public.medcertificat_type ORDER BY id;"
-        )
+        cert_types = await reference_cache.all("medcertificat_type")
 
         if not cert_types:
             await message.answer(
@@ -567,12 +594,9 @@ async def process_certificate_dates(message: Message, state: FSMContext):
         )
 
         if result["success"]:
-            cert_type_name = await execute_raw_sql(
-                "SELECT name_cert FROM public.medcertificat_type WHERE id = $1;",
-                data['selected_cert_type_id']
-            )
+            cert_type = await reference_cache.get("medcertificat_type", data['selected_cert_type_id'])
 
-            cert_name = cert_type_name[0]['name_cert'] if cert_type_name else "Неизвестный тип"
+            cert_name = cert_type['name_cert'] if cert_type else "Неизвестный тип"
 
             response_text = (
                 f"✅ Медицинская справка успешно добавлена!\n\n"
@@ -611,12 +635,9 @@ async def process_certificate_dates_dopusk(message: Message, state: FSMContext):
         )
 
         if result["success"]:
-            cert_type_name = await execute_raw_sql(
-                "SELECT name_cert FROM public.medcertificat_type WHERE id = $1;",
-                data['selected_cert_type_id']
-            )
+            cert_type = await reference_cache.get("medcertificat_type", data['selected_cert_type_id'])
 
-            cert_name = cert_type_name[0]['name_cert'] if cert_type_name else "Неизвестный тип"
+            cert_name = cert_type['name_cert'] if cert_type else "Неизвестный тип"
 
             response_text = (
                 f"✅ Медицинская справка успешно добавлена!\n\n"
@@ -729,46 +750,9 @@ async def back_to_main_menu(message: Message, state: FSMContext):
 
 @admin_router.message(MedicalCertificateStates.waiting_for_student_for_list, F.text.contains('📋 Все справки'))
 async def show_all_certificates(message: Message, state: FSMContext):
-    """Показывает все медицинские справки"""
+    """Показывает все медицинские справки (постранично)"""
     try:
-        certificates = await get_all_certificates()
-
-        if not certificates:
-            await message.answer("❌ В системе нет медицинских справок.")
-            await state.clear()
-            return
-
-        students_certs = {}
-        for cert in certificates:
-            student_name = cert['student_name']
-            if student_name not in students_certs:
-                students_certs[student_name] = []
-            students_certs[student_name].append(cert)
-
-        message_text = "📋 Все медицинские справки:\n\n"
-
-        for student_name, certs in students_certs.items():
-            message_text += f"👤 <b>{student_name}</b>:\n"
-
-            for cert in certs:
-                status_icon = "✅" if cert['status'] == 'active' else "❌" if cert['status'] == 'expired' else "🚫"
-                status_text = "Активная" if cert['status'] == 'active' else "Просрочена" if cert[
-                                                                                                'status'] == 'expired' else "Неактивна"
-
-                message_text += (
-                    f"  {status_icon} <b>{cert['certificate_type']}</b>\n"
-                    f"     📅 {cert['start_date']} - {cert['end_date']} ({status_text})\n"
-                )
-
-            message_text += "\n"
-
-        if len(message_text) > 4000:
-            parts = [message_text[i:i + 4000] for i in range(0, len(message_text), 4000)]
-            for part in parts:
-                await message.answer(part)
-        else:
-            await message.answer(message_text)
-
+        await certificates_list.show(message)
         await state.clear()
 
     except Exception as e:
@@ -777,6 +761,16 @@ async def show_all_certificates(message: Message, state: FSMContext):
         await state.clear()
 
 
+@admin_router.callback_query(PageCallback.filter(F.list == "cert"))
+async def turn_certificates_page(callback: CallbackQuery, callback_data: PageCallback):
+    """Листание списка всех справок"""
+    try:
+        await certificates_list.turn(callback, callback_data)
+    except Exception as e:
+        logger.error(f"Ошибка при листании списка справок: {str(e)}")
+        await callback.answer("Ошибка при получении списка справок", show_alert=True)
+
+
 @admin_router.message(MedicalCertificateStates.waiting_for_student_for_list)
 async def show_student_certificates(message: Message, state: FSMContext):
     """Показывает медицинские справки конкретного ученика"""
@@ -871,19 +865,11 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
         student_id = student['id']
         current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
 
-        trainer_data = await execute_raw_sql(
-            """SELECT id, name 
-            FROM public.trainer 
-            WHERE telegram_id = $1
-            AND active = true
-            LIMIT 1;""",
-            trainer_telegram_id
-        )
+        trainer = await principal_cache.trainer(trainer_telegram_id, active_only=True)
 
-        if not trainer_data:
+        if not trainer:
             return {"success": False, "error": "Тренер не найден"}
 
-        trainer = trainer_data[0]
         trainer_id = trainer['id']
 
         current_datetime_data = await execute_raw_sql("SELECT NOW() as current_datetime;")
@@ -891,15 +877,7 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
         current_date = current_datetime.date()
         current_time = current_datetime.time()
 
-        today_visits = await execute_raw_sql(
-            """SELECT COUNT(*) as visit_count 
-            FROM public.visit 
-            WHERE student = $1 
-            AND DATE(data) = $2;""",
-            student_id, current_date
-        )
-
-        visit_count = today_visits[0]['visit_count'] if today_visits else 0
+        visit_count = await count_student_visits(student_id, current_date)
         class_deducted = False
         new_balance = current_balance
 
@@ -913,33 +891,25 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
             )
 
         if not place_id:
-            place_data = await execute_raw_sql(
-                "SELECT id, name FROM public.training_place LIMIT 1;"
-            )
+            place_data = (await reference_cache.all("training_place"))[:1]
             if not place_data:
                 return {"success": False, "error": "Не найдены места тренировок"}
             place = place_data[0]
             place_id = place['id']
         else:
-            place_data = await execute_raw_sql(
-                "SELECT id, name FROM public.training_place WHERE id = $1;",
-                place_id
-            )
+            place = await reference_cache.get("training_place", place_id)
+            place_data = [place] if place else []
             if not place_data:
                 return {"success": False, "error": "Указанное место тренировки не найдено"}
             place = place_data[0]
 
         if not discipline_id:
-            sport_data = await execute_raw_sql(
-                "SELECT id, name FROM public.sport LIMIT 1;"
-            )
+            sport_data = (await reference_cache.all("sport"))[:1]
             sport_id = sport_data[0]['id'] if sport_data else 1
             sport_name = sport_data[0]['name'] if sport_data else "Неизвестная дисциплина"
         else:
-            sport_data = await execute_raw_sql(
-                "SELECT id, name FROM public.sport WHERE id = $1;",
-                discipline_id
-            )
+            sport = await reference_cache.get("sport", discipline_id)
+            sport_data = [sport] if sport else []
             if sport_data:
                 sport_id = sport_data[0]['id']
                 sport_name = sport_data[0]['name']
@@ -5,7 +5,8 @@ from aiogram.fsm.state import State, StatesGroup
 
 from database.models import schema
 
-from db_handler.db_funk import execute_raw_sql
+from db_handler.db_funk import execute_raw_sql, get_user_permissions
+from db_handler.roster_cache import roster_cache
 from keyboards.kbs import main_kb
 
 from logger_config import logger
@@ -23,11 +24,9 @@ universe_text = ('Чтоб получить информацию о своем 
 @create_user_router.message(F.text == "🥋 Новый ученик")
 async def add_new_student(message: Message):
     # Проверяем права
-    user_permission = await execute_raw_sql(
-        f"SELECT permissions FROM {schema}.telegram_user WHERE telegram_id = {message.from_user.id};"
-    )
+    user_permission = await get_user_permissions(message.from_user.id)
 
-    if not user_permission or user_permission[0]['permissions'] not in (1, 2, 99):
+    if user_permission not in (1, 2, 99):
         await message.answer("⛔ У вас нет прав для добавления учеников")
         return
 
@@ -140,6 +139,7 @@ async def process_schedule_copy(message: Message, state: FSMContext):
             WHERE student = {source_student_id};
             """
         )
+        await roster_cache.invalidate_student(new_student_id)
 
         # Получаем количество скопированных занятий
         count_result = await execute_raw_sql(
@@ -14,8 +14,14 @@ from config import settings
 from create_bot import bot, get_redis_storage
 from database.database_module import create_visit_record_model
 from database.models import schema
-from db_handler.db_funk import get_user_data, insert_user, execute_raw_sql
+from db_handler.attendance_service import mark_attendance
+from db_handler.db_funk import get_user_data, insert_user, execute_raw_sql, ACTIVE_STUDENTS_BY_NAME
+from db_handler.principal_cache import principal_cache
+from db_handler.roster_cache import roster_cache
+from database.reference_cache import reference_cache
+from db_handler.visit_queries import visit_exists, count_student_visits, day_range, data_between
 from keyboards.kbs import main_kb, home_page_kb, places_kb
+from keyboards.pagination import KeysetList, PageCallback
 from utils.utils import get_refer_id, get_now_time, get_current_week_day, get_belt_emoji
 from aiogram.utils.chat_action import ChatActionSender
 from logger_config import logger
@@ -104,22 +110,8 @@ async def get_profile(message: Message):
 @user_router.message(F.text.contains('⚙️ Посещения'))
 async def handle_visits(message: types.Message):
     try:
-        # Проверяем кэш прав
-        cached_permissions = None
-        if redis_storage:
-            cached_permissions = await redis_storage.get_user_data(message.from_user.id, "permissions")
-
-        if cached_permissions is not None:
-            user_permission = cached_permissions
-        else:
-            user_permission = await execute_raw_sql(
-                f"""SELECT permissions FROM {schema}.telegram_user 
-                WHERE telegram_id = {message.from_user.id};"""
-            )
-            if user_permission:
-                user_permission = user_permission[0]['permissions']
-                if redis_storage:
-                    await redis_storage.set_user_data(message.from_user.id, "permissions", user_permission, 7200)
+        # Права берем из кэша пользователей
+        user_permission = await principal_cache.permissions(message.from_user.id)
 
         if user_permission and user_permission in (1, 2, 99):
             await message.answer("Выберите место:", reply_markup=places_kb())
@@ -139,20 +131,14 @@ class TrainingStates(StatesGroup):
 
 async def get_trainer_name(trainer_id: int) -> str:
     """Получает имя тренера по ID"""
-    trainer_data = await execute_raw_sql(
-        f"SELECT name FROM {schema}.trainer WHERE id = $1;",
-        trainer_id
-    )
-    return trainer_data[0]['name'] if trainer_data else f"Тренер #{trainer_id}"
+    trainer = await reference_cache.get("trainer", trainer_id)
+    return trainer['name'] if trainer else f"Тренер #{trainer_id}"
 
 
 async def get_place_name(place_id: int) -> str:
     """Получает название места по ID"""
-    place_data = await execute_raw_sql(
-        f"SELECT name FROM {schema}.training_place WHERE id = $1;",
-        place_id
-    )
-    return place_data[0]['name'] if place_data else f"Место #{place_id}"
+    place = await reference_cache.get("training_place", place_id)
+    return place['name'] if place else f"Место #{place_id}"
 
 
 async def get_schedule_time(schedule_id: int) -> Optional[time]:
@@ -170,14 +156,11 @@ async def get_belt_emoji(rang_id: int) -> str:
         return "⚪️"  # По умолчанию белый пояс
 
     try:
-        # Получаем эмодзи пояса напрямую из базы
-        belt_data = await execute_raw_sql(
-            "SELECT color FROM public.belt_color WHERE id = $1;",
-            rang_id
-        )
+        # Получаем эмодзи пояса из кэша справочников
+        belt = await reference_cache.get("belt_color", rang_id)
 
-        if belt_data and belt_data[0]['color']:
-            return belt_data[0]['color']
+        if belt and belt['color']:
+            return belt['color']
     except Exception as e:
         print(f"Error getting belt emoji: {e}")
 
@@ -300,41 +283,16 @@ async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
             return
 
         # Получаем данные тренера
-        trainer_data = await execute_raw_sql(
-            f"SELECT id, name FROM {schema}.trainer WHERE telegram_id = $1;",
-            callback.from_user.id
-        )
-        if not trainer_data:
+        trainer = await principal_cache.trainer(callback.from_user.id)
+        if not trainer:
             await callback.answer("⛔ Вы не зарегистрированы как тренер", show_alert=True)
             return
 
-        trainer_id = trainer_data[0]['id']
-        trainer_name = trainer_data[0]['name']
-
-        # Проверяем кэш студентов
-        cache_key = f"students:schedule:{schedule_id}"
-        cached_students = None
-        if redis_storage:
-            cached_students = await redis_storage.get_user_data(callback.from_user.id, cache_key)
-
-        if cached_students:
-            students = cached_students
-        else:
-            # Получаем студентов на тренировку
-            students_raw = await execute_raw_sql(
-                f"""SELECT st.id, st.name 
-                FROM {schema}.student_schedule ss
-                JOIN {schema}.student st ON ss.student = st.id
-                WHERE ss.schedule = $1 AND st.active = true;""",
-                int(schedule_id)
-            )
-
-            # Преобразуем в сериализуемый формат
-            students = [{'id': s['id'], 'name': s['name']} for s in students_raw]
+        trainer_id = trainer['id']
+        trainer_name = trainer['name']
 
-            # Сохраняем в кэш на 1 час
-            if redis_storage and students:
-                await redis_storage.set_user_data(callback.from_user.id, cache_key, students, 3600)
+        # Студенты тренировки - общий кэш для всех тренеров, сбрасывается при изменении списка
+        students = await roster_cache.get(int(schedule_id))
 
         if not students:
             await callback.message.answer("На этой тренировке нет записанных студентов.")
@@ -416,9 +374,6 @@ async def select_student(callback: CallbackQuery):
         _, student_id = callback.data.split(":")
         user_id = callback.from_user.id
 
-        # Получаем текущий выбор из Redis
-        selected_students = await redis_storage.get_selected_students(user_id)
-
         # Обновляем клавиатуру
         new_keyboard = []
         for row in callback.message.reply_markup.inline_keyboard:
@@ -427,14 +382,11 @@ async def select_student(callback: CallbackQuery):
                 if button.callback_data == callback.data:
                     student_name = button.text[2:]  # Убираем эмодзи
 
-                    if student_id in selected_students:
-                        # Удаляем студента из выбора
-                        await redis_storage.remove_student(user_id, student_id)
-                        new_text = f"⬜️ {student_name}"
-                    else:
-                        # Добавляем студента в выбор
-                        await redis_storage.add_student(user_id, student_id, student_name)
+                    # Выбор или снятие студента - одна атомарная команда Redis
+                    if await redis_storage.toggle_student(user_id, student_id, student_name):
                         new_text = f"☑️ {student_name}"
+                    else:
+                        new_text = f"⬜️ {student_name}"
 
                     new_row.append(InlineKeyboardButton(text=new_text, callback_data=button.callback_data))
                 else:
@@ -466,78 +418,29 @@ async def confirm_attendance(callback: CallbackQuery):
             return
 
         # Парсим параметры
-        _, schedule_id, trainer_id, place_id, discipline_id = callback.data.split(":")
+        _, schedule_id, trainer_id, _place_id, _discipline_id = callback.data.split(":")
         schedule_id = int(schedule_id)
         trainer_id = int(trainer_id)
-        place_id = int(place_id)
-        discipline_id = int(discipline_id)
-
-        # Получаем данные тренировки
-        schedule_data = await execute_raw_sql(
-            f"SELECT time_start FROM {schema}.schedule WHERE id = $1;",
-            schedule_id
-        )
-        if not schedule_data:
-            await callback.answer("Расписание не найдено", show_alert=True)
-            return
 
         # Работа с временем - используем наивные datetime (без временной зоны)
         current_datetime = datetime.now()
         current_date = current_datetime.date()
-        schedule_time = schedule_data[0]['time_start']
-
-        # Сохраняем посещения
-        success_count = 0
-        skipped_count = 0
-        errors = []
 
-        for student_id_str, student_name in selected_students.items():
-            try:
-                student_id = int(student_id_str)
-
-                # Проверка на дубликат (используем только дату)
-                existing = await execute_raw_sql(
-                    f"""SELECT 1 FROM {schema}.visit 
-                    WHERE student = $1 AND shedule = $2 
-                    AND DATE(data) = $3 LIMIT 1;""",
-                    student_id, schedule_id, current_date
-                )
-
-                if existing:
-                    skipped_count += 1
-                    continue
-
-                # Сохраняем наивный datetime (без временной зоны)
-                await execute_raw_sql(
-                    f"""INSERT INTO {schema}.visit (
-                        data, trainer, student, place, sport_discipline, shedule
-                    ) VALUES ($1, $2, $3, $4, $5, $6);""",
-                    current_datetime,  # Наивный datetime
-                    trainer_id,
-                    student_id,
-                    place_id,
-                    discipline_id,
-                    schedule_id
-                )
-                success_count += 1
-
-            except Exception as e:
-                errors.append(f"{student_name}: {str(e)}")
+        # Сохраняем посещения одним запросом (время начала тренировки приходит в ответе)
+        result = await mark_attendance(schedule_id, selected_students.keys(), current_datetime, trainer_id)
+        if not result.schedule_found:
+            await callback.answer("Расписание не найдено", show_alert=True)
+            return
 
         # Формируем отчет
         report = [
             f"📅 Дата: {current_date.strftime('%d.%m.%Y')}",
-            f"⏱ Время: {schedule_time.strftime('%H:%M')}",
-            f"✅ Успешно: {success_count}",
-            f"⏭ Пропущено (дубли): {skipped_count}",
-            f"❌ Ошибки: {len(errors)}",
+            f"⏱ Время: {result.time_start.strftime('%H:%M')}",
+            f"✅ Успешно: {result.created_count}",
+            f"⏭ Пропущено (дубли): {result.duplicate_count}",
             *[f"• {name}" for name in selected_students.values()]
         ]
 
-        if errors:
-            report.append("\nПоследние ошибки:")
-            report.extend(errors[:3])
-
         await callback.message.answer("\n".join(report))
 
         # ОЧИЩАЕМ ВЫБОР ПОСЛЕ ПОДТВЕРЖДЕНИЯ
@@ -604,7 +507,7 @@ async def show_attendance_status(callback: CallbackQuery):
             LEFT JOIN {schema}.student_schedule ss ON ss.student = st.id AND ss.schedule = $1
             LEFT JOIN {schema}.visit v ON v.student = st.id 
                 AND v.shedule = $1 
-                AND DATE(v.data) = $2
+                AND {data_between('v', 2)}
             WHERE st.active = true
             AND (
                 ss.schedule = $1  -- Студенты из расписания
@@ -612,7 +515,7 @@ async def show_attendance_status(callback: CallbackQuery):
                     SELECT 1 FROM {schema}.visit v2 
                     WHERE v2.student = st.id 
                     AND v2.shedule = $1 
-                    AND DATE(v2.data) = $2
+                    AND {data_between('v2', 2)}
                 )
             )
             ORDER BY 
@@ -628,7 +531,7 @@ async def show_attendance_status(callback: CallbackQuery):
                     WHEN bc.color = '⚫️' THEN 8
                     ELSE 999
                 END, st.name;""",
-            schedule_id, current_date
+            schedule_id, *day_range(current_date)
         )
 
         if not students:
@@ -691,24 +594,36 @@ async def show_attendance_status(callback: CallbackQuery):
         print(f"Error in show_attendance_status: {str(e)}")
 
 
-async def record_extra_student_visit(student_name: str, trainer_telegram_id: int,
+async def record_extra_student_visit(student_name: Optional[str], trainer_telegram_id: int,
                                      schedule_id: int = None, place_id: int = None,
-                                     discipline_id: int = None) -> dict:
+                                     discipline_id: int = None, student_id: int = None) -> dict:
     """
     Записывает ученика на тренировку не по расписанию
+    student_id - ученик, выбранный из списка; иначе поиск по student_name
     """
     try:
         # Ищем ученика
-        student_data = await execute_raw_sql(
-            f"""SELECT id, name, classes_remaining, rang
-            FROM public.student 
-            WHERE active = true 
-            AND name ILIKE $1
-            LIMIT 1;""",
-            f"%{student_name}%"
-        )
+        if student_id is not None:
+            student_data = await execute_raw_sql(
+                f"""SELECT id, name, classes_remaining, rang
+                FROM public.student 
+                WHERE active = true 
+                AND id = $1;""",
+                student_id
+            )
+        else:
+            student_data = await execute_raw_sql(
+                f"""SELECT id, name, classes_remaining, rang
+                FROM public.student 
+                WHERE active = true 
+                AND name ILIKE $1
+                LIMIT 1;""",
+                f"%{student_name}%"
+            )
 
         if not student_data:
+            if student_id is not None:
+                return {"success": False, "error": "Выбранный ученик не найден или больше не активен"}
             return {"success": False, "error": f"Ученик '{student_name}' не найден"}
 
         student = student_data[0]
@@ -716,19 +631,11 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
         current_balance = student['classes_remaining'] if student['classes_remaining'] is not None else 0
 
         # Ищем тренера по telegram_id
-        trainer_data = await execute_raw_sql(
-            f"""SELECT id, name 
-            FROM public.trainer 
-            WHERE telegram_id = $1
-            AND active = true
-            LIMIT 1;""",
-            trainer_telegram_id
-        )
+        trainer = await principal_cache.trainer(trainer_telegram_id, active_only=True)
 
-        if not trainer_data:
+        if not trainer:
             return {"success": False, "error": "Тренер не найден"}
 
-        trainer = trainer_data[0]
         trainer_id = trainer['id']
 
         # Получаем текущие дату и время в правильном формате (без часового пояса)
@@ -738,32 +645,14 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
         current_time = current_datetime.time()
 
         # ПРОВЕРКА НА ДУБЛИКАТ: проверяем, не был ли уже ученик записан на эту тренировку сегодня
-        existing_visit = await execute_raw_sql(
-            f"""SELECT id 
-            FROM public.visit 
-            WHERE student = $1 
-            AND shedule = $2 
-            AND DATE(data) = $3
-            LIMIT 1;""",
-            student_id, schedule_id, current_date
-        )
-
-        if existing_visit:
+        if await visit_exists(student_id, schedule_id, current_date):
             return {
                 "success": False,
                 "error": f"Ученик {student['name']} уже записан на эту тренировку сегодня"
             }
 
         # Проверяем, было ли сегодня уже списание у этого ученика (для любых тренировок)
-        today_visits = await execute_raw_sql(
-            f"""SELECT COUNT(*) as visit_count 
-            FROM public.visit 
-            WHERE student = $1 
-            AND DATE(data) = $2;""",
-            student_id, current_date
-        )
-
-        visit_count = today_visits[0]['visit_count'] if today_visits else 0
+        visit_count = await count_student_visits(student_id, current_date)
         class_deducted = False
         new_balance = current_balance
 
@@ -782,19 +671,15 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
         # Определяем место тренировки
         if not place_id:
             # Если место не передано, используем первое доступное
-            place_data = await execute_raw_sql(
-                f"SELECT id, name FROM public.training_place LIMIT 1;"
-            )
+            place_data = (await reference_cache.all("training_place"))[:1]
             if not place_data:
                 return {"success": False, "error": "Не найдены места тренировок"}
             place = place_data[0]
             place_id = place['id']
         else:
             # Получаем информацию о переданном месте
-            place_data = await execute_raw_sql(
-                f"SELECT id, name FROM public.training_place WHERE id = $1;",
-                place_id
-            )
+            place = await reference_cache.get("training_place", place_id)
+            place_data = [place] if place else []
             if not place_data:
                 return {"success": False, "error": "Указанное место тренировки не найдено"}
             place = place_data[0]
@@ -802,17 +687,13 @@ async def record_extra_student_visit(student_name: str, trainer_telegram_id: int
         # Определяем спортивную дисциплина
         if not discipline_id:
             # Если дисциплина не передана, используем первую доступную
-            sport_data = await execute_raw_sql(
-                f"SELECT id, name FROM public.sport LIMIT 1;"
-            )
+            sport_data = (await reference_cache.all("sport"))[:1]
             sport_id = sport_data[0]['id'] if sport_data else 1
             sport_name = sport_data[0]['name'] if sport_data else "Неизвестная дисциплина"
         else:
             # Получаем информацию о переданной дисциплине
-            sport_data = await execute_raw_sql(
-                f"SELECT id, name FROM public.sport WHERE id = $1;",
-                discipline_id
-            )
+            sport = await reference_cache.get("sport", discipline_id)
+            sport_data = [sport] if sport else []
             if sport_data:
                 sport_id = sport_data[0]['id']
                 sport_name = sport_data[0]['name']
@@ -894,6 +775,37 @@ async def handle_extra_student(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Error in handle_extra_student: {str(e)}")
 
 
+def _extra_visit_text(result: dict) -> str:
+    if not result["success"]:
+        return f"❌ Ошибка: {result['error']}"
+
+    response_text = (
+        f"✅ Ученик записан на тренировку!\n\n"
+        f"👤 Ученик: <b>{result['student_name']}</b>\n"
+        f"🏢 Место: <b>{result['place_name']}</b>\n"
+        f"📅 Дата: <b>{result['visit_date']}</b>\n"
+        f"⏰ Время: <b>{result['visit_time']}</b>\n"
+    )
+
+    if result['class_deducted']:
+        response_text += f"📊 Списано занятие: <b>Да</b>\n"
+        response_text += f"🎯 Новый баланс: <b>{result['new_balance']}</b> занятий"
+    else:
+        response_text += f"📊 Списано занятие: <b>Нет</b> (уже списано сегодня)\n"
+        response_text += f"🎯 Текущий баланс: <b>{result['new_balance']}</b> занятий"
+    return response_text
+
+
+# Выбор ученика, если по введенному имени нашлось несколько
+extra_students_list = KeysetList(
+    "extra",
+    ACTIVE_STUDENTS_BY_NAME,
+    render=lambda page: "🔍 Найдено несколько учеников, выберите нужного:" if page.items
+    else "❌ Ученики не найдены",
+    item_button=lambda item: InlineKeyboardButton(text=item['name'], callback_data=f"extra_pick:{item['key']}"),
+)
+
+
 @user_router.message(TrainingStates.waiting_for_extra_student)
 async def process_extra_student_name(message: Message, state: FSMContext):
     """Обработка введенного имени ученика не по расписанию"""
@@ -901,6 +813,19 @@ async def process_extra_student_name(message: Message, state: FSMContext):
         student_name = message.text.strip()
         data = await state.get_data()
 
+        matches = await execute_raw_sql(
+            """SELECT id FROM public.student
+            WHERE active = true
+            AND name ILIKE $1
+            LIMIT 2;""",
+            f"%{student_name}%"
+        )
+        if len(matches) > 1:
+            # Состояние сохраняется: можно выбрать кнопкой или ввести ФИО точнее
+            await state.update_data(extra_query=f"%{student_name}%")
+            await extra_students_list.show(message, f"%{student_name}%")
+            return
+
         # Используем нашу функцию для записи ученика
         result = await record_extra_student_visit(
             student_name=student_name,
@@ -910,25 +835,7 @@ async def process_extra_student_name(message: Message, state: FSMContext):
             discipline_id=data.get('discipline_id')
         )
 
-        if result["success"]:
-            response_text = (
-                f"✅ Ученик записан на тренировку!\n\n"
-                f"👤 Ученик: <b>{result['student_name']}</b>\n"
-                f"🏢 Место: <b>{result['place_name']}</b>\n"
-                f"📅 Дата: <b>{result['visit_date']}</b>\n"
-                f"⏰ Время: <b>{result['visit_time']}</b>\n"
-            )
-
-            if result['class_deducted']:
-                response_text += f"📊 Списано занятие: <b>Да</b>\n"
-                response_text += f"🎯 Новый баланс: <b>{result['new_balance']}</b> занятий"
-            else:
-                response_text += f"📊 Списано занятие: <b>Нет</b> (уже списано сегодня)\n"
-                response_text += f"🎯 Текущий баланс: <b>{result['new_balance']}</b> занятий"
-        else:
-            response_text = f"❌ Ошибка: {result['error']}"
-
-        await message.answer(response_text)
+        await message.answer(_extra_visit_text(result))
         await state.clear()
 
     except Exception as e:
@@ -937,3 +844,36 @@ async def process_extra_student_name(message: Message, state: FSMContext):
         await state.clear()
 
 
+@user_router.callback_query(TrainingStates.waiting_for_extra_student, PageCallback.filter(F.list == "extra"))
+async def turn_extra_students_page(callback: CallbackQuery, callback_data: PageCallback, state: FSMContext):
+    """Листание списка найденных учеников"""
+    data = await state.get_data()
+    await extra_students_list.turn(callback, callback_data, data.get('extra_query', '%'))
+
+
+@user_router.callback_query(TrainingStates.waiting_for_extra_student, F.data.startswith("extra_pick:"))
+async def pick_extra_student(callback: CallbackQuery, state: FSMContext):
+    """Запись ученика, выбранного из списка"""
+    try:
+        student_id = int(callback.data.split(":")[1])
+        data = await state.get_data()
+
+        result = await record_extra_student_visit(
+            student_name=None,
+            trainer_telegram_id=callback.from_user.id,
+            schedule_id=data.get('schedule_id'),
+            place_id=data.get('place_id'),
+            discipline_id=data.get('discipline_id'),
+            student_id=student_id
+        )
+
+        await callback.message.edit_text(_extra_visit_text(result))
+        await callback.answer()
+        await state.clear()
+
+    except Exception as e:
+        await callback.answer("Ошибка при записи ученика", show_alert=True)
+        logger.error(f"❌ Ошибка при записи ученика из списка: {str(e)}")
+        await state.clear()
+
+
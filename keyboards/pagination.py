@@ -0,0 +1,125 @@
+"""
+Постраничные inline-клавиатуры для больших списков бота.
+
+Страница выбирается по ключу (keyset), а не через OFFSET: следующая страница -
+строки после последней показанной, предыдущая - перед первой, и в бот
+передается только page_size + 1 строк. В callback data лежит только имя
+списка, направление и id крайней строки (например pg:cert:n:1834), а страница
+редактируется в том же сообщении.
+
+Сколько строк прочитает сам Postgres, зависит от base_sql: без индекса под
+порядок (sort_key, key) каждая страница сортирует весь результат base_sql.
+
+Запрос списка (base_sql) должен возвращать колонки key (уникальный int) и
+sort_key (без NULL); порядок - (sort_key, key). Параметры base_sql - $1..$n,
+свои параметры пагинатор добавляет после них.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from database.engines import acquire
+
+
+class PageCallback(CallbackData, prefix="pg"):
+    list: str    # имя списка (KeysetList.name)
+    dir: str     # n - страница после cursor, p - перед cursor
+    cursor: int  # key крайней строки показанной страницы
+
+
+@dataclass
+class Page:
+    items: List[Dict[str, Any]]
+    has_prev: bool
+    has_next: bool
+
+
+class KeysetList:
+    """Список из БД, листаемый кнопками ⬅️ / ➡️ в одном сообщении"""
+
+    def __init__(self, name: str, base_sql: str, render: Callable[[Page], str],
+                 item_button: Optional[Callable[[Dict[str, Any]], InlineKeyboardButton]] = None,
+                 page_size: int = 10):
+        self.name = name
+        self.base_sql = base_sql
+        self.render = render
+        self.item_button = item_button
+        self.page_size = page_size
+
+    def _sql(self, param_count: int, cursor: bool, forward: bool) -> str:
+        limit = f"${param_count + 1}"
+        where = ""
+        if cursor:
+            op = ">" if forward else "<"
+            cursor_param = f"${param_count + 2}"
+            where = f"WHERE (sort_key, key) {op} (SELECT sort_key, key FROM rows WHERE key = {cursor_param})"
+        order = "ASC" if forward else "DESC"
+        # NOT MATERIALIZED: условие по курсору и LIMIT попадают внутрь base_sql
+        return f"""WITH rows AS NOT MATERIALIZED ({self.base_sql})
+            SELECT * FROM rows
+            {where}
+            ORDER BY sort_key {order}, key {order}
+            LIMIT {limit}"""
+
+    async def fetch(self, *params, cursor: int = 0, direction: str = "n") -> Page:
+        forward = direction != "p"
+        sql = self._sql(len(params), bool(cursor), forward)
+        args = [*params, self.page_size + 1] + ([cursor] if cursor else [])
+        async with acquire() as conn:
+            rows = [dict(row) for row in await conn.fetch(sql, *args)]
+
+        if cursor and not rows:
+            # Строка-курсор удалена или список изменился - показываем начало
+            return await self.fetch(*params)
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if forward:
+            return Page(items=rows, has_prev=bool(cursor), has_next=has_more)
+        return Page(items=list(reversed(rows)), has_prev=has_more, has_next=True)
+
+    def markup(self, page: Page, extra: Sequence[InlineKeyboardButton] = ()) -> InlineKeyboardMarkup:
+        builder = InlineKeyboardBuilder()
+        if self.item_button is not None:
+            for item in page.items:
+                builder.row(self.item_button(item))
+
+        navigation = []
+        if page.has_prev and page.items:
+            navigation.append(InlineKeyboardButton(
+                text="⬅️",
+                callback_data=PageCallback(list=self.name, dir="p", cursor=page.items[0]["key"]).pack()
+            ))
+        if page.has_next and page.items:
+            navigation.append(InlineKeyboardButton(
+                text="➡️",
+                callback_data=PageCallback(list=self.name, dir="n", cursor=page.items[-1]["key"]).pack()
+            ))
+        if navigation:
+            builder.row(*navigation)
+        for button in extra:
+            builder.row(button)
+        return builder.as_markup()
+
+    async def show(self, message: Message, *params, extra: Sequence[InlineKeyboardButton] = ()) -> Page:
+        """Отправить первую страницу новым сообщением"""
+        page = await self.fetch(*params)
+        await message.answer(self.render(page), reply_markup=self.markup(page, extra))
+        return page
+
+    async def turn(self, callback: CallbackQuery, callback_data: PageCallback, *params,
+                   extra: Sequence[InlineKeyboardButton] = ()) -> Page:
+        """Перелистнуть страницу в том же сообщении"""
+        page = await self.fetch(*params, cursor=callback_data.cursor, direction=callback_data.dir)
+        try:
+            await callback.message.edit_text(self.render(page), reply_markup=self.markup(page, extra))
+        except TelegramBadRequest as e:
+            # Повторное нажатие на ту же кнопку - страница уже показана
+            if "message is not modified" not in str(e):
+                raise
+        await callback.answer()
+        return page
@@ -0,0 +1,134 @@
+"""
+Правила ночного списания без обращения к БД.
+
+Функции модуля работают только со снимком (DaySnapshot) и ничего не читают
+и не пишут сами: чтение снимков и запись результатов выполняет хранилище
+(attendance_storage.py). Поэтому те же правила работают и с PostgreSQL,
+и с данными в памяти (бенчмарк, проверка без БД):
+
+- plan_write_offs - кому и сколько занятий списать за день;
+- charge - списание по плану в памяти (пробный запуск, хранилище в памяти);
+- payment_dates - даты следующей оплаты по балансам и расписанию.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from db_handler.schedule_calendar import ScheduleCalendar, project_payment_date, weekday_weights
+from db_handler.write_off_ledger import REASON_DAY, REASON_WEEK_TOP_UP
+from regulatory_tasks.day_snapshot import DaySnapshot
+
+
+@dataclass
+class PlannedWriteOff:
+    student_id: int
+    quantity: int
+    reason: str
+
+
+def kind(snapshot: DaySnapshot, student_id: int) -> str:
+    """tariff_8, special (тарифы 3, 4 в субботу) или regular"""
+    student = snapshot.students[student_id]
+    if student['classes_in_price'] == 8:
+        return 'tariff_8'
+    if snapshot.is_saturday and student['price'] in snapshot.special_tariffs:
+        return 'special'
+    return 'regular'
+
+
+def is_due(snapshot: DaySnapshot, student_id: int) -> bool:
+    """Есть ли сегодня тренировка по расписанию или посещение"""
+    student = snapshot.students[student_id]
+    # В будни ученики без тарифа не списываются
+    if not snapshot.is_saturday and student['classes_in_price'] is None:
+        return False
+    return (snapshot.weekday_ru in snapshot.schedule_days.get(student_id, ())
+            or student_id in snapshot.day_visits)
+
+
+def plan_write_offs(snapshot: DaySnapshot) -> List[PlannedWriteOff]:
+    """
+    Списания за день:
+    - тариф 8, будни: 1 занятие;
+    - тариф 8, суббота: посещения за субботу + добор до 2 занятий за неделю;
+    - тарифы 3, 4, суббота: 2 занятия;
+    - остальные, суббота: по числу посещений, минимум 1;
+    - остальные, будни: 1 занятие.
+    """
+    planned = []
+    for student_id in snapshot.students:
+        if not is_due(snapshot, student_id):
+            continue
+
+        student_kind = kind(snapshot, student_id)
+        day_visits = snapshot.day_visits.get(student_id, 0)
+        top_up = 0
+
+        if student_kind == 'tariff_8' and snapshot.is_saturday:
+            quantity = day_visits
+            top_up = max(0, 2 - snapshot.week_visits.get(student_id, 0))
+        elif student_kind == 'special':
+            quantity = 2
+        elif snapshot.is_saturday and student_kind == 'regular':
+            quantity = max(1, day_visits)
+        else:
+            quantity = 1
+
+        if quantity > 0:
+            planned.append(PlannedWriteOff(student_id, quantity, REASON_DAY))
+        if top_up > 0:
+            planned.append(PlannedWriteOff(student_id, top_up, REASON_WEEK_TOP_UP))
+    return planned
+
+
+def charge(snapshot: DaySnapshot, planned: List[PlannedWriteOff]) -> List[Dict[str, Any]]:
+    """
+    Итог списания по плану без записи: строки в формате WriteOffLedger.flush
+    (id, name, classes_remaining, price, quantity). Балансы в снимке не меняются.
+    """
+    totals: Dict[int, int] = {}
+    for item in planned:
+        totals[item.student_id] = totals.get(item.student_id, 0) + item.quantity
+
+    rows = []
+    for student_id, quantity in totals.items():
+        student = snapshot.students[student_id]
+        rows.append({
+            'id': student_id,
+            'name': student['name'],
+            'classes_remaining': student['classes_remaining'] - quantity,
+            'price': student['price'],
+            'quantity': quantity,
+        })
+    return rows
+
+
+def payment_dates(snapshot: DaySnapshot) -> Dict[int, date]:
+    """Дата следующей оплаты для каждого ученика снимка"""
+    result = {}
+    # Календари с одинаковыми весами общие: расписаний намного меньше, чем учеников
+    calendars: Dict[tuple, ScheduleCalendar] = {}
+    for student_id, student in snapshot.students.items():
+        # В субботу списывается 2 занятия, для тарифа 8 - одно
+        saturday_weight = 1 if student['classes_in_price'] == 8 else 2
+        weights = weekday_weights(snapshot.schedule_days.get(student_id, []), saturday_weight)
+        calendar = calendars.get(weights)
+        if calendar is None:
+            calendar = calendars[weights] = ScheduleCalendar(weights, snapshot.closures)
+        result[student_id] = project_payment_date(calendar, student['classes_remaining'], snapshot.day)
+    return result
+
+
+def student_summary(snapshot: DaySnapshot, student_id: int, quantity: int,
+                    classes_remaining: Optional[int] = None) -> Dict[str, Any]:
+    """Строка для анализа и отчета по списанию"""
+    student = snapshot.students[student_id]
+    return {
+        'id': student_id,
+        'name': student['name'],
+        'price': student['price'],
+        'classes_remaining': student['classes_remaining'] if classes_remaining is None else classes_remaining,
+        'quantity': quantity,
+        'kind': kind(snapshot, student_id),
+        'day_visits': snapshot.day_visits.get(student_id, 0),
+    }
@@ -0,0 +1,205 @@
+"""
+Хранилища для ночного списания (AttendanceProcessor).
+
+AttendanceProcessor не обращается к БД напрямую: снимки он получает, а
+списания и даты оплаты записывает через хранилище с тремя операциями:
+
+- load_snapshots(date_from, date_to) - снимки за каждый день периода;
+- write_off(day, planned) - записать списания и вернуть строки учеников,
+  у которых занятия списаны сейчас (повторное списание за тот же день
+  и с той же причиной пропускается);
+- save_payment_dates(dates) - записать даты следующей оплаты.
+
+PostgresAttendanceStorage работает с БД (DaySnapshot.load_range, WriteOffLedger,
+UPDATE ... FROM unnest), InMemoryAttendanceStorage - со словарями в памяти
+(бенчмарк и проверка правил без БД). Оба считают запросы в `queries`.
+"""
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from database.engines import acquire
+from database.models import schema
+from db_handler.write_off_ledger import WriteOffLedger
+from regulatory_tasks.attendance_core import PlannedWriteOff
+from regulatory_tasks.day_snapshot import DaySnapshot
+
+
+class AttendanceStorage(ABC):
+    """Интерфейс хранилища ночного списания"""
+
+    def __init__(self, special_tariffs: List[int]):
+        self.special_tariffs = list(special_tariffs)
+        self.queries = 0
+
+    @abstractmethod
+    async def load_snapshots(self, date_from: date, date_to: date) -> List[DaySnapshot]:
+        ...
+
+    @abstractmethod
+    async def write_off(self, day: date, planned: List[PlannedWriteOff]) -> List[Any]:
+        ...
+
+    @abstractmethod
+    async def save_payment_dates(self, dates: Dict[int, date]):
+        ...
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Все записи внутри блока - одной транзакцией"""
+        yield
+
+
+class _CountingConnection:
+    """Обертка соединения asyncpg, считающая выполненные запросы"""
+
+    _COUNTED = ('execute', 'executemany', 'fetch', 'fetchrow', 'fetchval', 'copy_records_to_table')
+
+    def __init__(self, conn, storage: AttendanceStorage):
+        self._conn = conn
+        self._storage = storage
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name not in self._COUNTED:
+            return attr
+
+        async def counted(*args, **kwargs):
+            self._storage.queries += 1
+            return await attr(*args, **kwargs)
+        return counted
+
+
+class PostgresAttendanceStorage(AttendanceStorage):
+    """Хранилище в PostgreSQL"""
+
+    def __init__(self, special_tariffs: List[int]):
+        super().__init__(special_tariffs)
+        self._conn = None
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Соединение открытой транзакции или новое из пула"""
+        if self._conn is not None:
+            yield self._conn
+            return
+        async with acquire() as conn:
+            yield _CountingConnection(conn, self)
+
+    @asynccontextmanager
+    async def transaction(self):
+        async with acquire() as conn:
+            async with conn.transaction():
+                self._conn = _CountingConnection(conn, self)
+                try:
+                    yield
+                finally:
+                    self._conn = None
+
+    async def load_snapshots(self, date_from: date, date_to: date) -> List[DaySnapshot]:
+        async with self._connection() as conn:
+            return await DaySnapshot.load_range(conn, date_from, date_to, self.special_tariffs)
+
+    async def write_off(self, day: date, planned: List[PlannedWriteOff]) -> List[Any]:
+        async with self._connection() as conn:
+            if conn.is_in_transaction():
+                return await self._flush(conn, day, planned)
+            async with conn.transaction():
+                return await self._flush(conn, day, planned)
+
+    @staticmethod
+    async def _flush(conn, day: date, planned: List[PlannedWriteOff]) -> List[Any]:
+        ledger = WriteOffLedger(conn)
+        for item in planned:
+            ledger.add(item.student_id, item.quantity, day, item.reason)
+        return await ledger.flush()
+
+    async def save_payment_dates(self, dates: Dict[int, date]):
+        if not dates:
+            return
+        async with self._connection() as conn:
+            await conn.execute(
+                f"""UPDATE {schema}.student s
+                SET expected_payment_date = u.payment_date
+                FROM unnest($1::int[], $2::date[]) AS u(id, payment_date)
+                WHERE s.id = u.id""",
+                list(dates.keys()), list(dates.values())
+            )
+
+
+class InMemoryAttendanceStorage(AttendanceStorage):
+    """
+    Хранилище в памяти с теми же правилами записи, что и в PostgreSQL:
+    списание с ключом (ученик, день, причина) записывается один раз.
+    Каждая операция считается одним запросом.
+    """
+
+    def __init__(self, special_tariffs: List[int], students: Dict[int, Dict[str, Any]],
+                 schedule_days: Dict[int, List[str]], visits_by_day: Dict[date, Dict[int, int]],
+                 closures: Optional[List[date]] = None):
+        super().__init__(special_tariffs)
+        self.students = students
+        self.schedule_days = schedule_days
+        self.visits_by_day = visits_by_day
+        self.closures = sorted(closures or [])
+        self.write_offs: Dict[Tuple[int, date, str], int] = {}
+        self.payment_dates: Dict[int, date] = {}
+        self._pending: Optional[Set[Tuple[int, date, str]]] = None
+
+    async def load_snapshots(self, date_from: date, date_to: date) -> List[DaySnapshot]:
+        self.queries += 1
+        # Копия учеников: балансы снимка меняются только по результату write_off
+        students = {student_id: dict(student) for student_id, student in self.students.items()}
+        return DaySnapshot.build_range(date_from, date_to, students, self.schedule_days,
+                                       self.visits_by_day, self.closures, self.special_tariffs)
+
+    async def write_off(self, day: date, planned: List[PlannedWriteOff]) -> List[Any]:
+        self.queries += 1
+        if isinstance(day, datetime):
+            day = day.date()
+
+        totals: Dict[int, int] = {}
+        for item in planned:
+            key = (item.student_id, day, item.reason)
+            if item.quantity <= 0 or key in self.write_offs:
+                continue
+            self.write_offs[key] = item.quantity
+            if self._pending is not None:
+                self._pending.add(key)
+            totals[item.student_id] = totals.get(item.student_id, 0) + item.quantity
+
+        rows = []
+        for student_id, quantity in totals.items():
+            student = self.students[student_id]
+            student['classes_remaining'] -= quantity
+            rows.append({
+                'id': student_id,
+                'name': student['name'],
+                'classes_remaining': student['classes_remaining'],
+                'price': student['price'],
+                'quantity': quantity,
+            })
+        return rows
+
+    async def save_payment_dates(self, dates: Dict[int, date]):
+        if not dates:
+            return
+        self.queries += 1
+        self.payment_dates.update(dates)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """При ошибке списания внутри блока откатываются"""
+        balances = {student_id: student['classes_remaining'] for student_id, student in self.students.items()}
+        self._pending = set()
+        try:
+            yield
+        except Exception:
+            for key in self._pending:
+                self.write_offs.pop(key, None)
+            for student_id, balance in balances.items():
+                self.students[student_id]['classes_remaining'] = balance
+            raise
+        finally:
+            self._pending = None
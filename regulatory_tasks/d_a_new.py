@@ -19,8 +19,7 @@ sys.path.insert(0, project_root)
 try:
     from logger_config import logger
     from database.models import schema, Lesson_write_offs
-    import asyncpg
-    from config import settings
+    from database.engines import acquire, engines
 except ImportError as e:
     print(f"❌ Ошибка импорта: {e}")
     sys.exit(1)
@@ -58,15 +57,12 @@ class AttendanceProcessor:
     async def execute_raw_sql(self, query: str, *params) -> List[Any]:
         """Функция выполнения SQL запросов"""
         try:
-            conn = await asyncpg.connect(**settings.db.pg_link)
-            try:
+            async with acquire() as conn:
                 if params:
                     result = await conn.fetch(query, *params)
                 else:
                     result = await conn.fetch(query)
                 return result
-            finally:
-                await conn.close()
         except Exception as e:
             logger.error(f"Database error: {str(e)}")
             raise
@@ -74,11 +70,8 @@ class AttendanceProcessor:
     async def execute_write(self, query: str, *params):
         """Функция выполнения SQL запросов на запись"""
         try:
-            conn = await asyncpg.connect(**settings.db.pg_link)
-            try:
+            async with acquire() as conn:
                 await conn.execute(query, *params)
-            finally:
-                await conn.close()
         except Exception as e:
             logger.error(f"Database write error: {str(e)}")
             raise
@@ -900,8 +893,11 @@ async def main():
         logger.info("=" * 50)
         logger.info("🏁 НАЧАЛО ВЫПОЛНЕНИЯ СКРИПТА")
 
-        processor = AttendanceProcessor()
-        result = await processor.subtract_classes_and_update_payment_dates(target_date)
+        try:
+            processor = AttendanceProcessor()
+            result = await processor.subtract_classes_and_update_payment_dates(target_date)
+        finally:
+            await engines.dispose()
 
         logger.info(f"🏁 РЕЗУЛЬТАТ: {result['message']}")
         logger.info("=" * 50)
@@ -9,7 +9,6 @@ import sys
 import os
 import argparse
 from datetime import datetime, timedelta, date
-from math import ceil
 from typing import Dict, List, Optional, Any
 
 # Добавляем путь к проекту в PYTHONPATH
@@ -18,9 +17,12 @@ sys.path.insert(0, project_root)
 
 try:
     from logger_config import logger
-    from database.models import schema, Lesson_write_offs
-    import asyncpg
+    from database.models import schema
     from config import settings
+    from database.engines import engines, init_pool, pool_stats
+    from regulatory_tasks import attendance_core as core
+    from regulatory_tasks.attendance_storage import AttendanceStorage, PostgresAttendanceStorage
+    from regulatory_tasks.day_snapshot import DaySnapshot
 except ImportError as e:
     print(f"❌ Ошибка импорта: {e}")
     sys.exit(1)
@@ -30,753 +32,115 @@ class AttendanceProcessor:
     """Класс для обработки посещений и списаний занятий"""
 
     # Константы
-    WEEKDAYS_RU = {
-        0: 'понедельник',
-        1: 'вторник',
-        2: 'среда',
-        3: 'четверг',
-        4: 'пятница',
-        5: 'суббота',
-        6: 'воскресенье'
-    }
-
-    WEEKDAYS_RU_TO_INT = {
-        'понедельник': 0,
-        'вторник': 1,
-        'среда': 2,
-        'четверг': 3,
-        'пятница': 4,
-        'суббота': 5,
-        'воскресенье': 6
-    }
-
     SPECIAL_TARIFFS = [3, 4]  # Особые тарифы (списание по 2 занятия в субботу)
 
-    def __init__(self):
+    def __init__(self, storage: Optional[AttendanceStorage] = None):
         self.schema = schema
+        # Правила списания - в attendance_core, чтение и запись - через хранилище
+        self.storage = storage or PostgresAttendanceStorage(self.SPECIAL_TARIFFS)
 
-    async def execute_raw_sql(self, query: str, *params) -> List[Any]:
-        """Функция выполнения SQL запросов"""
-        try:
-            conn = await asyncpg.connect(**settings.db.pg_link)
-            try:
-                if params:
-                    result = await conn.fetch(query, *params)
-                else:
-                    result = await conn.fetch(query)
-                return result
-            finally:
-                await conn.close()
-        except Exception as e:
-            logger.error(f"Database error: {str(e)}")
-            raise
-
-    async def execute_write(self, query: str, *params):
-        """Функция выполнения SQL запросов на запись"""
-        try:
-            conn = await asyncpg.connect(**settings.db.pg_link)
-            try:
-                await conn.execute(query, *params)
-            finally:
-                await conn.close()
-        except Exception as e:
-            logger.error(f"Database write error: {str(e)}")
-            raise
-
-    async def record_write_off(self, student_id: int, quantity: int, write_off_date: datetime):
-        """Запись факта списания в таблицу lesson_write_offs"""
-        try:
-            await self.execute_write(
-                f"""INSERT INTO {self.schema}.lesson_write_offs 
-                (data, student_id, quantity) 
-                VALUES ($1, $2, $3)""",
-                write_off_date, student_id, quantity
-            )
-            logger.debug(f"📝 Записано списание: студент {student_id}, кол-во {quantity}, дата {write_off_date}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка записи списания для студента {student_id}: {str(e)}")
-
-    async def get_student_schedule_days(self, student_id: int) -> List[str]:
-        """Получить дни расписания студента"""
-        schedule_data = await self.execute_raw_sql(
-            f"""SELECT DISTINCT sched.day_week 
-            FROM {self.schema}.student_schedule ss
-            JOIN {self.schema}.schedule sched ON ss.schedule = sched.id
-            WHERE ss.student = $1""",
-            student_id
+    async def load_snapshot(self, target_date: datetime) -> DaySnapshot:
+        """Снимок данных за день (ученики, расписания, посещения, закрытые дни)"""
+        day = target_date.date() if isinstance(target_date, datetime) else target_date
+        snapshot = (await self.storage.load_snapshots(day, day))[0]
+        logger.info(
+            f"📸 Снимок за {snapshot.day}: {len(snapshot.students)} студентов, "
+            f"{len(snapshot.day_visits)} пришли сегодня"
         )
-        return [row['day_week'] for row in schedule_data] if schedule_data else []
+        return snapshot
 
-    async def calculate_next_payment_date(self, student_id: int, current_balance: int,
-                                          days_per_week: int, target_date: datetime) -> datetime:
-        """
-        Рассчитывает следующую дату оплаты
+    async def write_off_day(self, snapshot: DaySnapshot, dry_run: bool = False) -> List[Dict]:
         """
-        try:
-            today = target_date.date()
-
-            # Если баланс отрицательный (долг) - даем 3 дня на оплату
-            if current_balance < 0:
-                payment_date = today + timedelta(days=3)
-                logger.info(f"💰 Студент ID {student_id} имеет долг {current_balance}, оплата до {payment_date}")
-                return payment_date
-
-            student_days = await self.get_student_schedule_days(student_id)
-
-            if not student_days:
-                logger.warning(f"⚠️ У студента ID {student_id} нет расписания")
-                return today + timedelta(days=30)
-
-            actual_days_per_week = len(student_days)
-            if days_per_week != actual_days_per_week:
-                logger.info(
-                    f"📝 Корректировка дней для студента {student_id}: {days_per_week} -> {actual_days_per_week}")
-                days_per_week = actual_days_per_week
-
-            if days_per_week == 0:
-                return today + timedelta(days=30)
-
-            # Расчет оставшихся недель
-            weeks_remaining = 0 if current_balance <= 0 else ceil(current_balance / days_per_week)
-
-            # Преобразуем русские названия дней в числовые
-            student_weekdays = [self.WEEKDAYS_RU_TO_INT[day] for day in student_days]
-            student_weekdays.sort()
-
-            # Находим следующий тренировочный день
-            today_weekday = today.weekday()
-            next_training_day = None
-
-            for day in student_weekdays:
-                if day > today_weekday:
-                    next_training_day = day
-                    break
-
-            if next_training_day is None:
-                next_training_day = student_weekdays[0]
-                days_until_next = 7 - today_weekday + next_training_day
-            else:
-                days_until_next = next_training_day - today_weekday
-
-            if weeks_remaining <= 0:
-                payment_date = today + timedelta(days=3)  # +3 дня буфер
-            else:
-                last_training_date = today + timedelta(days=days_until_next + (weeks_remaining - 1) * 7)
-                payment_date = last_training_date + timedelta(days=3)
-
-            logger.debug(
-                f"📅 Студент {student_id}: баланс {current_balance}, дней/неделю {days_per_week}, оплата {payment_date}")
-            return payment_date
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка расчета даты оплаты для студента {student_id}: {str(e)}")
-            return target_date.date() + timedelta(days=30)
+        Списание занятий за день.
 
-    async def calculate_next_payment_date_optimized(self, student_id: int, current_balance: int,
-                                                    days_per_week: int, target_date: datetime) -> datetime:
+        Кому и сколько списать, решают правила (attendance_core.plan_write_offs).
+        Хранилище записывает списания так, что повторный запуск за ту же
+        дату ничего не списывает второй раз. Балансы в снимке обновляются
+        по результату, чтобы следующие фазы не перечитывали учеников.
         """
-        Оптимизированный расчет даты оплаты с учетом правил списания.
-
-        Правила списания:
-        1. В будние дни: максимум 1 занятие в день
-        2. В субботу: по факту посещений (обычно 1-2 занятия)
-        3. Для тарифов 3,4: в субботу всегда списывается 2 занятия
-        4. Для тарифа 8: особые правила
-        """
-        try:
-            today = target_date.date()
-            today_weekday = today.weekday()
-            today_weekday_ru = self.WEEKDAYS_RU[today_weekday]
-
-            # Получаем информацию о студенте
-            student_info = await self.execute_raw_sql(
-                f"""SELECT s.id, s.name, s.classes_remaining, s.price, 
-                            p.classes_in_price
-                    FROM {self.schema}.student s
-                    LEFT JOIN {self.schema}.price p ON s.price = p.id
-                    WHERE s.id = $1""",
-                student_id
-            )
-
-            if not student_info:
-                return today + timedelta(days=30)
-
-            student = student_info[0]
-            price_id = student['price']
-            is_tariff_8 = student['classes_in_price'] == 8
-            is_special_tariff = price_id in self.SPECIAL_TARIFFS  # 3,4
-
-            # Если баланс уже 0 или отрицательный
-            if current_balance <= 0:
-                return await self._get_payment_date_for_zero_balance(
-                    student_id, today, target_date, is_tariff_8, is_special_tariff
-                )
-
-            # Получаем расписание студента
-            student_days = await self.get_student_schedule_days(student_id)
-            if not student_days:
-                logger.warning(f"⚠️ У студента {student_id} нет расписания")
-                return today + timedelta(days=30)
-
-            # Преобразуем в числовые дни недели и сортируем
-            student_weekdays = [self.WEEKDAYS_RU_TO_INT[day] for day in student_days]
-            student_weekdays.sort()
-
-            # Начинаем симуляцию списаний
-            remaining_balance = current_balance
-            current_sim_date = today
-            iteration = 0
-            max_iterations = 365
-
-            logger.debug(f"🧮 Начинаем симуляцию для студента {student_id}: баланс {remaining_balance}")
-
-            while remaining_balance > 0 and iteration < max_iterations:
-                current_sim_weekday = current_sim_date.weekday()
-                current_sim_weekday_ru = self.WEEKDAYS_RU[current_sim_weekday]
-
-                # Проверяем, есть ли у студента тренировка в этот день
-                has_schedule = current_sim_weekday_ru in student_days
-
-                if not has_schedule:
-                    # Переходим к следующему дню
-                    current_sim_date += timedelta(days=1)
-                    iteration += 1
-                    continue
-
-                # Если есть расписание, списываем занятия по правилам
-                classes_to_subtract = 0
-
-                if is_tariff_8:
-                    # Особые правила для тарифа 8
-                    if current_sim_weekday == 5:  # Суббота
-                        # Проверяем, есть ли расписание или посещение в субботу
-                        has_saturday_schedule_or_visit = await self.has_schedule_or_visit(
-                            student_id, 'суббота', datetime.combine(current_sim_date, datetime.min.time())
-                        )
-
-                        if has_saturday_schedule_or_visit:
-                            # Для тарифа 8 в субботу списываем фактические посещения + доводим до 2 в неделю
-                            # Упрощенная логика: считаем, что списывается 1 занятие
-                            classes_to_subtract = 1
-                    else:
-                        # В будни списывается 1 занятие
-                        classes_to_subtract = 1
-
-                elif current_sim_weekday == 5:  # Суббота
-                    # Специальные правила для субботы
-                    if is_special_tariff:
-                        # Тарифы 3,4: всегда списывается 2 занятия в субботу
-                        classes_to_subtract = 2
-                    else:
-                        # Обычные тарифы: списывается по факту посещений (1 или 2)
-                        # Для расчета берем максимум - 2 занятия
-                        classes_to_subtract = 2  # Берем максимально возможное
-
-                else:
-                    # Будние дни: списывается 1 занятие
-                    classes_to_subtract = 1
-
-                # Списываем занятия
-                remaining_balance -= classes_to_subtract
-
-                logger.debug(
-                    f"  📅 {current_sim_date} ({current_sim_weekday_ru}): "
-                    f"списано {classes_to_subtract}, остаток {remaining_balance}"
-                )
-
-                # Если баланс стал 0 или отрицательным, следующая дата - дата оплаты
-                if remaining_balance <= 0:
-                    # Дата оплаты - следующий день после последнего списания
-                    payment_date = current_sim_date
-                    logger.info(
-                        f"💰 Студент {student_id}: баланс стал {remaining_balance} "
-                        f"на дату {payment_date}"
-                    )
-                    return payment_date
-
-                # Переходим к следующему дню
-                current_sim_date += timedelta(days=1)
-                iteration += 1
-
-            if iteration >= max_iterations:
-                logger.error(f"❌ Студент {student_id}: достигнут лимит итераций")
-                return today + timedelta(days=30)
-
-            # Если дошли до сюда (не должно происходить в норме)
-            return today + timedelta(days=30)
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка расчета даты оплаты для студента {student_id}: {str(e)}")
-            return target_date.date() + timedelta(days=30)
-
-    async def _get_payment_date_for_zero_balance(self, student_id: int, today: date,
-                                                 target_date: datetime,
-                                                 is_tariff_8: bool = False,
-                                                 is_special_tariff: bool = False) -> date:
-        """Получить дату оплаты для нулевого или отрицательного баланса"""
-        # Получаем расписание студента
-        student_days = await self.get_student_schedule_days(student_id)
-        if not student_days:
-            return today + timedelta(days=1)
-
-        today_weekday_ru = self.WEEKDAYS_RU[today.weekday()]
-
-        # Проверяем, есть ли тренировка сегодня
-        if today_weekday_ru in student_days:
-            # Есть тренировка сегодня
-            # Проверяем, нужно ли списывать дополнительные занятия сегодня
-
-            today_datetime = datetime.combine(today, datetime.min.time())
-
-            if today.weekday() == 5:  # Суббота
-                if is_special_tariff:
-                    # Тарифы 3,4: сегодня списывается 2 занятия
-                    # Баланс уже 0, значит оплата нужна сегодня
-                    return today
-                elif is_tariff_8:
-                    # Тариф 8: возможны дополнительные списания
-                    # Проверяем, есть ли расписание/посещение
-                    has_schedule_or_visit = await self.has_schedule_or_visit(
-                        student_id, 'суббота', today_datetime
-                    )
-                    if has_schedule_or_visit:
-                        return today
-                else:
-                    # Обычный тариф в субботу
-                    return today
-            else:
-                # Будний день
-                return today
-
-        # Если сегодня нет тренировки, ищем следующую
-        student_weekdays = [self.WEEKDAYS_RU_TO_INT[day] for day in student_days]
-        student_weekdays.sort()
-
-        today_weekday = today.weekday()
-        next_training_days = 7  # По умолчанию - через неделю
-
-        for day in student_weekdays:
-            if day > today_weekday:
-                next_training_days = day - today_weekday
-                break
-
-        if next_training_days == 7:  # Не нашли на этой неделе
-            next_training_days = 7 - today_weekday + student_weekdays[0]
-
-        next_training_date = today + timedelta(days=next_training_days)
-
-        # Для субботы учитываем дополнительные правила
-        if next_training_date.weekday() == 5:  # Если следующая тренировка в субботу
-            if is_special_tariff:
-                # Тарифы 3,4: в субботу списывается 2 занятия
-                # Так как баланс 0, значит нужно 2 занятия, но мы можем это учесть
-                pass
-            elif is_tariff_8:
-                # Для тарифа 8 нужна дополнительная проверка
-                next_training_datetime = datetime.combine(next_training_date, datetime.min.time())
-                has_schedule_or_visit = await self.has_schedule_or_visit(
-                    student_id, 'суббота', next_training_datetime
-                )
-                if not has_schedule_or_visit:
-                    # Если нет расписания/посещения в субботу, ищем следующую тренировку
-                    return await self._get_next_training_after_date(student_id, next_training_date)
-
-        return next_training_date
-
-    async def _get_next_training_after_date(self, student_id: int, start_date: date) -> date:
-        """Получить следующую дату тренировки после указанной даты"""
-        student_days = await self.get_student_schedule_days(student_id)
-        if not student_days:
-            return start_date + timedelta(days=1)
-
-        student_weekdays = [self.WEEKDAYS_RU_TO_INT[day] for day in student_days]
-        student_weekdays.sort()
-
-        start_weekday = start_date.weekday()
-        days_to_add = 7  # По умолчанию
-
-        for day in student_weekdays:
-            if day > start_weekday:
-                days_to_add = day - start_weekday
-                break
-
-        if days_to_add == 7:  # Не нашли на этой неделе
-            days_to_add = 7 - start_weekday + student_weekdays[0]
-
-        return start_date + timedelta(days=days_to_add)
-
-
+        planned = core.plan_write_offs(snapshot)
+        logger.info(f"📝 Списаний к записи: {len(planned)}")
 
-    async def get_visits_count(self, student_id: int, date_from: datetime, date_to: datetime = None) -> int:
-        """Получить количество посещений студента за период"""
-        if date_to is None:
-            date_to = date_from
-
-        visits = await self.execute_raw_sql(
-            f"""SELECT COUNT(*) as visit_count
-            FROM {self.schema}.visit v
-            WHERE v.student = $1 
-            AND DATE(v.data) >= $2 
-            AND DATE(v.data) <= $3""",
-            student_id, date_from.date(), date_to.date()
-        )
-        return visits[0]['visit_count'] if visits else 0
-
-    async def has_schedule_or_visit(self, student_id: int, weekday_ru: str, target_date: datetime) -> bool:
-        """Проверить, есть ли у студента расписание или посещение на указанный день"""
-        result = await self.execute_raw_sql(
-            f"""SELECT 1
-            FROM {self.schema}.student_schedule ss
-            JOIN {self.schema}.schedule sched ON ss.schedule = sched.id
-            WHERE ss.student = $1 AND sched.day_week = $2
-
-            UNION
-
-            SELECT 1
-            FROM {self.schema}.visit v
-            WHERE v.student = $1 AND DATE(v.data) = $3
-            LIMIT 1""",
-            student_id, weekday_ru, target_date.date()
-        )
-        return len(result) > 0
-
-    async def process_tariff_8_student(self, student: Dict, today_date: datetime,
-                                       today_weekday_ru: str, is_saturday: bool) -> Optional[Dict]:
-        """Обработка одного студента с тарифом 8 занятий"""
-        try:
-            if student['classes_remaining'] is None:
-                logger.warning(f"⚠️ Студент {student['name']} имеет NULL в classes_remaining - пропускаем")
-                return None
-
-            if is_saturday:
-                return await self._process_tariff_8_saturday(student, today_date)
-            else:
-                return await self._process_tariff_8_weekday(student, today_date, today_weekday_ru)
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки студента {student['name']}: {str(e)}")
-            return None
-
-    async def _process_tariff_8_saturday(self, student: Dict, today_date: datetime) -> Optional[Dict]:
-        """Обработка студента с тарифом 8 в субботу"""
-        # Проверяем, есть ли расписание или посещение в субботу
-        has_schedule_or_visit = await self.has_schedule_or_visit(student['id'], 'суббота', today_date)
-
-        if not has_schedule_or_visit:
-            logger.info(f"📅 Суббота: студент {student['name']} - нет расписания и посещений")
-            return None
-
-        # 1. Списываем посещения за субботу
-        saturday_visit_count = await self.get_visits_count(student['id'], today_date)
-
-        if saturday_visit_count > 0:
-            await self.execute_write(
-                f"""UPDATE {self.schema}.student 
-                SET classes_remaining = classes_remaining - $1
-                WHERE id = $2""",
-                saturday_visit_count, student['id']
-            )
-            # Записываем списание
-            await self.record_write_off(student['id'], saturday_visit_count, today_date)
-            logger.info(f"📅 Суббота: студент {student['name']} - списано {saturday_visit_count} занятий")
-
-        # 2. Проверяем посещения за неделю и корректируем до 2 занятий
-        start_of_week = today_date - timedelta(days=today_date.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-
-        weekly_visit_count = await self.get_visits_count(student['id'], start_of_week, end_of_week)
-        expected_visits = 2
-
-        logger.info(
-            f"📊 Студент {student['name']}: посещений за неделю {weekly_visit_count}, ожидается {expected_visits}")
-
-        if weekly_visit_count < expected_visits:
-            additional_classes_to_subtract = expected_visits - weekly_visit_count
-            logger.info(f"📝 {student['name']}: дополнительно списываем {additional_classes_to_subtract} занятий")
-
-            result = await self.execute_raw_sql(
-                f"""UPDATE {self.schema}.student 
-                SET classes_remaining = classes_remaining - $1
-                WHERE id = $2
-                RETURNING id, name, classes_remaining, price;""",
-                additional_classes_to_subtract, student['id']
-            )
-
-            if result:
-                # Записываем дополнительное списание
-                await self.record_write_off(student['id'], additional_classes_to_subtract, today_date)
-
-                total_subtracted = saturday_visit_count + additional_classes_to_subtract
-                logger.info(f"✅ Студент {student['name']}: всего списано {total_subtracted} занятий")
-                return result[0]
+        if dry_run:
+            charged = core.charge(snapshot, planned)
         else:
-            result = await self.execute_raw_sql(
-                f"""SELECT id, name, classes_remaining, price 
-                FROM {self.schema}.student 
-                WHERE id = $1""",
-                student['id']
-            )
-            if result:
-                logger.info(f"✅ Студент {student['name']}: посещений достаточно")
-                return result[0]
-
-        return None
-
-    async def _process_tariff_8_weekday(self, student: Dict, today_date: datetime, today_weekday_ru: str) -> Optional[
-        Dict]:
-        """Обработка студента с тарифом 8 в будний день"""
-        # Проверяем: есть ли расписание на сегодня ИЛИ было ли посещение
-        has_schedule_or_visit = await self.has_schedule_or_visit(student['id'], today_weekday_ru, today_date)
-
-        # Если нет ни расписания, ни посещения - не списываем
-        if not has_schedule_or_visit:
-            logger.info(f"📅 {today_weekday_ru}: студент {student['name']} - нет расписания и посещений")
-            return None
-
-        # Если есть расписание или посещение - списываем 1 занятие
-        result = await self.execute_raw_sql(
-            f"""UPDATE {self.schema}.student 
-            SET classes_remaining = classes_remaining - 1
-            WHERE id = $1
-            RETURNING id, name, classes_remaining, price;""",
-            student['id']
-        )
-
-        if result:
-            # Записываем списание
-            await self.record_write_off(student['id'], 1, today_date)
-            logger.info(
-                f"📅 {today_weekday_ru}: студент {student['name']} - списано 1 занятие (по расписанию или посещению)")
-            return result[0]
-
-        return None
-
-    async def process_regular_students(self, today_date: datetime, today_weekday_ru: str, is_saturday: bool) -> List[
-        Dict]:
-        """Обработка обычных студентов (не тариф 8)"""
-        if is_saturday:
-            query = f"""UPDATE {self.schema}.student 
-                SET classes_remaining = classes_remaining - 
-                    CASE 
-                        WHEN price IN ({','.join(map(str, self.SPECIAL_TARIFFS))}) THEN 2
-                        ELSE GREATEST(1, (
-                            SELECT COUNT(*) 
-                            FROM {self.schema}.visit v
-                            WHERE v.student = {self.schema}.student.id 
-                            AND DATE(v.data) = $1
-                        ))
-                    END
-                WHERE id IN (
-                    -- Студенты, у которых есть либо расписание на субботу, либо посещение в субботу
-                    SELECT DISTINCT s.id
-                    FROM {self.schema}.student s
-                    LEFT JOIN {self.schema}.student_schedule ss ON s.id = ss.student
-                    LEFT JOIN {self.schema}.schedule sch ON ss.schedule = sch.id
-                    LEFT JOIN {self.schema}.visit v ON s.id = v.student AND DATE(v.data) = $1
-                    WHERE s.active = true
-                    AND s.classes_remaining IS NOT NULL
-                    AND (
-                        sch.day_week = 'суббота'  -- Есть расписание на субботу
-                        OR 
-                        v.id IS NOT NULL  -- Или было посещение в субботу
-                    )
-                )
-                AND active = true
-                AND classes_remaining IS NOT NULL
-                RETURNING id, name, classes_remaining, price;"""
-            params = (today_date,)
-        else:
-            # Для будних дней
-            query = f"""UPDATE {self.schema}.student 
-                SET classes_remaining = classes_remaining - 1 
-                WHERE id IN (
-                    -- Студенты, у которых есть либо расписание на сегодня, либо посещение сегодня
-                    SELECT DISTINCT s.id
-                    FROM {self.schema}.student s
-                    LEFT JOIN {self.schema}.student_schedule ss ON s.id = ss.student
-                    LEFT JOIN {self.schema}.schedule sch ON ss.schedule = sch.id
-                    LEFT JOIN {self.schema}.visit v ON s.id = v.student AND DATE(v.data) = $1
-                    JOIN {self.schema}.price p ON s.price = p.id
-                    WHERE s.active = true
-                    AND p.classes_in_price != 8  -- Не тариф 8
-                    AND s.classes_remaining IS NOT NULL
-                    AND (
-                        sch.day_week = $2  -- Есть расписание на сегодня
-                        OR 
-                        v.id IS NOT NULL   -- Или было посещение сегодня
-                    )
-                )
-                RETURNING id, name, classes_remaining, price;"""
-            params = (today_date, today_weekday_ru)
-
-        result = await self.execute_raw_sql(query, *params)
-
-        # Записываем списания в таблицу lesson_write_offs
-        for student in result:
-            quantity = 2 if (is_saturday and student['price'] in self.SPECIAL_TARIFFS) else 1
-            await self.record_write_off(student['id'], quantity, today_date)
-
-        return list(result)
-
-    # async def update_payment_dates(self, target_date: datetime) -> int:
-    #     """Обновление дат оплаты для всех активных студентов"""
-    #     all_active_students = await self.execute_raw_sql(
-    #         f"""SELECT s.id, s.name, s.classes_remaining, s.price,
-    #                 COUNT(DISTINCT ss.schedule) as training_days_per_week
-    #         FROM {self.schema}.student s
-    #         LEFT JOIN {self.schema}.student_schedule ss ON s.id = ss.student
-    #         JOIN {self.schema}.price p ON s.price = p.id
-    #         WHERE s.active = true
-    #         AND s.classes_remaining IS NOT NULL
-    #         GROUP BY s.id, s.name, s.classes_remaining, s.price
-    #         HAVING COUNT(DISTINCT ss.schedule) > 0"""
-    #     )
-    #
-    #     payment_updates = 0
-    #     for student in all_active_students:
-    #         try:
-    #             actual_days_per_week = student['training_days_per_week']
-    #
-    #             # Учитываем особые тарифы
-    #             if student['price'] in self.SPECIAL_TARIFFS:
-    #                 saturday_schedule = await self.execute_raw_sql(
-    #                     f"""SELECT 1
-    #                     FROM {self.schema}.student_schedule ss
-    #                     JOIN {self.schema}.schedule sched ON ss.schedule = sched.id
-    #                     WHERE ss.student = $1 AND sched.day_week = 'суббота'
-    #                     LIMIT 1;""",
-    #                     student['id']
-    #                 )
-    #                 if saturday_schedule:
-    #                     actual_days_per_week += 1
-    #
-    #             next_payment_date = await self.calculate_next_payment_date(
-    #                 student['id'], student['classes_remaining'], actual_days_per_week, target_date
-    #             )
-    #
-    #             await self.execute_write(
-    #                 f"UPDATE {self.schema}.student SET expected_payment_date = $1 WHERE id = $2",
-    #                 next_payment_date, student['id']
-    #             )
-    #
-    #             payment_updates += 1
-    #             logger.info(f"📅 Обновлена дата оплаты для {student['name']}: {next_payment_date}")
-    #
-    #         except Exception as e:
-    #             logger.error(f"❌ Ошибка обновления даты оплаты для {student['name']}: {str(e)}")
-    #
-    #     return payment_updates
-
-    async def update_payment_dates(self, target_date: datetime) -> int:
-        """Обновление дат оплаты для всех активных студентов"""
-        # Получаем всех активных студентов с информацией о тарифе
-        all_active_students = await self.execute_raw_sql(
-            f"""SELECT s.id, s.name, s.classes_remaining, s.price,
-                    p.classes_in_price,
-                    COUNT(DISTINCT sched.day_week) as training_days_per_week
-            FROM {self.schema}.student s
-            LEFT JOIN {self.schema}.student_schedule ss ON s.id = ss.student
-            LEFT JOIN {self.schema}.schedule sched ON ss.schedule = sched.id
-            LEFT JOIN {self.schema}.price p ON s.price = p.id
-            WHERE s.active = true
-            AND s.classes_remaining IS NOT NULL
-            GROUP BY s.id, s.name, s.classes_remaining, s.price, p.classes_in_price"""
-        )
-
-        payment_updates = 0
-        for student in all_active_students:
-            try:
-                # Определяем тип тарифа
-                is_tariff_8 = student['classes_in_price'] == 8
-                is_special_tariff = student['price'] in self.SPECIAL_TARIFFS
-
-                # Используем оптимизированный метод
-                next_payment_date = await self.calculate_next_payment_date_optimized(
-                    student['id'],
-                    student['classes_remaining'],
-                    student['training_days_per_week'],
-                    target_date
-                )
+            charged = await self.storage.write_off(snapshot.day, planned)
 
-                await self.execute_write(
-                    f"UPDATE {self.schema}.student SET expected_payment_date = $1 WHERE id = $2",
-                    next_payment_date, student['id']
+            due_students = {item.student_id for item in planned}
+            if len(charged) < len(due_students):
+                logger.warning(
+                    f"⚠️ За {snapshot.day} у {len(due_students) - len(charged)} студентов "
+                    f"списания уже были записаны ранее - пропущены"
                 )
 
-                payment_updates += 1
+        snapshot.apply_balances(charged)
+        result = [core.student_summary(snapshot, row['id'], row['quantity']) for row in charged]
+        return sorted(result, key=lambda student: student['name'] or '')
 
-                # Логируем с информацией о тарифе
-                tariff_info = []
-                if is_tariff_8:
-                    tariff_info.append("тариф 8")
-                if is_special_tariff:
-                    tariff_info.append("тариф 3/4")
-
-                tariff_str = f" ({', '.join(tariff_info)})" if tariff_info else ""
-                logger.info(
-                    f"📅 Обновлена дата оплаты для {student['name']}{tariff_str}: "
-                    f"{next_payment_date}, баланс {student['classes_remaining']}"
-                )
+    async def update_payment_dates(self, snapshot: DaySnapshot, dry_run: bool = False) -> int:
+        """
+        Обновление дат оплаты для всех активных студентов
+        Даты считаются по снимку в памяти и записываются одним запросом
+        """
+        payment_dates = core.payment_dates(snapshot)
 
-            except Exception as e:
-                logger.error(f"❌ Ошибка обновления даты оплаты для {student['name']}: {str(e)}")
+        for student_id, payment_date in payment_dates.items():
+            if not snapshot.schedule_days.get(student_id):
+                logger.warning(f"⚠️ У студента {student_id} нет расписания")
 
-        return payment_updates
+        if payment_dates and not dry_run:
+            await self.storage.save_payment_dates(payment_dates)
 
+        return len(payment_dates)
 
-    async def subtract_classes_and_update_payment_dates(self, target_date: datetime = None) -> Dict[str, Any]:
+    async def subtract_classes_and_update_payment_dates(self, target_date: datetime = None,
+                                                       snapshot: DaySnapshot = None,
+                                                       snapshot_out: str = None,
+                                                       dry_run: bool = False) -> Dict[str, Any]:
         """
         Основная функция для списания занятий и обновления дат оплаты
+        snapshot - готовый снимок (повтор по JSON), иначе снимок загружается из БД
         """
         try:
-            if target_date is None:
-                target_date = datetime.now()
-            elif isinstance(target_date, str):
-                target_date = datetime.fromisoformat(target_date)
-
-            today_weekday_ru = self.WEEKDAYS_RU[target_date.weekday()]
-            today_date = target_date.date()
-            is_saturday = target_date.weekday() == 5
-
-            logger.info(f"🚀 Запуск вычитания занятий за {today_date} ({today_weekday_ru})")
-
-            # 1. Обработка студентов с тарифом 8
-            tariff_8_students = await self.execute_raw_sql(
-                f"""SELECT s.id, s.name, s.classes_remaining, s.price
-                FROM {self.schema}.student s
-                JOIN {self.schema}.price p ON s.price = p.id
-                WHERE s.active = true
-                AND p.classes_in_price = 8
-                AND s.classes_remaining IS NOT NULL"""
-            )
-
-            students_8_updated = []
-            for student in tariff_8_students:
-                result = await self.process_tariff_8_student(student, target_date, today_weekday_ru, is_saturday)
-                if result:
-                    students_8_updated.append(result)
-
-            # 2. Обработка обычных студентов
-            regular_students_updated = await self.process_regular_students(target_date, today_weekday_ru, is_saturday)
-
-            # 3. Объединение результатов
-            all_updated_students = regular_students_updated + students_8_updated
+            if snapshot is None:
+                if target_date is None:
+                    target_date = datetime.now()
+                elif isinstance(target_date, str):
+                    target_date = datetime.fromisoformat(target_date)
+                snapshot = await self.load_snapshot(target_date)
+
+            if snapshot_out:
+                with open(snapshot_out, 'w', encoding='utf-8') as f:
+                    f.write(snapshot.to_json())
+                logger.info(f"💾 Снимок сохранен в {snapshot_out}")
+
+            today_weekday_ru = snapshot.weekday_ru
+            today_date = snapshot.day
+            is_saturday = snapshot.is_saturday
+
+            logger.info(f"🚀 Запуск вычитания занятий за {today_date} ({today_weekday_ru})"
+                        + (" - без записи в БД" if dry_run else ""))
+
+            # 1. Списание за день
+            all_updated_students = await self.write_off_day(snapshot, dry_run=dry_run)
+            students_8_updated = [s for s in all_updated_students if s['kind'] == 'tariff_8']
             updated_count = len(all_updated_students)
 
+            # 2. Обновление дат оплаты - и при повторном запуске без новых списаний:
+            # прошлый запуск мог упасть после списания, но до этого шага
+            payment_updates = await self.update_payment_dates(snapshot, dry_run=dry_run)
+            logger.info(f"✅ Обновлено дат оплаты: {payment_updates} студентов")
+
             if updated_count == 0:
                 logger.info(f"ℹ️ На {today_weekday_ru} не было студентов для списания")
-                return self._create_response(True, "Нет студентов для списания", 0, 0, today_date, today_weekday_ru)
+                return self._create_response(True, "Нет студентов для списания", 0, payment_updates,
+                                             today_date, today_weekday_ru)
 
-            # 4. Анализ результатов
-            stats = await self._analyze_results(all_updated_students, students_8_updated, target_date, is_saturday)
+            # 3. Анализ результатов
+            stats = self._analyze_results(all_updated_students, students_8_updated, is_saturday)
 
-            # 5. Обновление дат оплаты
-            payment_updates = await self.update_payment_dates(target_date)
-            logger.info(f"✅ Обновлено дат оплаты: {payment_updates} студентов")
-
-            # 6. Формирование отчета
-            await self._generate_report(all_updated_students, students_8_updated, target_date, is_saturday,
-                                        updated_count)
+            # 4. Формирование отчета
+            self._generate_report(all_updated_students, updated_count)
 
             return self._create_success_response(updated_count, payment_updates, stats, today_date, today_weekday_ru)
 
@@ -785,8 +149,63 @@ class AttendanceProcessor:
             logger.error(error_msg)
             return self._create_response(False, error_msg, 0, 0)
 
-    async def _analyze_results(self, all_students: List[Dict], tariff_8_students: List[Dict],
-                               today_date: datetime, is_saturday: bool) -> Dict[str, int]:
+    async def catch_up(self, date_from: date, date_to: date, single_transaction: bool = False,
+                       dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Догоняющий режим: списание за каждый день периода по порядку
+        Данные за весь период загружаются один раз, балансы ведутся в памяти.
+        Каждый день фиксируется своей транзакцией, либо весь период одной
+        (single_transaction). Даты оплаты пересчитываются один раз по итогам
+        последнего дня. Уже списанные дни пропускаются журналом списаний.
+        """
+        try:
+            if date_from > date_to:
+                return self._create_response(False, "Дата начала позже даты окончания", 0, 0)
+
+            snapshots = await self.storage.load_snapshots(date_from, date_to)
+            logger.info(f"📸 Загружены данные за {len(snapshots)} дн. ({date_from} - {date_to})")
+
+            days = []
+            if single_transaction and not dry_run:
+                async with self.storage.transaction():
+                    for snapshot in snapshots:
+                        charged = await self.write_off_day(snapshot)
+                        days.append(self._day_summary(snapshot, charged))
+            else:
+                for snapshot in snapshots:
+                    charged = await self.write_off_day(snapshot, dry_run=dry_run)
+                    days.append(self._day_summary(snapshot, charged))
+
+            payment_updates = await self.update_payment_dates(snapshots[-1], dry_run=dry_run)
+            updated = sum(day['updated'] for day in days)
+            return {
+                "success": True,
+                "message": f"✅ Обработано {len(days)} дн., списаний у {updated} студентов, "
+                           f"обновлено {payment_updates} дат оплаты",
+                "updated": updated,
+                "payment_dates_updated": payment_updates,
+                "date_from": date_from.isoformat(),
+                "date_to": date_to.isoformat(),
+                "days": days
+            }
+
+        except Exception as e:
+            error_msg = f"💥 Критическая ошибка: {str(e)}"
+            logger.error(error_msg)
+            return self._create_response(False, error_msg, 0, 0)
+
+    @staticmethod
+    def _day_summary(snapshot: DaySnapshot, charged: List[Dict]) -> Dict[str, Any]:
+        logger.info(f"📅 {snapshot.day} ({snapshot.weekday_ru}): списано у {len(charged)} студентов")
+        return {
+            "date": snapshot.day.isoformat(),
+            "weekday": snapshot.weekday_ru,
+            "updated": len(charged),
+            "classes": sum(student['quantity'] for student in charged)
+        }
+
+    def _analyze_results(self, all_students: List[Dict], tariff_8_students: List[Dict],
+                         is_saturday: bool) -> Dict[str, int]:
         """Анализ результатов списания"""
         stats = {
             'special_tariff_count': 0,
@@ -805,15 +224,13 @@ class AttendanceProcessor:
                 stats['zero_balance_count'] += 1
                 logger.info(f"ℹ️ Студент {student['name']} имеет нулевой баланс")
 
-            if student not in tariff_8_students and is_saturday:
-                if student['price'] in self.SPECIAL_TARIFFS:
-                    stats['special_tariff_count'] += 1
+            if is_saturday and student['kind'] == 'special':
+                stats['special_tariff_count'] += 1
+            elif is_saturday and student['kind'] == 'regular':
+                if student['day_visits'] > 1:
+                    stats['multiple_visits_count'] += 1
                 else:
-                    visit_count = await self.get_visits_count(student['id'], today_date)
-                    if visit_count > 1:
-                        stats['multiple_visits_count'] += 1
-                    else:
-                        stats['regular_count'] += 1
+                    stats['regular_count'] += 1
 
         logger.info(f"✅ Списано занятий у {len(all_students)} студентов")
 
@@ -831,26 +248,15 @@ class AttendanceProcessor:
 
         return stats
 
-    async def _generate_report(self, all_students: List[Dict], tariff_8_students: List[Dict],
-                               today_date: datetime, is_saturday: bool, total_count: int):
+    def _generate_report(self, all_students: List[Dict], total_count: int):
         """Генерация отчета по списаниям"""
         logger.info("📊 Отчет по списаниям:")
         for student in all_students[:5]:
             balance_status = "🔴 МИНУС" if student['classes_remaining'] < 0 else "🟢 НОРМА"
-
-            if student in tariff_8_students:
-                logger.info(
-                    f"   👉 {student['name']} - тариф 8, осталось {student['classes_remaining']} {balance_status}")
-            elif is_saturday and student['price'] in self.SPECIAL_TARIFFS:
-                logger.info(
-                    f"   👉 {student['name']} - списано 2 занятия, осталось {student['classes_remaining']} {balance_status}")
-            elif is_saturday:
-                visit_count = await self.get_visits_count(student['id'], today_date)
-                logger.info(
-                    f"   👉 {student['name']} - списано {visit_count} занятий, осталось {student['classes_remaining']} {balance_status}")
-            else:
-                logger.info(
-                    f"   👉 {student['name']} - списано 1 занятие, осталось {student['classes_remaining']} {balance_status}")
+            tariff_str = " - тариф 8" if student['kind'] == 'tariff_8' else ""
+            logger.info(
+                f"   👉 {student['name']}{tariff_str} - списано {student['quantity']}, "
+                f"осталось {student['classes_remaining']} {balance_status}")
 
         if total_count > 5:
             logger.info(f"   ... и еще {total_count - 5} студентов")
@@ -892,16 +298,61 @@ async def main():
     try:
         parser = argparse.ArgumentParser(description='Ежедневное списание занятий')
         parser.add_argument('--date', type=str, help='Дата для обработки в формате YYYY-MM-DD (по умолчанию сегодня)')
+        parser.add_argument('--snapshot-out', type=str, help='Сохранить снимок данных за день в JSON-файл')
+        parser.add_argument('--replay', type=str,
+                            help='Взять снимок из JSON-файла вместо загрузки из БД (всегда без записи в БД)')
+        parser.add_argument('--dry-run', action='store_true', help='Только расчет, без записи в БД')
+        parser.add_argument('--from', dest='date_from', type=str,
+                            help='Догоняющий режим: первый день периода YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', type=str,
+                            help='Догоняющий режим: последний день периода (по умолчанию сегодня)')
+        parser.add_argument('--single-transaction', action='store_true',
+                            help='Догоняющий режим: весь период одной транзакцией')
         args = parser.parse_args()
 
-        target_date = datetime.fromisoformat(args.date) if args.date else datetime.now()
+        if args.date_from:
+            date_from = date.fromisoformat(args.date_from)
+            date_to = date.fromisoformat(args.date_to) if args.date_to else date.today()
+            logger.info(f"🎯 Догоняющий режим: {date_from} - {date_to}")
+
+            await init_pool()
+            try:
+                processor = AttendanceProcessor()
+                result = await processor.catch_up(
+                    date_from, date_to, single_transaction=args.single_transaction, dry_run=args.dry_run
+                )
+                logger.info(f"📊 Пул соединений: {pool_stats()}")
+            finally:
+                await engines.dispose()
+
+            logger.info(f"🏁 РЕЗУЛЬТАТ: {result['message']}")
+            sys.exit(0 if result['success'] else 1)
+
+        snapshot = None
+        if args.replay:
+            # Балансы в снимке устаревшие: запись по ним испортила бы текущие данные
+            if not args.dry_run:
+                logger.warning("⚠️ --replay выполняется только в режиме --dry-run, запись в БД отключена")
+                args.dry_run = True
+            with open(args.replay, encoding='utf-8') as f:
+                snapshot = DaySnapshot.from_json(f.read())
+            target_date = datetime.combine(snapshot.day, datetime.min.time())
+        else:
+            target_date = datetime.fromisoformat(args.date) if args.date else datetime.now()
         logger.info(f"🎯 Обработка для даты: {target_date.date()}")
 
         logger.info("=" * 50)
         logger.info("🏁 НАЧАЛО ВЫПОЛНЕНИЯ СКРИПТА")
 
-        processor = AttendanceProcessor()
-        result = await processor.subtract_classes_and_update_payment_dates(target_date)
+        await init_pool()
+        try:
+            processor = AttendanceProcessor()
+            result = await processor.subtract_classes_and_update_payment_dates(
+                target_date, snapshot=snapshot, snapshot_out=args.snapshot_out, dry_run=args.dry_run
+            )
+            logger.info(f"📊 Пул соединений: {pool_stats()}")
+        finally:
+            await engines.dispose()
 
         logger.info(f"🏁 РЕЗУЛЬТАТ: {result['message']}")
         logger.info("=" * 50)
@@ -0,0 +1,175 @@
+"""
+Снимок данных за день для ночного списания (daily_attendance.py).
+
+Все фазы AttendanceProcessor (списание, анализ, отчет, даты оплаты) читают
+один снимок вместо запросов по каждому ученику. Правила списания по снимку
+находятся в attendance_core.py. Снимок содержит:
+
+- ученики с балансом и тарифом;
+- дни расписания каждого ученика;
+- посещения за день и за неделю по этот день включительно;
+- закрытые дни (closure_day) для расчета дат оплаты.
+
+Снимок загружается четырьмя запросами и сохраняется в JSON (--snapshot-out),
+поэтому решение о списании можно проверить или повторить (--replay) на тех же
+данных. Для догоняющего режима (--from/--to) снимки за все дни периода
+загружаются теми же четырьмя запросами.
+"""
+import json
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from database.models import schema
+from db_handler.schedule_calendar import load_closures
+from db_handler.visit_queries import period_range
+
+WEEKDAYS_RU = ['понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье']
+SATURDAY = 5
+
+
+@dataclass
+class DaySnapshot:
+    day: date
+    # id -> {'name', 'classes_remaining', 'price', 'classes_in_price'}
+    students: Dict[int, Dict[str, Any]]
+    schedule_days: Dict[int, List[str]]
+    day_visits: Dict[int, int]
+    week_visits: Dict[int, int]
+    closures: List[date] = field(default_factory=list)
+    special_tariffs: List[int] = field(default_factory=lambda: [3, 4])
+
+    @property
+    def week_start(self) -> date:
+        return self.day - timedelta(days=self.day.weekday())
+
+    @property
+    def weekday_ru(self) -> str:
+        return WEEKDAYS_RU[self.day.weekday()]
+
+    @property
+    def is_saturday(self) -> bool:
+        return self.day.weekday() == SATURDAY
+
+    # ==================== Загрузка ====================
+
+    @classmethod
+    async def load(cls, conn, day: date, special_tariffs: List[int]) -> "DaySnapshot":
+        """Четыре запроса: ученики, расписания, посещения, закрытые дни"""
+        return (await cls.load_range(conn, day, day, special_tariffs))[0]
+
+    @classmethod
+    async def load_range(cls, conn, date_from: date, date_to: date,
+                         special_tariffs: List[int]) -> List["DaySnapshot"]:
+        """
+        Снимки за каждый день периода теми же четырьмя запросами
+        Снимки делят один словарь учеников: балансы, обновленные после
+        списания за день, видны следующему дню
+        """
+        students = await conn.fetch(
+            f"""SELECT s.id, s.name, s.classes_remaining, s.price, p.classes_in_price
+            FROM {schema}.student s
+            LEFT JOIN {schema}.price p ON s.price = p.id
+            WHERE s.active = true
+            AND s.classes_remaining IS NOT NULL"""
+        )
+        schedule_rows = await conn.fetch(
+            f"""SELECT DISTINCT ss.student, sched.day_week
+            FROM {schema}.student_schedule ss
+            JOIN {schema}.schedule sched ON ss.schedule = sched.id
+            JOIN {schema}.student s ON s.id = ss.student
+            WHERE s.active = true"""
+        )
+
+        first_week_start = date_from - timedelta(days=date_from.weekday())
+        visit_rows = await conn.fetch(
+            f"""SELECT v.student, v.data::date AS day, COUNT(*) AS visits
+            FROM {schema}.visit v
+            WHERE v.data >= $1 AND v.data < $2
+            GROUP BY v.student, v.data::date""",
+            *period_range(first_week_start, date_to)
+        )
+        closures = await load_closures(conn, first_week_start)
+
+        students_by_id = {row['id']: {
+            'name': row['name'],
+            'classes_remaining': row['classes_remaining'],
+            'price': row['price'],
+            'classes_in_price': row['classes_in_price'],
+        } for row in students}
+
+        schedule_days: Dict[int, List[str]] = {}
+        for row in schedule_rows:
+            schedule_days.setdefault(row['student'], []).append(row['day_week'])
+
+        visits_by_day: Dict[date, Dict[int, int]] = {}
+        for row in visit_rows:
+            visits_by_day.setdefault(row['day'], {})[row['student']] = row['visits']
+
+        return cls.build_range(date_from, date_to, students_by_id, schedule_days,
+                               visits_by_day, closures, special_tariffs)
+
+    @classmethod
+    def build_range(cls, date_from: date, date_to: date, students: Dict[int, Dict[str, Any]],
+                    schedule_days: Dict[int, List[str]], visits_by_day: Dict[date, Dict[int, int]],
+                    closures: List[date], special_tariffs: List[int]) -> List["DaySnapshot"]:
+        """Снимки за каждый день периода по уже загруженным данным"""
+        snapshots = []
+        day = date_from
+        while day <= date_to:
+            week_visits: Dict[int, int] = {}
+            week_day = day - timedelta(days=day.weekday())
+            while week_day <= day:
+                for student_id, count in visits_by_day.get(week_day, {}).items():
+                    week_visits[student_id] = week_visits.get(student_id, 0) + count
+                week_day += timedelta(days=1)
+
+            snapshots.append(cls(
+                day=day,
+                students=students,
+                schedule_days=schedule_days,
+                day_visits=dict(visits_by_day.get(day, {})),
+                week_visits=week_visits,
+                closures=closures,
+                special_tariffs=list(special_tariffs),
+            ))
+            day += timedelta(days=1)
+        return snapshots
+
+    # ==================== JSON ====================
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'day': self.day.isoformat(),
+            'students': self.students,
+            'schedule_days': self.schedule_days,
+            'day_visits': self.day_visits,
+            'week_visits': self.week_visits,
+            'closures': [d.isoformat() for d in self.closures],
+            'special_tariffs': self.special_tariffs,
+        }, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "DaySnapshot":
+        data = json.loads(raw)
+
+        def int_keys(mapping: Dict[str, Any]) -> Dict[int, Any]:
+            return {int(key): value for key, value in mapping.items()}
+
+        return cls(
+            day=date.fromisoformat(data['day']),
+            students=int_keys(data['students']),
+            schedule_days=int_keys(data['schedule_days']),
+            day_visits=int_keys(data['day_visits']),
+            week_visits=int_keys(data['week_visits']),
+            closures=[date.fromisoformat(d) for d in data.get('closures', [])],
+            special_tariffs=data.get('special_tariffs', [3, 4]),
+        )
+
+    def apply_balances(self, rows: List[Any]):
+        """Обновить балансы в снимке по строкам, вернувшимся после списания"""
+        for row in rows:
+            student = self.students.get(row['id'])
+            if student is not None:
+                student['classes_remaining'] = row['classes_remaining']
+
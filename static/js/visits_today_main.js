@@ -21,7 +21,12 @@ const visitsToday = {
         scheduleId: null,
         selectedStudents: new Set(),
         extraStudents: new Map(),
-        searchTimeout: null
+        students: [],
+        searchTimeout: null,
+        events: null,              // EventSource потока отметок
+        markedStudents: new Set(), // отмечены на сервере (текущая тренировка)
+        placeMarked: new Map(),    // тренировка зала -> отмеченные ученики
+        trainingButtons: new Map() // тренировка зала -> кнопка
     },
 
     // Инициализация
@@ -36,6 +41,116 @@ const visitsToday = {
 
         this.loadPlaces();
         this.setupEventListeners();
+        this.setupOutbox();
+    },
+
+    // Офлайн-очередь отметок и service worker (кэш оболочки, Background Sync)
+    setupOutbox() {
+        if ('serviceWorker' in navigator) {
+            navigator.serviceWorker.register('/visits-today/sw.js').catch(error => {
+                console.warn('Service worker не зарегистрирован:', error);
+            });
+            navigator.serviceWorker.addEventListener('message', (event) => {
+                if (event.data && event.data.type === 'visits-outbox-synced') {
+                    this.handleOutboxSynced(event.data.results);
+                }
+            });
+        }
+
+        visitsTodayOutbox.onChange((event, payload) => {
+            if (event === 'synced') {
+                this.handleOutboxSynced(payload);
+            } else {
+                this.updateOutboxStatus();
+            }
+        });
+        window.addEventListener('offline', () => this.updateOutboxStatus());
+        visitsTodayOutbox.startAutoSync();
+        this.updateOutboxStatus();
+    },
+
+    // Ответ сервера на отправленные пакеты
+    handleOutboxSynced(results) {
+        const created = Object.values(results || {})
+            .reduce((total, result) => total + (result.created || []).length, 0);
+        if (created > 0) {
+            visitsTodayUI.showSuccess(`Отправлено ${created} посещений`);
+        }
+        const rejected = Object.values(results || {})
+            .filter(result => result.status === 'rejected').length;
+        if (rejected > 0) {
+            visitsTodayUI.showError(`Не приняты отметки за прошедшие дни (${rejected} тренировок)`);
+        }
+        this.updateOutboxStatus();
+    },
+
+    // Поток отметок за сегодня (SSE): snapshot при подключении, затем marked.
+    // После resync сервер закрывает поток, EventSource переподключается
+    // и получает новый snapshot
+    subscribeEvents(params, onMarked) {
+        this.closeEvents();
+        if (!window.EventSource) return;
+
+        const query = new URLSearchParams(params).toString();
+        const events = new EventSource(`/visits-today/events?${query}`);
+        events.addEventListener('snapshot', (event) => {
+            const data = JSON.parse(event.data);
+            Object.entries(data.schedules || {}).forEach(([scheduleId, students]) => {
+                onMarked(Number(scheduleId), students, true);
+            });
+        });
+        events.addEventListener('marked', (event) => {
+            const data = JSON.parse(event.data);
+            onMarked(data.schedule_id, data.students, false);
+        });
+        this.state.events = events;
+    },
+
+    closeEvents() {
+        if (this.state.events) {
+            this.state.events.close();
+            this.state.events = null;
+        }
+    },
+
+    // Тренировки зала: счетчик отмеченных на кнопках
+    subscribePlace(placeId) {
+        this.state.placeMarked.clear();
+        this.subscribeEvents({ place_id: placeId }, (scheduleId, students) => {
+            const marked = this.state.placeMarked.get(scheduleId) || new Set();
+            students.forEach(id => marked.add(id));
+            this.state.placeMarked.set(scheduleId, marked);
+
+            const button = this.state.trainingButtons.get(scheduleId);
+            if (button) {
+                visitsTodayUI.setTrainingMarkedCount(button, marked.size);
+            }
+        });
+    },
+
+    // Выбранная тренировка: отметки других тренеров и бота сразу в списке
+    subscribeTraining(scheduleId) {
+        this.state.markedStudents.clear();
+        this.subscribeEvents({ schedule_id: scheduleId }, (eventScheduleId, students) => {
+            if (eventScheduleId !== this.state.scheduleId) return;
+            students.forEach(id => {
+                this.state.markedStudents.add(id);
+                this.state.selectedStudents.add(id);
+            });
+            // До загрузки списка отметки учтет loadStudents
+            if (this.state.students.length) {
+                this.renderStudents();
+            }
+        });
+    },
+
+    async updateOutboxStatus() {
+        try {
+            const pending = await visitsTodayOutbox.pending();
+            visitsTodayUI.updateOutboxStatus(pending.length, navigator.onLine);
+        } catch (error) {
+            console.error('Ошибка чтения очереди:', error);
+        }
     },
 
 
@@ -62,9 +177,9 @@ const visitsToday = {
 
 
     handleWindowResize() {
-    // Перерисовываем список студентов если он есть
+    // Перерисовываем список студентов если он есть (без повторной загрузки)
     if (this.state.scheduleId) {
-        this.loadStudents(this.state.scheduleId);
+        this.renderStudents();
     }
 },
 
@@ -110,6 +225,7 @@ const visitsToday = {
         }
 
         visitsTodayUI.showStep(2);
+        this.subscribePlace(place.id);
         this.loadTrainings(place.id);
     },
 
@@ -132,10 +248,17 @@ const visitsToday = {
                 return;
             }
 
+            this.state.trainingButtons.clear();
             trainings.forEach(training => {
                 const button = visitsTodayUI.createTrainingButton(training);
                 button.onclick = () => this.selectTraining(training);
                 trainingsList.appendChild(button);
+                this.state.trainingButtons.set(training.id, button);
+
+                const marked = this.state.placeMarked.get(training.id);
+                if (marked) {
+                    visitsTodayUI.setTrainingMarkedCount(button, marked.size);
+                }
             });
 
         } catch (error) {
@@ -157,6 +280,7 @@ const visitsToday = {
         if (trainingTime) trainingTime.textContent = `${training.time_start} - ${training.time_end}`;
 
         visitsTodayUI.showStep(3);
+        this.subscribeTraining(training.id);
         this.loadStudents(training.id);
     },
 
@@ -166,34 +290,18 @@ const visitsToday = {
             visitsTodayUI.showLoading('students-list', 'Загружаем студентов...');
             const students = await visitsTodayApi.loadStudents(scheduleId);
 
-            const studentsList = document.getElementById('students-list');
-            if (!studentsList) {
-                console.error('Элемент students-list не найден');
-                return;
-            }
-
-            studentsList.innerHTML = '';
-
-            if (students.length === 0) {
-                visitsTodayUI.showEmptyList('students-list', 'На этой тренировке нет записанных студентов', 'user-slash');
-                return;
-            }
+            // Отметки, которые еще ждут отправки в очереди, тоже показываем выбранными
+            const pending = await visitsTodayOutbox.pendingStudents(scheduleId).catch(() => new Set());
 
+            this.state.students = students;
             this.state.selectedStudents.clear();
-
             students.forEach(student => {
-                const isSelected = student.is_visited;
-                const item = visitsTodayUI.createStudentItem(student, isSelected);
-
-                if (isSelected) {
+                if (student.is_visited || pending.has(student.id) || this.state.markedStudents.has(student.id)) {
                     this.state.selectedStudents.add(student.id);
                 }
-
-                item.onclick = () => this.toggleStudent(student, item);
-                studentsList.appendChild(item);
             });
 
-            this.updateSelectedCount();
+            this.renderStudents();
             this.renderExtraStudents();
 
         } catch (error) {
@@ -202,6 +310,30 @@ const visitsToday = {
         }
     },
 
+    // Отрисовка загруженного списка студентов
+    renderStudents() {
+        const studentsList = document.getElementById('students-list');
+        if (!studentsList) {
+            console.error('Элемент students-list не найден');
+            return;
+        }
+
+        studentsList.innerHTML = '';
+
+        if (this.state.students.length === 0) {
+            visitsTodayUI.showEmptyList('students-list', 'На этой тренировке нет записанных студентов', 'user-slash');
+            return;
+        }
+
+        this.state.students.forEach(student => {
+            const item = visitsTodayUI.createStudentItem(student, this.state.selectedStudents.has(student.id));
+            item.onclick = () => this.toggleStudent(student, item);
+            studentsList.appendChild(item);
+        });
+
+        this.updateSelectedCount();
+    },
+
     // Переключение студента
     toggleStudent(student, item) {
         const checkbox = item.querySelector('.student-checkbox');
@@ -337,7 +469,7 @@ const visitsToday = {
         });
     },
 
-    // Сохранение посещений
+    // Сохранение посещений: сначала в очередь на устройстве, затем отправка
     async saveAttendance() {
         if (this.state.selectedStudents.size === 0 && this.state.extraStudents.size === 0) {
             visitsTodayUI.showError('Выберите хотя бы одного ученика');
@@ -345,27 +477,27 @@ const visitsToday = {
         }
 
         try {
-            const data = {
-                schedule_id: this.state.scheduleId,
-                student_ids: Array.from(this.state.selectedStudents),
-                extra_students: Array.from(this.state.extraStudents.values()),
-                trainer_id: 1 // TODO: Получить из сессии
-            };
-
-            const result = await visitsTodayApi.saveAttendance(data);
-
-            if (result.status === 'success') {
-                visitsTodayUI.showSuccess(`Сохранено ${result.saved_count} посещений`);
-
-                // Обновляем список студентов
-                await this.loadStudents(this.state.scheduleId);
+            const studentIds = [
+                ...this.state.selectedStudents,
+                ...this.state.extraStudents.keys()
+            ];
+            const entry = await visitsTodayOutbox.enqueue(this.state.scheduleId, studentIds);
+
+            // Отмеченные дополнительные ученики остаются выбранными в списке
+            this.state.extraStudents.clear();
+            this.renderExtraStudents();
+            this.updateSelectedCount();
 
-                // Очищаем дополнительных студентов
-                this.state.extraStudents.clear();
-                this.renderExtraStudents();
+            const results = navigator.onLine ? await visitsTodayOutbox.flushWithRetry() : null;
+            const result = results && results[entry.key];
 
+            if (!result) {
+                visitsTodayOutbox.requestBackgroundSync();
+                visitsTodayUI.showWarning('Нет связи: отметки сохранены на устройстве и отправятся автоматически');
+            } else if (result.status === 'success') {
+                visitsTodayUI.showSuccess(`Сохранено ${result.created.length} посещений`);
             } else {
-                visitsTodayUI.showError(result.message || 'Ошибка сохранения');
+                visitsTodayUI.showError('Тренировка не найдена');
             }
 
         } catch (error) {
@@ -400,6 +532,7 @@ const visitsToday = {
         this.state.extraStudents.clear();
         this.state.currentStep = 1;
 
+        this.closeEvents();
         visitsTodayUI.showStep(1);
         this.loadPlaces();
     },
@@ -409,9 +542,14 @@ const visitsToday = {
         this.state.selectedTraining = null;
         this.state.selectedStudents.clear();
         this.state.extraStudents.clear();
+        this.state.scheduleId = null;
+        this.state.students = [];
         this.state.currentStep = 2;
 
         visitsTodayUI.showStep(2);
         this.renderExtraStudents();
+        if (this.state.selectedPlace) {
+            this.subscribePlace(this.state.selectedPlace.id);
+        }
     }
 };
\ No newline at end of file
@@ -0,0 +1,206 @@
+// visits_today_outbox.js - офлайн-очередь отметок посещений (IndexedDB)
+// Подключается страницей и service worker (importScripts), поэтому не использует DOM.
+// Каждое сохранение - пакет с ключом идемпотентности. Пакеты всех тренировок
+// отправляются одним запросом на /visits-today/sync и удаляются из очереди
+// только после ответа сервера; повтор того же пакета сервер не записывает дважды.
+const visitsTodayOutbox = (() => {
+    const DB_NAME = 'visits_today';
+    const STORE = 'outbox';
+    const SYNC_URL = '/visits-today/sync';
+    const SYNC_TAG = 'visits-today-outbox';
+    const MAX_BATCHES = 50;  // как MAX_SYNC_BATCHES на сервере
+    const MAX_RETRY_DELAY = 60000;
+
+    let dbPromise = null;
+    let flushing = null;
+    let nextFlush = null;
+    let retryTimer = null;
+    let retryDelay = 1000;
+    const listeners = [];
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = () => {
+                    request.result.createObjectStore(STORE, { keyPath: 'key' });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => {
+                    dbPromise = null;
+                    reject(request.error);
+                };
+            });
+        }
+        return dbPromise;
+    }
+
+    async function withStore(mode, action) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, mode);
+            const request = action(tx.objectStore(STORE));
+            tx.oncomplete = () => resolve(request ? request.result : undefined);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function newKey() {
+        if (self.crypto && self.crypto.randomUUID) {
+            return self.crypto.randomUUID();
+        }
+        return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    // Локальная дата устройства (YYYY-MM-DD), а не UTC
+    function today() {
+        const now = new Date();
+        const pad = (value) => String(value).padStart(2, '0');
+        return `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())}`;
+    }
+
+    function notify(event, payload) {
+        listeners.forEach(listener => {
+            try {
+                listener(event, payload);
+            } catch (error) {
+                console.error('Ошибка обработчика очереди:', error);
+            }
+        });
+    }
+
+    const outbox = {
+        SYNC_TAG,
+
+        // Подписка на события очереди: 'queued', 'synced', 'failed'
+        onChange(listener) {
+            listeners.push(listener);
+        },
+
+        // Поставить отметки тренировки в очередь
+        async enqueue(scheduleId, studentIds) {
+            const entry = {
+                key: newKey(),
+                schedule_id: scheduleId,
+                day: today(),
+                student_ids: Array.from(studentIds),
+                created_at: Date.now()
+            };
+            await withStore('readwrite', store => store.put(entry));
+            notify('queued', entry);
+            return entry;
+        },
+
+        async pending() {
+            return (await withStore('readonly', store => store.getAll())) || [];
+        },
+
+        // Ученики тренировки, отмеченные на устройстве, но еще не отправленные
+        async pendingStudents(scheduleId, day = today()) {
+            const students = new Set();
+            (await this.pending()).forEach(entry => {
+                if (entry.schedule_id === scheduleId && entry.day === day) {
+                    entry.student_ids.forEach(id => students.add(id));
+                }
+            });
+            return students;
+        },
+
+        async remove(keys) {
+            if (!keys.length) return;
+            await withStore('readwrite', store => {
+                keys.forEach(key => store.delete(key));
+                return null;
+            });
+        },
+
+        // Отправить очередь. Отправки идут по одной: вызов во время отправки
+        // ждет ее окончания и отправляет то, что успело добавиться
+        flush() {
+            if (!nextFlush) {
+                nextFlush = (flushing || Promise.resolve()).catch(() => null).then(() => {
+                    nextFlush = null;
+                    flushing = this._send().finally(() => {
+                        flushing = null;
+                    });
+                    return flushing;
+                });
+            }
+            return nextFlush;
+        },
+
+        async _send() {
+            const entries = await this.pending();
+            const results = {};
+
+            for (let i = 0; i < entries.length; i += MAX_BATCHES) {
+                const batches = entries.slice(i, i + MAX_BATCHES).map(entry => ({
+                    key: entry.key,
+                    schedule_id: entry.schedule_id,
+                    day: entry.day,
+                    student_ids: entry.student_ids
+                }));
+
+                const response = await fetch(SYNC_URL, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    credentials: 'same-origin',
+                    body: JSON.stringify({ batches })
+                });
+                if (!response.ok) throw new Error(`Ошибка синхронизации: ${response.status}`);
+
+                const data = await response.json();
+                await this.remove(Object.keys(data.results || {}));
+                Object.assign(results, data.results);
+            }
+
+            if (entries.length) {
+                notify('synced', results);
+            }
+            return results;
+        },
+
+        // Отправка с повтором: экспоненциальная пауза до минуты
+        async flushWithRetry() {
+            clearTimeout(retryTimer);
+            try {
+                const results = await this.flush();
+                retryDelay = 1000;
+                return results;
+            } catch (error) {
+                notify('failed', error);
+                if (typeof navigator === 'undefined' || navigator.onLine !== false) {
+                    retryTimer = setTimeout(() => this.flushWithRetry(), retryDelay);
+                    retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY);
+                }
+                return null;
+            }
+        },
+
+        // Страница: отправка при появлении сети и через Background Sync, если он есть
+        startAutoSync() {
+            self.addEventListener('online', () => {
+                retryDelay = 1000;
+                this.flushWithRetry();
+            });
+            this.flushWithRetry();
+        },
+
+        async requestBackgroundSync() {
+            try {
+                if (!('serviceWorker' in navigator)) return;
+                const registration = await navigator.serviceWorker.ready;
+                if (registration.sync) {
+                    await registration.sync.register(SYNC_TAG);
+                }
+            } catch (error) {
+                console.warn('Background Sync недоступен:', error);
+            }
+        }
+    };
+
+    return outbox;
+})();
+
+self.visitsTodayOutbox = visitsTodayOutbox;
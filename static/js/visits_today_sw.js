@@ -0,0 +1,129 @@
+// visits_today_sw.js - service worker страницы "Посещения сегодня"
+// Отдается как /visits-today/sw.js (область действия /visits-today/).
+// - оболочка страницы (HTML, стили, скрипты) открывается из кэша сразу,
+//   а в фоне обновляется из сети;
+// - списки мест, тренировок и учеников: сначала сеть, без сети - последний ответ;
+// - офлайн-очередь отметок отправляется по Background Sync, даже если страница закрыта.
+importScripts('/static/js/visits_today_outbox.js');
+
+const SHELL_CACHE = 'visits-today-shell-v1';
+const DATA_CACHE = 'visits-today-data-v1';
+const NETWORK_TIMEOUT = 3000;
+
+const SHELL_URLS = [
+    '/visits-today/',
+    '/static/css/visits_today.css',
+    '/static/css/competitions.css',
+    '/static/js/auth.js',
+    '/static/js/visits_today_api.js',
+    '/static/js/visits_today_ui.js',
+    '/static/js/visits_today_main.js',
+    '/static/js/visits_today_outbox.js',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+    'https://code.jquery.com/jquery-3.6.4.min.js'
+];
+
+// GET-запросы данных страницы
+const DATA_PATHS = [
+    '/visits-today/get-places',
+    '/visits-today/get-trainings/',
+    '/visits-today/get-students/',
+    '/visits-today/get-attendance-status/'
+];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE).then(cache => Promise.all(
+            // Один недоступный файл не должен ломать установку
+            SHELL_URLS.map(url => cache.add(new Request(url, { mode: 'cors', credentials: 'same-origin' }))
+                .catch(error => console.warn('Не удалось закэшировать', url, error)))
+        )).then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys().then(keys => Promise.all(
+            keys.filter(key => key.startsWith('visits-today-') && key !== SHELL_CACHE && key !== DATA_CACHE)
+                .map(key => caches.delete(key))
+        )).then(() => self.clients.claim())
+    );
+});
+
+// Кэшируем только обычные успешные ответы (не редирект на страницу входа)
+function cacheable(response) {
+    return response && response.ok && !response.redirected;
+}
+
+// Оболочка: ответ из кэша сразу, обновление в фоне
+async function staleWhileRevalidate(event, cacheKey) {
+    const cache = await caches.open(SHELL_CACHE);
+    const cached = await cache.match(cacheKey);
+    const update = fetch(event.request).then(response => {
+        if (cacheable(response)) {
+            cache.put(cacheKey, response.clone());
+        }
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(update.catch(() => null));
+        return cached;
+    }
+    return update;
+}
+
+// Данные: сеть с таймаутом, без сети - последний сохраненный ответ
+async function networkFirst(event) {
+    const cache = await caches.open(DATA_CACHE);
+    const network = fetch(event.request).then(response => {
+        if (cacheable(response)) {
+            cache.put(event.request, response.clone());
+        }
+        return response;
+    });
+
+    const timeout = new Promise(resolve => setTimeout(resolve, NETWORK_TIMEOUT, null));
+    try {
+        const response = await Promise.race([network, timeout]);
+        if (response) return response;
+    } catch (error) {
+        // Сети нет - ниже отдаем кэш
+    }
+
+    const cached = await cache.match(event.request);
+    if (cached) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+    }
+    return network;
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    const sameOrigin = url.origin === self.location.origin;
+
+    if (request.mode === 'navigate' && sameOrigin && url.pathname === '/visits-today/') {
+        event.respondWith(staleWhileRevalidate(event, '/visits-today/'));
+    } else if (sameOrigin && DATA_PATHS.some(path => url.pathname.startsWith(path))) {
+        event.respondWith(networkFirst(event));
+    } else if (SHELL_URLS.includes(sameOrigin ? url.pathname : request.url)) {
+        event.respondWith(staleWhileRevalidate(event, sameOrigin ? url.pathname : request.url));
+    }
+});
+
+async function flushOutbox() {
+    const results = await visitsTodayOutbox.flush();
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage({ type: 'visits-outbox-synced', results }));
+}
+
+self.addEventListener('sync', event => {
+    if (event.tag === visitsTodayOutbox.SYNC_TAG) {
+        event.waitUntil(flushOutbox());
+    }
+});
@@ -87,6 +87,17 @@ const visitsTodayUI = {
         return button;
     },
 
+    // Сколько учеников уже отмечено на тренировке (поток отметок)
+    setTrainingMarkedCount(button, count) {
+        let badge = button.querySelector('.marked-count');
+        if (!badge) {
+            badge = document.createElement('span');
+            badge.className = 'badge bg-success ms-auto marked-count';
+            button.appendChild(badge);
+        }
+        badge.innerHTML = `<i class="fas fa-check me-1"></i>${count}`;
+    },
+
 
     createStudentItem(student, isSelected = false, isNarrowScreen = false) {
         const item = document.createElement('div');
@@ -211,6 +222,24 @@ const visitsTodayUI = {
         }
     },
 
+    // Состояние офлайн-очереди под заголовком страницы
+    updateOutboxStatus(pendingCount, online) {
+        const status = document.getElementById('outbox-status');
+        if (!status) return;
+
+        if (pendingCount > 0) {
+            status.innerHTML = online
+                ? `<i class="fas fa-sync fa-spin me-1"></i>Отправляем отметки: ${pendingCount}`
+                : `<i class="fas fa-wifi me-1"></i>Нет сети, ждут отправки: ${pendingCount}`;
+            status.classList.remove('d-none');
+        } else if (!online) {
+            status.innerHTML = '<i class="fas fa-wifi me-1"></i>Нет сети, отметки сохранятся на устройстве';
+            status.classList.remove('d-none');
+        } else {
+            status.classList.add('d-none');
+        }
+    },
+
     showLoading(containerId, message = 'Загрузка...') {
         const container = document.getElementById(containerId);
         if (container) {
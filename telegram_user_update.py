@@ -1,29 +1,23 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
-from config import  settings
+from database.engines import engines
 from database.models import Telegram_user
 
 
-def update_telegram_user_orm(user_data, connection_string):
+def update_telegram_user_orm(user_data):
     """
     Обновляет запись в таблице telegram_user используя SQLAlchemy ORM
 
     Args:
         user_data (dict): Словарь с данными для обновления
                          Должен содержать 'telegram_id' для идентификации
-        connection_string (str): Строка подключения к БД
 
     Returns:
         bool: True если обновление прошло успешно, False в случае ошибки
     """
+    # Сессия из общего реестра подключений
+    session = engines.session_factory()
     try:
-        # Создаем подключение
-        engine = create_engine(connection_string)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-
         # Получаем telegram_id
         telegram_id = user_data.get('telegram_id')
         if not telegram_id:
@@ -75,4 +69,4 @@ data = {'telegram_id': '7882341717',
         }
 
 
-update_telegram_user_orm(data, settings.db.db_url)
\ No newline at end of file
+update_telegram_user_orm(data)
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Бенчмарк ночного списания (regulatory_tasks/daily_attendance.py).
+
+Генерирует синтетических учеников с тарифами, расписаниями и посещениями
+за неделю, прогоняет ночной запуск AttendanceProcessor на хранилище в памяти
+и печатает время и число запросов к хранилищу:
+
+    python -m utils.benchmark_attendance
+    python -m utils.benchmark_attendance --sizes 1000 10000 100000 --date 2025-11-29
+    python -m utils.benchmark_attendance --days 7 --save bench.json
+
+Флаг --postgres выполняет тот же запуск без записи (--dry-run) на настоящей
+БД из config.ini: видно время и число запросов на реальных данных.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.engines import engines, init_pool
+from logger_config import logger
+from regulatory_tasks.attendance_storage import InMemoryAttendanceStorage
+from regulatory_tasks.daily_attendance import AttendanceProcessor
+from regulatory_tasks.day_snapshot import WEEKDAYS_RU
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# id тарифа -> занятий в абонементе (None - без абонемента)
+PRICES = {1: 8, 2: 12, 3: 12, 4: 16, 5: None, 6: 4}
+# Тренировки с понедельника по субботу
+TRAINING_DAYS = WEEKDAYS_RU[:6]
+
+
+def generate(size: int, day: date, days: int, seed: int) -> Dict[str, Any]:
+    """Ученики, расписания и посещения с начала недели первого дня по последний день"""
+    rnd = random.Random(seed)
+    students, schedule_days = {}, {}
+    for student_id in range(1, size + 1):
+        price = rnd.choice(list(PRICES))
+        students[student_id] = {
+            'name': f"Ученик {student_id:06d}",
+            'classes_remaining': rnd.randint(-2, 16),
+            'price': price,
+            'classes_in_price': PRICES[price],
+        }
+        schedule_days[student_id] = rnd.sample(TRAINING_DAYS, rnd.randint(1, 3))
+
+    first = day - timedelta(days=day.weekday())
+    last = day + timedelta(days=days - 1)
+    visits_by_day: Dict[date, Dict[int, int]] = {}
+    current = first
+    while current <= last:
+        weekday_ru = WEEKDAYS_RU[current.weekday()]
+        visits = {}
+        for student_id, days_ru in schedule_days.items():
+            if weekday_ru in days_ru and rnd.random() < 0.85:
+                visits[student_id] = 2 if current.weekday() == 5 and rnd.random() < 0.1 else 1
+            elif rnd.random() < 0.01:
+                visits[student_id] = 1  # пришел не по расписанию
+        visits_by_day[current] = visits
+        current += timedelta(days=1)
+
+    return {'students': students, 'schedule_days': schedule_days, 'visits_by_day': visits_by_day}
+
+
+async def run_nightly(processor: AttendanceProcessor, day: date, days: int, dry_run: bool) -> Dict[str, Any]:
+    """Один ночной запуск (или догоняющий за days дней): время, запросы, результат"""
+    started = time.perf_counter()
+    if days > 1:
+        result = await processor.catch_up(day, day + timedelta(days=days - 1), dry_run=dry_run)
+    else:
+        result = await processor.subtract_classes_and_update_payment_dates(day, dry_run=dry_run)
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": round(elapsed, 4),
+        "queries": processor.storage.queries,
+        "success": result["success"],
+        "updated": result["updated"],
+        "payment_dates_updated": result["payment_dates_updated"],
+    }
+
+
+async def run_in_memory(sizes: List[int], day: date, days: int, seed: int) -> Dict[str, Any]:
+    results = {}
+    for size in sizes:
+        started = time.perf_counter()
+        data = generate(size, day, days, seed)
+        generated = time.perf_counter() - started
+
+        storage = InMemoryAttendanceStorage(AttendanceProcessor.SPECIAL_TARIFFS, **data)
+        result = await run_nightly(AttendanceProcessor(storage), day, days, dry_run=False)
+        result["generate_seconds"] = round(generated, 4)
+        results[str(size)] = result
+    return results
+
+
+async def run_postgres(day: date, days: int) -> Dict[str, Any]:
+    await init_pool()
+    try:
+        return {"postgres": await run_nightly(AttendanceProcessor(), day, days, dry_run=True)}
+    finally:
+        await engines.dispose()
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"\n{'учеников':>10} {'время, с':>10} {'запросов':>9} {'списано':>9} {'дат оплаты':>11}")
+    for name, info in results.items():
+        status = "" if info["success"] else "  ошибка"
+        print(f"{name:>10} {info['seconds']:>10.3f} {info['queries']:>9} {info['updated']:>9} "
+              f"{info['payment_dates_updated']:>11}{status}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк ночного списания занятий')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Количество синтетических учеников (по умолчанию 1000 10000 100000)')
+    parser.add_argument('--date', type=str, help='День запуска YYYY-MM-DD (по умолчанию сегодня)')
+    parser.add_argument('--days', type=int, default=1, help='Дней в догоняющем режиме (по умолчанию 1)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed генератора данных')
+    parser.add_argument('--postgres', action='store_true', help='Запуск без записи на БД из config.ini')
+    parser.add_argument('--verbose', action='store_true', help='Не скрывать логи AttendanceProcessor')
+    parser.add_argument('--save', type=str, help='Сохранить результат в JSON-файл')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.disable("regulatory_tasks")
+
+    day = date.fromisoformat(args.date) if args.date else date.today()
+    if args.postgres:
+        results = await run_postgres(day, args.days)
+    else:
+        results = await run_in_memory(args.sizes, day, args.days, args.seed)
+
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результат сохранен в {args.save}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+"""
+EXPLAIN для самых частых запросов к горячим таблицам.
+
+Позволяет измерить эффект миграции индексов (alembic/versions/0001_hot_table_indexes.py):
+
+    python -m utils.explain_hot_queries --save before.json
+    alembic upgrade head
+    python -m utils.explain_hot_queries --save after.json --compare before.json
+
+По умолчанию выполняется EXPLAIN (ANALYZE, BUFFERS) - запросы только читают данные.
+Флаг --no-analyze печатает план без выполнения запроса.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.engines import acquire, engines
+from database.models import schema
+from logger_config import logger
+
+# (название, запрос, имена параметров из sample_params)
+HOT_QUERIES = [
+    (
+        "visit: дубликат отметки (user_router)",
+        f"""SELECT 1 FROM {schema}.visit
+        WHERE student = $1 AND shedule = $2 AND data >= $3::date AND data < $3::date + 1 LIMIT 1""",
+        ("student_id", "schedule_id", "day"),
+    ),
+    (
+        "visit: посещения ученика за период (daily_attendance)",
+        f"""SELECT COUNT(*) FROM {schema}.visit v
+        WHERE v.student = $1 AND v.data >= $2::date AND v.data < $3::date + 1""",
+        ("student_id", "week_start", "day"),
+    ),
+    (
+        "visit: отметки тренировки за день",
+        f"""SELECT v.student FROM {schema}.visit v
+        WHERE v.shedule = $1 AND v.data >= $2::date AND v.data < $2::date + 1""",
+        ("schedule_id", "day"),
+    ),
+    (
+        "student_schedule: ученики тренировки",
+        f"""SELECT st.id, st.name
+        FROM {schema}.student_schedule ss
+        JOIN {schema}.student st ON ss.student = st.id
+        WHERE ss.schedule = $1 AND st.active = true""",
+        ("schedule_id",),
+    ),
+    (
+        "student_schedule: тренировок ученика в неделю",
+        f"""SELECT COUNT(DISTINCT ss.schedule)
+        FROM {schema}.student_schedule ss
+        JOIN {schema}.schedule sched ON ss.schedule = sched.id
+        WHERE ss.student = $1""",
+        ("student_id",),
+    ),
+    (
+        "students_parents: дети пользователя",
+        f"""SELECT s.id, s.name
+        FROM {schema}.students_parents sp
+        JOIN {schema}.student s ON s.id = sp.student
+        WHERE sp.parents = $1""",
+        ("parent_id",),
+    ),
+    (
+        "medcertificat_received: справки ученика",
+        f"""SELECT mr.id, mr.date_end
+        FROM {schema}.medcertificat_received mr
+        WHERE mr.student_id = $1
+        ORDER BY mr.date_end DESC""",
+        ("student_id",),
+    ),
+    (
+        "medcertificat_received: действующие справки",
+        f"""SELECT mr.id
+        FROM {schema}.medcertificat_received mr
+        WHERE mr.student_id = $1 AND mr.active = true AND mr.date_end >= $2""",
+        ("student_id", "day"),
+    ),
+    (
+        "payment: последняя оплата ученика",
+        f"""SELECT payment_date FROM {schema}.payment
+        WHERE student_id = $1
+        ORDER BY payment_date DESC LIMIT 1""",
+        ("student_id",),
+    ),
+    (
+        "lesson_write_offs: списания ученика за период",
+        f"""SELECT COALESCE(SUM(quantity), 0) FROM {schema}.lesson_write_offs
+        WHERE student_id = $1 AND data >= $2::date AND data < $3::date + 1""",
+        ("student_id", "week_start", "day"),
+    ),
+]
+
+
+async def sample_params(conn) -> Dict[str, Any]:
+    """Берет реальные идентификаторы из БД, чтобы планы были показательными"""
+    row = await conn.fetchrow(
+        f"""SELECT v.student, v.shedule
+        FROM {schema}.visit v
+        WHERE v.student IS NOT NULL AND v.shedule IS NOT NULL
+        ORDER BY v.id DESC LIMIT 1"""
+    )
+    parent_id = await conn.fetchval(f"SELECT parents FROM {schema}.students_parents ORDER BY id DESC LIMIT 1")
+    today = date.today()
+    return {
+        "student_id": row["student"] if row else 0,
+        "schedule_id": row["shedule"] if row else 0,
+        "parent_id": parent_id or 0,
+        "day": today,
+        "week_start": today - timedelta(days=today.weekday()),
+    }
+
+
+def _walk_nodes(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk_nodes(child)
+
+
+def summarize(explain: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Краткая сводка плана: стоимость, время и типы сканирования"""
+    root = explain[0]
+    plan = root["Plan"]
+    scans = [
+        f"{node['Node Type']}({node.get('Index Name') or node.get('Relation Name')})"
+        for node in _walk_nodes(plan)
+        if "Scan" in node["Node Type"]
+    ]
+    return {
+        "total_cost": plan.get("Total Cost"),
+        "execution_ms": root.get("Execution Time"),
+        "shared_hit": plan.get("Shared Hit Blocks"),
+        "shared_read": plan.get("Shared Read Blocks"),
+        "scans": scans,
+    }
+
+
+async def run(analyze: bool) -> Dict[str, Any]:
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    results = {}
+
+    async with acquire() as conn:
+        params = await sample_params(conn)
+        logger.info(f"🔎 Параметры: {params}")
+
+        for name, query, param_names in HOT_QUERIES:
+            args = [params[p] for p in param_names]
+            try:
+                raw = await conn.fetchval(f"EXPLAIN ({options}) {query}", *args)
+                explain = json.loads(raw) if isinstance(raw, str) else raw
+                results[name] = summarize(explain)
+            except Exception as e:
+                logger.error(f"❌ {name}: {e}")
+                results[name] = {"error": str(e)}
+
+    return results
+
+
+def print_report(results: Dict[str, Any], before: Optional[Dict[str, Any]] = None):
+    for name, info in results.items():
+        print(f"\n▶ {name}")
+        if "error" in info:
+            print(f"   ошибка: {info['error']}")
+            continue
+
+        print(f"   сканирование: {', '.join(info['scans']) or '-'}")
+        line = f"   cost={info['total_cost']}"
+        if info.get("execution_ms") is not None:
+            line += f"  time={info['execution_ms']:.3f} ms  hit={info['shared_hit']}  read={info['shared_read']}"
+        print(line)
+
+        prev = (before or {}).get(name)
+        if prev and "error" not in prev:
+            print(f"   было:  cost={prev['total_cost']}  time={prev.get('execution_ms')} ms  "
+                  f"сканирование: {', '.join(prev['scans']) or '-'}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN для частых запросов к горячим таблицам')
+    parser.add_argument('--no-analyze', action='store_true', help='Только план, без выполнения запросов')
+    parser.add_argument('--save', type=str, help='Сохранить результат в JSON-файл')
+    parser.add_argument('--compare', type=str, help='Сравнить с ранее сохраненным JSON-файлом')
+    args = parser.parse_args()
+
+    try:
+        results = await run(analyze=not args.no_analyze)
+    finally:
+        await engines.dispose()
+
+    before = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            before = json.load(f)
+
+    print_report(results, before)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Результат сохранен в {args.save}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
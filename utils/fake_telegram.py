@@ -0,0 +1,198 @@
+"""
+Локальный «Telegram» для проверки режима webhook без сети.
+
+Сервер отвечает на методы Bot API (/bot<token>/<method>), запоминает
+адрес и секрет из setWebhook и по команде шлет боту обновления на этот
+адрес с заголовком X-Telegram-Bot-Api-Secret-Token - так же, как Telegram.
+
+    # 1. сервер
+    python -m utils.fake_telegram serve --port 8090
+
+    # 2. бот: в config.ini
+    #    [bot_webhook]
+    #    ENABLED = true
+    #    BASE_URL = http://127.0.0.1:8081
+    #    API_SERVER = http://127.0.0.1:8090
+    python aiogram_run.py
+
+    # 3. обновления от имени пользователя 12345
+    python -m utils.fake_telegram send --chat 12345 --text /start
+    python -m utils.fake_telegram send --chat 12345 --callback "student:17" --message 2
+    python -m utils.fake_telegram send --chat 12345 --text /start --repeat 20
+
+Вызовы бота (sendMessage, editMessageReplyMarkup, ...) печатаются и
+доступны по GET /_calls.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession, web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+
+
+class FakeTelegram:
+    """Bot API в памяти: методы бота и отправка обновлений на его webhook"""
+
+    def __init__(self):
+        self.webhook: Optional[Dict[str, Any]] = None
+        self.calls: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    # ==================== Bot API ====================
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        """aiogram шлет form-data, сложные значения - строками JSON"""
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value) if isinstance(value, str) else str(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    def _message(self, chat_id: int, text: Optional[str] = None, message_id: Optional[int] = None,
+                 reply_markup: Optional[dict] = None) -> Dict[str, Any]:
+        message = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+        }
+        if text is not None:
+            message["text"] = text
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        return message
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls.append({"method": method, "params": params})
+        print(f"<- {method} {json.dumps(params, ensure_ascii=False)[:300]}")
+
+        lower = method.lower()
+        if lower == "getme":
+            result: Any = BOT_USER
+        elif lower == "setwebhook":
+            self.webhook = {"url": params.get("url"), "secret_token": params.get("secret_token")}
+            result = True
+        elif lower == "deletewebhook":
+            self.webhook = None
+            result = True
+        elif lower == "getwebhookinfo":
+            result = {"url": (self.webhook or {}).get("url", ""), "has_custom_certificate": False,
+                      "pending_update_count": 0}
+        elif lower in ("sendmessage", "editmessagetext", "editmessagereplymarkup"):
+            result = self._message(params.get("chat_id", 0), params.get("text"),
+                                   params.get("message_id"), params.get("reply_markup"))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    # ==================== Обновления ====================
+
+    def _update(self, chat_id: int, text: Optional[str], callback: Optional[str],
+                message_id: Optional[int]) -> Dict[str, Any]:
+        user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+        update: Dict[str, Any] = {"update_id": next(self._update_ids)}
+        if callback is not None:
+            message = self._message(chat_id, "...", message_id)
+            update["callback_query"] = {
+                "id": str(update["update_id"]),
+                "from": user,
+                "chat_instance": str(chat_id),
+                "message": message,
+                "data": callback,
+            }
+        else:
+            message = self._message(chat_id, text)
+            message["from"] = user
+            if text and text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0,
+                                        "length": len(text.split()[0])}]
+            update["message"] = message
+        return update
+
+    async def handle_send(self, request: web.Request) -> web.Response:
+        """POST /_send {chat, text | callback, message, repeat}: отправить обновления боту"""
+        if not self.webhook or not self.webhook.get("url"):
+            return web.json_response({"ok": False, "error": "Бот еще не вызвал setWebhook"}, status=409)
+
+        body = await request.json()
+        updates = [
+            self._update(int(body["chat"]), body.get("text"), body.get("callback"), body.get("message"))
+            for _ in range(int(body.get("repeat", 1)))
+        ]
+        headers = {SECRET_HEADER: self.webhook.get("secret_token") or ""}
+        started = time.perf_counter()
+        async with ClientSession() as session:
+            statuses = await asyncio.gather(*[
+                self._post(session, self.webhook["url"], update, headers) for update in updates
+            ])
+        return web.json_response({
+            "ok": True,
+            "statuses": statuses,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+
+    @staticmethod
+    async def _post(session: ClientSession, url: str, update: dict, headers: dict) -> int:
+        async with session.post(url, json=update, headers=headers) as response:
+            return response.status
+
+    async def handle_calls(self, request: web.Request) -> web.Response:
+        return web.json_response({"webhook": self.webhook, "calls": self.calls})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/bot{token}/{method}", self.handle_method)
+        app.router.add_post("/_send", self.handle_send)
+        app.router.add_get("/_calls", self.handle_calls)
+        return app
+
+
+async def send(args):
+    body = {"chat": args.chat, "text": args.text, "callback": args.callback,
+            "message": args.message, "repeat": args.repeat}
+    async with ClientSession() as session:
+        async with session.post(f"http://{args.host}:{args.port}/_send", json=body) as response:
+            print(json.dumps(await response.json(), ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный Bot API для проверки webhook')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('serve', help='Запустить сервер Bot API')
+
+    send_parser = commands.add_parser('send', help='Отправить боту обновление')
+    send_parser.add_argument('--chat', type=int, required=True, help='telegram id пользователя')
+    send_parser.add_argument('--text', help='Текст сообщения (например /start)')
+    send_parser.add_argument('--callback', help='callback_data нажатой кнопки')
+    send_parser.add_argument('--message', type=int, help='message_id сообщения с кнопкой')
+    send_parser.add_argument('--repeat', type=int, default=1, help='Сколько одинаковых обновлений отправить разом')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        web.run_app(FakeTelegram().app(), host=args.host, port=args.port)
+    else:
+        if args.text is None and args.callback is None:
+            parser.error('нужен --text или --callback')
+        asyncio.run(send(args))
+
+
+if __name__ == '__main__':
+    main()
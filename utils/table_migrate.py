@@ -1,7 +1,7 @@
-from sqlalchemy import create_engine, MetaData, Table, select
+from sqlalchemy import MetaData, Table, select
 from sqlalchemy.orm import sessionmaker
 
-from config import settings
+from database.engines import engines
 
 
 def copy_table_between_schemas(
@@ -81,8 +81,8 @@ def copy_table_between_schemas(
         session.close()
 
 
-# Создаем подключение
-engine = create_engine(settings.db.db_url)
+# Подключение из общего реестра
+engine = engines.sync_engine
 
 # Копируем таблицу 'students' из схемы 'schema1' в 'schema2'
 copy_table_between_schemas(